@@ -0,0 +1,29 @@
+import os
+
+from dotenv import load_dotenv
+
+# Файл .env читается один раз, при первом импорте конфигурации
+load_dotenv()
+
+
+def env_str(name: str, default: str | None = None) -> str | None:
+    """Возвращает строковую переменную окружения или default."""
+    return os.getenv(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    """Возвращает целочисленную переменную окружения или default."""
+    value = os.getenv(name)
+    return default if value is None or value == "" else int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    """Возвращает дробную переменную окружения или default."""
+    value = os.getenv(name)
+    return default if value is None or value == "" else float(value)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Возвращает логическую переменную окружения: 1/true/yes — истина."""
+    value = os.getenv(name)
+    return default if value is None or value == "" else value.lower() in ("1", "true", "yes")
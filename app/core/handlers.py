@@ -1,25 +1,64 @@
-from datetime import datetime
+import asyncio
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable
+from contextlib import aclosing
+from datetime import date, datetime, timedelta
+from typing import Any
 
 from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message
-
-from app.core.weather_advisor import ai_generate
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import env_float
+from app.core.weather_advisor import (
+    AI_STREAMING,
+    STREAM_EDIT_INTERVAL,
+    ai_generate,
+    ai_generate_stream,
+    encode_forecast,
+)
 from app.data.request import (
-    add_user,
+    add_spot,
     get_all_friends,
     get_friend_by_name,
     get_friend_working_days,
-    get_user_by_id,
-    save_weather_request,
+    get_user_spots,
+    get_working_days_union,
+    release_session,
+)
+from app.data.writer import write_behind
+from app.services.auth import remember_user
+from app.services.schedule import schedule_index
+from app.services.scoring import (
+    describe_best_day,
+    render_no_go,
+    render_rideable,
+    select_rideable,
 )
-from app.services.weather import get_forecast
+from app.services.weather import (
+    DEFAULT_CITY,
+    FORECAST_DAYS,
+    PADDLE_SPOTS,
+    Spot,
+    exclude_days,
+    get_forecast,
+    iter_spot_forecasts,
+    parse_spots,
+)
+from app.tools.metrics import timed
 from app.tools.utils import hash_password
 
 router = Router()
 
+GLOBAL_SPOTS = parse_spots(PADDLE_SPOTS)
+
+FORECAST_STAGE_TIMEOUT = env_float("FORECAST_STAGE_TIMEOUT", 15.0)
+SCHEDULE_STAGE_TIMEOUT = env_float("SCHEDULE_STAGE_TIMEOUT", 5.0)
+AI_STAGE_TIMEOUT = env_float("AI_STAGE_TIMEOUT", 90.0)
 
 ACCESS_PASSWORD = "e5ae93bd8095fbd86c25a110bbf194a5a1a209f1e8eb31bb30c8b0ecbe254d58"
 
@@ -34,16 +73,15 @@ class RegisterState(StatesGroup):
 
 
 @router.message(CommandStart())
-async def start_handler(message: Message, state: FSMContext) -> None:
+async def start_handler(message: Message, state: FSMContext, authorized: bool) -> None:
     """Обработчик команды /start.
 
-    Проверяет, существует ли пользователь в базе данных.
-    Если существует — приветствует. Если нет — запрашивает пароль доступа
+    Проверяет, зарегистрирован ли пользователь (флаг authorized выставляет
+    AuthMiddleware по кэшу авторизованных пользователей).
+    Если да — приветствует. Если нет — запрашивает пароль доступа
     и переводит пользователя в состояние ожидания ввода пароля.
     """
-    user_id = message.from_user.id
-    user = await get_user_by_id(user_id)
-    if user:
+    if authorized:
         await message.answer("Добро пожаловать!")
     else:
         await message.answer("Добро пожаловать! Для продолжения работы введите пароль для доступа.")
@@ -55,13 +93,14 @@ async def password_handler(message: Message, state: FSMContext) -> None:
     """Обработчик ввода пароля при регистрации.
 
     Проверяет хешированный ввод пользователя на соответствие
-    заранее заданному хешу ACCESS_PASSWORD. При успехе — добавляет
-    пользователя в базу данных, отправляет подтверждение и очищает состояние.
+    заранее заданному хешу ACCESS_PASSWORD. При успехе — ставит добавление
+    пользователя в очередь записи, отправляет подтверждение и очищает состояние.
     Иначе — запрашивает ввод пароля повторно.
     """
     user_id = message.from_user.id
     if hash_password(message.text.strip()) == ACCESS_PASSWORD:
-        await add_user(user_id, message.from_user.username or "")
+        await write_behind.put_user(user_id, message.from_user.username or "")
+        remember_user(user_id)
         await message.answer("Авторизация успешна! Теперь у вас полный доступ.")
         await state.clear()
     else:
@@ -69,73 +108,237 @@ async def password_handler(message: Message, state: FSMContext) -> None:
 
 
 @router.message(Command("get"))
-async def get_generate(message: Message, command: CommandObject) -> None:
+async def get_generate(message: Message, command: CommandObject, session: AsyncSession) -> None:
     """Обработчик команды /get.
 
     Получает прогноз погоды для города Червлённая на 5 дней.
     Если передан аргумент (имя друга), проверяет рабочие дни друга
-    в БД и исключает их из прогноза.
-    Передаёт прогноз в систему ИИ-советника, сохраняет запрос и ответ в базу,
-    затем отправляет пользователю результат совета.
+    и исключает их из прогноза. Прогноз и график друга запрашиваются
+    параллельно, у каждого этапа свой таймаут; сбой одного этапа отменяет остальные.
+    Если по правилам оценки ни один день не подходит, ответ формируется без ИИ;
+    иначе в ИИ уходят только подходящие дни.
+    Передаёт прогноз в систему ИИ-советника, отправляет пользователю результат
+    совета и ставит запрос и ответ в очередь отложенной записи в базу.
+    Если прогноз получить не удалось, пользователь получает сообщение об ошибке,
+    а если недоступен советник — список подходящих дней без ИИ.
     """
-    friend_name = command.args
-    weather_forecast = await get_forecast("Червлённая", days=5)
-
-    if isinstance(weather_forecast, list):
-        if friend_name:
-            friend = await get_friend_by_name(friend_name.strip())
-            if friend:
-                # Получаем даты из прогноза для диапазона
-                # Первая дата в прогнозе
-                first_date_str = weather_forecast[0].split("Дата время: ")[1].split(" ")[0]
-                last_date_str = weather_forecast[-1].split("Дата время: ")[1].split(" ")[0]
-                start_date = datetime.strptime(first_date_str, "%Y-%m-%d").date()
-                end_date = datetime.strptime(last_date_str, "%Y-%m-%d").date()
-
-                working_days = await get_friend_working_days(
-                    int(str(friend.id)), start_date, end_date
+    friend_name = (command.args or "").strip()
+    today = datetime.now().date()
+    # Прогноз ещё не получен, поэтому берём диапазон с запасом на разницу часовых поясов
+    start_date = today - timedelta(days=1)
+    end_date = today + timedelta(days=FORECAST_DAYS + 1)
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            forecast_task = tg.create_task(
+                run_stage(
+                    "forecast",
+                    get_forecast(DEFAULT_CITY, days=FORECAST_DAYS),
+                    FORECAST_STAGE_TIMEOUT,
                 )
+            )
+            schedule_task = None
+            if friend_name:
+                schedule_task = tg.create_task(
+                    run_stage(
+                        "schedule",
+                        resolve_friend_working_days(friend_name, start_date, end_date, session),
+                        SCHEDULE_STAGE_TIMEOUT,
+                    )
+                )
+    except ExceptionGroup as e:
+        if e.subgroup(TimeoutError) is None:
+            raise
+        await message.answer("Сервисы не ответили вовремя. Попробуйте позже.")
+        return
 
-                if working_days:
-                    filtered_forecast = []
-                    for forecast_line in weather_forecast:
-                        date_str = forecast_line.split("Дата время: ")[1].split(" ")[0]
-                        forecast_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                        if forecast_date not in working_days:
-                            filtered_forecast.append(forecast_line)
-
-                    if not filtered_forecast:
-                        await message.answer(f"{friend_name} работает все эти дни. Прогноз пуст.")
-                        return
-                    weather_forecast = filtered_forecast
-            else:
-                await message.answer(f"Друг с именем {friend_name} не найден в базе данных.")
-                return
+    weather_forecast = forecast_task.result()
+    if not isinstance(weather_forecast, list):
+        await message.answer(weather_forecast)
+        return
 
-        weather_forecast_str = "\n".join(weather_forecast)
-    else:
-        weather_forecast_str = weather_forecast
+    if schedule_task is not None:
+        working_days = schedule_task.result()
+        if working_days is None:
+            await message.answer(f"Друг с именем {friend_name} не найден в базе данных.")
+            return
 
-    result = await ai_generate(weather_forecast_str)
+        if working_days:
+            weather_forecast = exclude_days(weather_forecast, working_days)
+            if not weather_forecast:
+                await message.answer(f"{friend_name} работает все эти дни. Прогноз пуст.")
+                return
 
-    await save_weather_request(
+    # Дни, не проходящие правила по температуре и ветру, в ИИ не отправляем
+    rideable = select_rideable(weather_forecast)
+    if not rideable:
+        result = render_no_go(weather_forecast)
+        await message.answer(result)
+        await write_behind.put_weather_request(
+            user_id=message.from_user.id,
+            forecast_text=encode_forecast(weather_forecast),
+            ai_response=result,
+        )
+        return
+
+    weather_forecast_str = encode_forecast(rideable)
+    fallback = render_rideable(rideable)
+
+    with timed("get_stage", step="ai"):
+        if AI_STREAMING:
+            result = await answer_streaming(
+                message, ai_generate_stream(weather_forecast_str), fallback, AI_STAGE_TIMEOUT
+            )
+        else:
+            try:
+                async with asyncio.timeout(AI_STAGE_TIMEOUT):
+                    result = await ai_generate(weather_forecast_str) or fallback
+            except TimeoutError:
+                result = fallback
+            await message.answer(result)
+
+    await write_behind.put_weather_request(
         user_id=message.from_user.id, forecast_text=weather_forecast_str, ai_response=result
     )
 
-    await message.answer(result)
+
+async def run_stage(name: str, stage: Awaitable[Any], timeout: float) -> Any:
+    """Выполняет этап обработки команды с ограничением по времени и замером длительности."""
+    async with asyncio.timeout(timeout):
+        with timed("get_stage", step=name):
+            return await stage
+
+
+async def resolve_friend_working_days(
+    friend_name: str, start_date: date, end_date: date, session: AsyncSession
+) -> set[date] | None:
+    """Находит друга по имени и возвращает его рабочие дни в диапазоне.
+
+    Использует индекс графиков, если он загружен, иначе обращается к БД.
+    Возвращает None, если друг не найден. После чтения соединение сессии
+    возвращается в пул, так как дальше /get его не использует.
+    """
+    try:
+        friend = await get_friend_by_name(friend_name, session)
+        if not friend:
+            return None
+
+        friend_id = int(str(friend.id))
+        if schedule_index.loaded:
+            return set(schedule_index.working_days(friend_id, start_date, end_date))
+        return set(await get_friend_working_days(friend_id, start_date, end_date, session))
+    finally:
+        await release_session(session)
+
+
+async def answer_streaming(
+    message: Message,
+    chunks: AsyncGenerator[str],
+    fallback: str = "❌ Не удалось получить рекомендации. Попробуйте позже.",
+    timeout: float | None = None,
+) -> str:
+    """Отправляет потоковый ответ, редактируя сообщение-заглушку по мере генерации.
+
+    Первый непустой фрагмент показывается сразу, а следующие правки — не чаще раза
+    в STREAM_EDIT_INTERVAL секунд, чтобы не упираться в лимиты Telegram; последним
+    шагом выставляется полный текст. Если поток не уложился в timeout секунд,
+    он закрывается, а заглушка заменяется на fallback, как и при пустом ответе.
+    Возвращает показанный текст.
+    """
+    placeholder = await message.answer("⏳ Готовлю рекомендации...")
+    text = ""
+    shown = ""
+    last_edit = 0.0
+
+    async def show(new_text: str) -> None:
+        nonlocal shown, last_edit
+        if not new_text.strip() or new_text == shown:
+            return
+        last_edit = time.monotonic()
+        try:
+            await placeholder.edit_text(new_text)
+            shown = new_text
+        except TelegramBadRequest as e:
+            print(f"Ошибка редактирования сообщения: {e}")
+
+    try:
+        async with aclosing(chunks), asyncio.timeout(timeout):
+            async for chunk in chunks:
+                text += chunk
+                if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                    await show(text)
+    except TimeoutError:
+        text = ""
+
+    if not text.strip():
+        text = fallback
+    await show(text)
+    return text
+
+
+@router.message(Command("spots"))
+async def spots_command(message: Message, session: AsyncSession) -> None:
+    """Обработчик команды /spots.
+
+    Сравнивает общие споты и споты пользователя: прогнозы запрашиваются
+    параллельно, а строка по каждому споту добавляется в ответ по мере готовности.
+    Если спотов нет ни в PADDLE_SPOTS, ни у пользователя, подсказывает /addspot.
+    """
+    user_spots = await get_user_spots(message.from_user.id, session)
+    spots = GLOBAL_SPOTS + [
+        Spot(spot.name, (spot.lat, spot.lon) if spot.lat is not None else spot.name)
+        for spot in user_spots
+    ]
+    await release_session(session)
+    if not spots:
+        await message.answer("Споты не заданы. Добавьте свой: /addspot Название [широта долгота]")
+        return
+
+    async def lines() -> AsyncIterator[str]:
+        async for spot, forecast in iter_spot_forecasts(spots):
+            if isinstance(forecast, list):
+                yield f"{spot.name}: {describe_best_day(forecast)}\n"
+            else:
+                yield f"{spot.name}: {forecast}\n"
+
+    await answer_streaming(message, lines())
+
+
+@router.message(Command("addspot"))
+async def add_spot_command(message: Message, command: CommandObject, session: AsyncSession) -> None:
+    """Обработчик команды /addspot.
+
+    Формат: /addspot Название [широта долгота]. Без координат прогноз для спота
+    ищется по названию.
+    """
+    parts = (command.args or "").split()
+    lat = lon = None
+    if len(parts) >= 3:
+        try:
+            lat, lon = float(parts[-2]), float(parts[-1])
+            parts = parts[:-2]
+        except ValueError:
+            lat = lon = None
+    name = " ".join(parts)
+    if not name:
+        await message.answer("Укажите спот: /addspot Название [широта долгота]")
+        return
+
+    if await add_spot(message.from_user.id, name, lat, lon, session):
+        await message.answer(f"Спот {name} сохранён. Сравнить споты: /spots")
+    else:
+        await message.answer("Не удалось сохранить спот. Попробуйте позже.")
 
 
 @router.message(Command("meet"))
-async def meet_command(message: Message) -> None:
+async def meet_command(message: Message, session: AsyncSession) -> None:
     """Обработчик команды /meet.
 
     Ищет общие выходные дни для всех друзей на ближайшие 10 дней.
     Если у друга нет расписания на этот день, он считается выходным.
     Выводит список общих выходных дней.
     """
-    from datetime import timedelta
-
-    friends = await get_all_friends()
+    friends = await get_all_friends(session)
     if not friends:
         await message.answer("В базе данных нет ни одного друга.")
         return
@@ -143,17 +346,18 @@ async def meet_command(message: Message) -> None:
     today = datetime.now().date()
     end_date = today + timedelta(days=9)
 
-    # Все 10 дат
-    all_dates = [today + timedelta(days=i) for i in range(10)]
+    friend_ids = [int(str(friend.id)) for friend in friends]
 
-    # Множество рабочих дней всех друзей
-    all_working_days = set()
+    if schedule_index.loaded:
+        common_free_dates = schedule_index.common_free_days(today, 10, friend_ids)
+    else:
+        # Все 10 дат
+        all_dates = [today + timedelta(days=i) for i in range(10)]
 
-    for friend in friends:
-        working_days = await get_friend_working_days(int(str(friend.id)), today, end_date)
-        all_working_days.update(working_days)
+        # Множество рабочих дней всех друзей одним запросом
+        all_working_days = set(await get_working_days_union(today, end_date, friend_ids, session))
 
-    common_free_dates = [d for d in all_dates if d not in all_working_days]
+        common_free_dates = [d for d in all_dates if d not in all_working_days]
 
     if not common_free_dates:
         await message.answer("К сожалению, в ближайшие 10 дней общих выходных нет.")
@@ -0,0 +1,169 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.dispatcher.flags import get_flag
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message, TelegramObject, Update
+
+from app.config import env_float, env_int
+from app.data.models import async_session
+from app.data.request import release_session
+from app.services.auth import is_authorized
+from app.tools.cache import TTLCache
+from app.tools.limiter import TokenBucket
+from app.tools.metrics import timed
+
+# Сообщений в секунду на пользователя и запас на короткие всплески
+THROTTLE_RATE = env_float("THROTTLE_RATE", 0.5)
+THROTTLE_BURST = env_int("THROTTLE_BURST", 3)
+THROTTLE_CACHE_SIZE = env_int("THROTTLE_CACHE_SIZE", 10000)
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Middleware, замеряющий полную обработку апдейта с разбивкой по типу события."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        """Вызывает обработчик внутри замера."""
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        with timed("update", event=event_type):
+            return await handler(event, data)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота, замеряющий каждый вызов Telegram Bot API по имени метода."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        """Выполняет запрос к Bot API внутри замера."""
+        with timed("telegram_request", method=method.__api_method__):
+            return await make_request(bot, method)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Middleware, открывающий одну сессию базы данных на Telegram-апдейт.
+
+    Сессия передаётся обработчикам через параметр session. После обработки
+    транзакция фиксируется один раз, а при ошибке обработчика откатывается.
+    Обработчики с долгими сетевыми этапами освобождают соединение раньше через
+    release_session, чтобы не держать его до конца апдейта.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        """Оборачивает обработку апдейта в сессию и транзакцию."""
+        async with async_session() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+            try:
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                print(f"Ошибка фиксации транзакции апдейта: {e}")
+            return result
+
+
+class AuthMiddleware(BaseMiddleware):
+    """Middleware проверки доступа на основе кэша авторизованных пользователей.
+
+    Передаёт обработчикам флаг authorized. Обработчики с флагом auth
+    (например, @router.message(Command("x"), flags={"auth": True})) не вызываются
+    для незарегистрированных пользователей.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        """Проверяет доступ пользователя перед вызовом обработчика.
+
+        При промахе кэша доступ проверяется по БД в сессии апдейта; после проверки
+        соединение возвращается в пул, а не ждёт окончания обработчика. Если доступ
+        проверить не удалось, обработчик не вызывается: иначе зарегистрированного
+        пользователя попросили бы снова ввести пароль.
+        """
+        user = data.get("event_from_user")
+        authorized = False
+        if user is not None:
+            authorized = await is_authorized(user.id, data.get("session"))
+        await release_session(data.get("session"))
+        if authorized is None:
+            if isinstance(event, Message):
+                await event.answer("Не удалось проверить доступ. Попробуйте позже.")
+            return None
+        data["authorized"] = authorized
+        if get_flag(data, "auth") and not authorized:
+            if isinstance(event, Message):
+                await event.answer("Нет доступа. Для авторизации отправьте /start.")
+            return None
+        return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Middleware, ограничивающий частоту сообщений от одного пользователя.
+
+    У каждого пользователя своя корзина токенов (rate сообщений в секунду,
+    до burst подряд). Сообщения сверх лимита не обрабатываются; о превышении
+    пользователь получает одно предупреждение, пока корзина не пополнится.
+    Корзины неактивных пользователей вытесняются из ограниченного кэша.
+    """
+
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: int = THROTTLE_BURST,
+        maxsize: int = THROTTLE_CACHE_SIZE,
+    ) -> None:
+        """Создаёт middleware с заданным лимитом на пользователя."""
+        self.rate = rate
+        self.burst = burst
+        # Корзина полностью пополняется за burst / rate секунд, дольше её хранить незачем
+        self._buckets = TTLCache(ttl=burst / rate, maxsize=maxsize)
+        self._warned = TTLCache(ttl=1 / rate, maxsize=maxsize)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        """Пропускает сообщение, если у пользователя есть токен."""
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        bucket = self._buckets.get(user.id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+        self._buckets.set(user.id, bucket)
+        if bucket.try_take():
+            return await handler(event, data)
+
+        if self._warned.get(user.id) is None and isinstance(event, Message):
+            self._warned.set(user.id, True)
+            await event.answer("Слишком много запросов. Подождите немного и повторите.")
+        return None
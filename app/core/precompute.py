@@ -0,0 +1,96 @@
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+
+from app.config import env_float, env_str
+from app.core.weather_advisor import ai_generate, encode_forecast
+from app.data.request import acquire_job_lease, get_all_friends, get_friend_working_days
+from app.services.schedule import (
+    SCHEDULE_RELOAD_INTERVAL,
+    load_schedule_index,
+    schedule_index,
+)
+from app.services.scheduler import Scheduler
+from app.services.scoring import select_rideable
+from app.services.weather import (
+    DEFAULT_CITY,
+    FORECAST_DAYS,
+    exclude_days,
+    refresh_forecast,
+)
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_INTERVAL = env_float("PRECOMPUTE_INTERVAL", 10800.0)
+PRECOMPUTE_JITTER = env_float("PRECOMPUTE_JITTER", 0.1)
+# Аренда чуть короче минимального интервала, чтобы её владелец успевал продлить её
+# на следующем запуске, а при его остановке задачу подхватила другая реплика
+PRECOMPUTE_LEASE_TTL = PRECOMPUTE_INTERVAL * (1 - PRECOMPUTE_JITTER) * 0.9
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+PRECOMPUTE_SPOTS = [
+    city.strip() for city in env_str("PRECOMPUTE_SPOTS", DEFAULT_CITY).split(",") if city.strip()
+]
+
+
+async def precompute_spot(city: str) -> None:
+    """Обновляет прогноз для города и заранее генерирует советы ИИ.
+
+    Советы готовятся для прогноза без фильтра и для прогноза без рабочих дней
+    каждого друга — те же тексты, что формирует /get, поэтому интерактивный
+    запрос попадает в кэш советов.
+    """
+    forecast = await refresh_forecast(city, days=FORECAST_DAYS)
+    if not isinstance(forecast, list):
+        logger.warning(f"Не удалось обновить прогноз для {city}: {forecast}")
+        return
+
+    candidates = [forecast]
+
+    today = datetime.now().date()
+    start_date = today - timedelta(days=1)
+    end_date = today + timedelta(days=FORECAST_DAYS + 1)
+    for friend in await get_all_friends():
+        friend_id = int(str(friend.id))
+        if schedule_index.loaded:
+            working_days = set(schedule_index.working_days(friend_id, start_date, end_date))
+        else:
+            working_days = set(await get_friend_working_days(friend_id, start_date, end_date))
+        candidates.append(exclude_days(forecast, working_days))
+
+    # Те же преобразования, что в /get: без подходящих дней ИИ не вызывается
+    variants = {
+        encode_forecast(rideable) for slots in candidates if (rideable := select_rideable(slots))
+    }
+
+    for text in variants:
+        await ai_generate(text)
+    logger.info(f"Предрасчёт для {city} завершён: {len(variants)} вариантов совета")
+
+
+def build_scheduler(precompute: bool = True) -> Scheduler:
+    """Создаёт планировщик фоновых задач процесса.
+
+    Перечитывание индекса графиков нужно каждому процессу; задачи предрасчёта
+    прогнозов и советов добавляются, только если precompute. Предрасчёт
+    выполняет одна реплика за интервал: та, что получила аренду задачи в БД.
+    """
+    scheduler = Scheduler()
+    scheduler.add_job(
+        "schedule_index",
+        load_schedule_index,
+        interval=SCHEDULE_RELOAD_INTERVAL,
+        run_immediately=not schedule_index.loaded,
+    )
+    if not precompute:
+        return scheduler
+    for city in PRECOMPUTE_SPOTS:
+        name = f"precompute:{city}"
+        scheduler.add_job(
+            name,
+            lambda city=city: precompute_spot(city),
+            interval=PRECOMPUTE_INTERVAL,
+            jitter=PRECOMPUTE_JITTER,
+            guard=lambda name=name: acquire_job_lease(name, INSTANCE_ID, PRECOMPUTE_LEASE_TTL),
+        )
+    return scheduler
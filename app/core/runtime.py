@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+
+from app.config import env_str
+from app.core.handlers import router
+from app.core.middlewares import (
+    AuthMiddleware,
+    DbSessionMiddleware,
+    TelegramTimingMiddleware,
+    ThrottlingMiddleware,
+    UpdateTimingMiddleware,
+)
+from app.core.precompute import build_scheduler
+from app.data.fsm_storage import create_fsm_storage
+from app.data.models import dispose_engine, init_models, warm_up_pool
+from app.data.writer import write_behind
+from app.services.schedule import load_schedule_index
+from app.services.scheduler import Scheduler
+from app.services.weather import close_weather_client, open_weather_client
+from app.tools.metrics import (
+    METRICS_ENABLED,
+    METRICS_PORT,
+    start_metrics_server,
+    stop_metrics_server,
+)
+
+TG_TOKEN = env_str("TG_TOKEN")
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Замеры этапов запуска процесса для итогового отчёта в лог."""
+
+    def __init__(self, started: float | None = None) -> None:
+        """Начинает отсчёт времени запуска с момента started (по умолчанию — сейчас)."""
+        self.started = time.perf_counter() if started is None else started
+        self.steps: list[tuple[str, float]] = []
+
+    def record(self, name: str, duration: float) -> None:
+        """Добавляет этап, замеренный вне отчёта."""
+        self.steps.append((name, duration))
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        """Замеряет этап запуска."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    async def run(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        """Выполняет асинхронный этап запуска с замером."""
+        with self.step(name):
+            return await awaitable
+
+    def log(self) -> None:
+        """Пишет в лог общее время запуска и длительность каждого этапа."""
+        total = time.perf_counter() - self.started
+        steps = ", ".join(f"{name} {duration * 1000:.0f} мс" for name, duration in self.steps)
+        logger.info(f"Запуск занял {total:.2f} с: {steps}")
+
+
+def create_bot() -> Bot:
+    """Создаёт клиента Telegram Bot API; при включённых метриках замеряет его запросы."""
+    bot = Bot(token=TG_TOKEN)
+    if METRICS_ENABLED:
+        bot.session.middleware(TelegramTimingMiddleware())
+    return bot
+
+
+def create_dispatcher() -> Dispatcher:
+    """Создаёт диспетчер с хранилищем FSM, middleware и обработчиками команд."""
+    dp = Dispatcher(storage=create_fsm_storage())
+    if METRICS_ENABLED:
+        dp.update.outer_middleware(UpdateTimingMiddleware())
+    dp.message.outer_middleware(ThrottlingMiddleware())
+    dp.update.outer_middleware(DbSessionMiddleware())
+    dp.message.middleware(AuthMiddleware())
+    dp.include_router(router)
+    return dp
+
+
+async def start_services(
+    init_schema: bool = True,
+    run_scheduler: bool = True,
+    metrics_port: int = METRICS_PORT,
+    report: StartupReport | None = None,
+) -> Scheduler:
+    """Готовит общие ресурсы процесса к обработке апдейтов.
+
+    Проверяет версию схемы и при необходимости создаёт таблицы (init_schema),
+    затем параллельно прогревает пул соединений БД и загружает индекс графиков
+    работы, открывает HTTP-клиент погоды, запускает очередь отложенной записи,
+    эндпоинт метрик (если METRICS_ENABLED) и планировщик фоновых задач: индекс
+    графиков перечитывается всегда, предрасчёт прогнозов и советов — только
+    если run_scheduler. Длительность этапов пишется в report.
+    """
+    report = report or StartupReport()
+    await report.run("metrics", start_metrics_server(metrics_port))
+    if init_schema:
+        await report.run("schema", init_models())
+    await asyncio.gather(
+        report.run("db_pool", warm_up_pool()),
+        report.run("schedule_index", load_schedule_index()),
+    )
+    await report.run("weather_client", open_weather_client())
+    write_behind.start()
+    scheduler = build_scheduler(precompute=run_scheduler)
+    scheduler.start()
+    report.log()
+    return scheduler
+
+
+async def stop_services(scheduler: Scheduler | None) -> None:
+    """Останавливает планировщик, дописывает очередь, закрывает HTTP-клиент, БД и метрики."""
+    if scheduler is not None:
+        await scheduler.stop()
+    await write_behind.stop()
+    await close_weather_client()
+    await dispose_engine()
+    await stop_metrics_server()
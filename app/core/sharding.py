@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import multiprocessing
+import secrets
+import signal
+from multiprocessing.queues import Queue
+from typing import Any
+
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+from app.config import env_int
+from app.core.runtime import (
+    create_bot,
+    create_dispatcher,
+    start_services,
+    stop_services,
+)
+from app.core.webhook import (
+    WEBHOOK_MAX_CONCURRENCY,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_SHUTDOWN_TIMEOUT,
+    health_handler,
+    register_webhook,
+    serve_until_stopped,
+)
+from app.data.models import dispose_engine, init_models
+from app.tools.metrics import METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = env_int("WEBHOOK_WORKERS", 1)
+SHARD_QUEUE_SIZE = env_int("SHARD_QUEUE_SIZE", 1000)
+
+# Разделы апдейта, в которых aiogram ищет чат и пользователя
+_CHAT_SOURCES = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "business_message",
+    "edited_business_message",
+    "callback_query",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+    "message_reaction",
+)
+
+
+def update_chat_id(update: dict[str, Any]) -> int:
+    """Возвращает id чата апдейта, а если чата нет — id пользователя (или 0)."""
+    for source in _CHAT_SOURCES:
+        event = update.get(source)
+        if not event:
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if event.get("from"):
+            return event["from"]["id"]
+    for event in update.values():
+        if isinstance(event, dict) and event.get("from"):
+            return event["from"]["id"]
+    return 0
+
+
+def shard_of(update: dict[str, Any], workers: int) -> int:
+    """Номер рабочего процесса для апдейта: все апдейты чата попадают в один процесс."""
+    return update_chat_id(update) % workers
+
+
+async def consume_shard(queue: Queue, index: int, run_scheduler: bool) -> None:
+    """Обрабатывает апдейты из очереди шарда до получения None.
+
+    Одновременно обрабатывается не больше WEBHOOK_MAX_CONCURRENCY апдейтов;
+    перед выходом принятые апдейты дорабатываются.
+    """
+    bot = create_bot()
+    dp = create_dispatcher()
+    # У каждого процесса свой эндпоинт метрик: METRICS_PORT + номер шарда
+    scheduler = await start_services(
+        init_schema=False, run_scheduler=run_scheduler, metrics_port=METRICS_PORT + index
+    )
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+    tasks: set[asyncio.Task] = set()
+
+    async def feed(update: dict[str, Any]) -> None:
+        try:
+            result = await dp.feed_raw_update(bot, update)
+            if isinstance(result, TelegramMethod):
+                await dp.silent_call_request(bot, result)
+        except Exception as e:
+            logger.error(f"Ошибка обработки апдейта в шарде {index}: {e}")
+        finally:
+            semaphore.release()
+
+    logger.info(f"Шард {index} запущен")
+    try:
+        while (update := await loop.run_in_executor(None, queue.get)) is not None:
+            await semaphore.acquire()
+            task = asyncio.create_task(feed(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks, timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+    finally:
+        await stop_services(scheduler)
+        await dp.storage.close()
+        await bot.session.close()
+        logger.info(f"Шард {index} остановлен")
+
+
+def worker_main(queue: Queue, index: int) -> None:
+    """Точка входа рабочего процесса. Остановкой управляет главный процесс."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Планировщик предрасчёта нужен только в одном процессе
+    asyncio.run(consume_shard(queue, index, run_scheduler=index == 0))
+
+
+def create_router_app(queues: list[Queue]) -> web.Application:
+    """Собирает приложение, раскладывающее апдейты вебхука по очередям шардов."""
+    closing = False
+
+    async def handle(request: web.Request) -> web.Response:
+        if closing:
+            return web.Response(status=503, text="Shutting down")
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if WEBHOOK_SECRET and not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401, text="Unauthorized")
+        update = await request.json()
+        queue = queues[shard_of(update, len(queues))]
+        # Заполненная очередь задерживает ответ, и Telegram притормаживает отправку
+        await asyncio.get_running_loop().run_in_executor(None, queue.put, update)
+        return web.json_response({})
+
+    async def on_shutdown(app: web.Application) -> None:
+        nonlocal closing
+        closing = True
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    app.router.add_get("/health", health_handler)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run_sharded_webhook(workers: int = WEBHOOK_WORKERS) -> None:
+    """Принимает вебхук в главном процессе и распределяет апдейты по workers процессам.
+
+    Апдейты одного чата всегда попадают в один процесс, поэтому кэш состояний
+    FSM этого процесса остаётся согласованным с базой.
+    Схема БД создаётся один раз до запуска процессов. При остановке процессы
+    получают сигнал завершения через очередь и дорабатывают принятые апдейты.
+    """
+    await init_models()
+    await dispose_engine()
+
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(SHARD_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(queue, index), name=f"shard-{index}", daemon=True)
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    bot = create_bot()
+    try:
+        await register_webhook(bot, create_dispatcher().resolve_used_update_types())
+        await serve_until_stopped(create_router_app(queues))
+    finally:
+        await bot.session.close()
+        loop = asyncio.get_running_loop()
+        for queue in queues:
+            await loop.run_in_executor(None, queue.put, None)
+        for process in processes:
+            await loop.run_in_executor(None, process.join, WEBHOOK_SHUTDOWN_TIMEOUT + 5)
+            if process.is_alive():
+                process.terminate()
@@ -1,64 +1,69 @@
-import os
+import asyncio
+import hashlib
+import json
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing
+from typing import TYPE_CHECKING, Any
 
-from dotenv import load_dotenv
-from openai import APIConnectionError, APIError, AsyncOpenAI, BadRequestError
-from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
-
-from app.tools.utils import clean_text
-
-load_dotenv()
-
-AI_TOKEN_POLZA = os.getenv("AI_TOKEN_POLZA")
-polza = "https://api.polza.ai/api/v1"
-
-client = AsyncOpenAI(
-    api_key=AI_TOKEN_POLZA,
-    base_url=polza,
+from app.config import env_bool, env_float, env_int, env_str
+from app.data.request import get_cached_advice, save_cached_advice
+from app.services.weather import (
+    ForecastSlot,
+    render_days_compact,
+    render_forecast,
+    render_forecast_compact,
+)
+from app.tools.cache import SingleFlight, StreamFlight, TTLCache
+from app.tools.limiter import RateLimiter, RateLimitExceeded, retry_after
+from app.tools.metrics import (
+    METRICS_ENABLED,
+    increment,
+    register_cache,
+    register_gauge,
+    register_stats,
+    timed,
 )
+from app.tools.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy
+from app.tools.utils import clean_text, estimate_tokens
 
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam
 
-async def ai_generate(weather_forecast: str) -> str | None:
-    """Генерирует рекомендации по сёрфингу на основе прогноза погоды с использованием ИИ.
-
-    Формирует промпт с пользовательскими предпочтениями, отправляет запрос в модель ИИ
-    и возвращает очищенный текст с рекомендациями. В случае ошибок — выводит сообщение
-    в консоль и возвращает None.
-    """
-    message = await generate_prompt(weather_forecast)
-    try:
-        completion = await client.chat.completions.create(
-            model="openai/gpt-4o",
-            messages=message,
-            temperature=0.8,
-        )
+AI_TOKEN_POLZA = env_str("AI_TOKEN_POLZA")
+polza = "https://api.polza.ai/api/v1"
 
-        response_text = completion.choices[0].message.content
-        response = clean_text(response_text)
-        return response
+AI_MODEL = "openai/gpt-4o"
+AI_TEMPERATURE = 0.8
 
-    except BadRequestError as e:
-        print(f"Ошибка запроса к API: {e}")
+ADVICE_CACHE_TTL = env_float("ADVICE_CACHE_TTL", 21600.0)
+ADVICE_CACHE_SIZE = env_int("ADVICE_CACHE_SIZE", 256)
+# Сколько хранится ответ в БД, чтобы отдать его при недоступности модели
+ADVICE_FALLBACK_TTL = env_float("ADVICE_FALLBACK_TTL", 604800.0)
 
-    except APIConnectionError as e:
-        print(f"Ошибка подключения к API: {e}")
+FORECAST_COMPACT = env_bool("FORECAST_COMPACT", True)
+FORECAST_TOKEN_BUDGET = env_int("FORECAST_TOKEN_BUDGET", 600)
 
-    except APIError as e:
-        print(f"Ошибка API: {e}")
+AI_RATE_LIMIT = env_float("AI_RATE_LIMIT", 1.0)
+AI_RATE_BURST = env_int("AI_RATE_BURST", 3)
+AI_MAX_IN_FLIGHT = env_int("AI_MAX_IN_FLIGHT", 5)
+AI_MAX_WAITING = env_int("AI_MAX_WAITING", 50)
+AI_WAIT_TIMEOUT = env_float("AI_WAIT_TIMEOUT", 30.0)
 
-    except Exception as e:
-        print(f"Неожиданная ошибка: {e}")
+# Бюджет всех попыток меньше AI_STAGE_TIMEOUT обработчика /get. Хеджирование
+# удваивает расход токенов, поэтому по умолчанию выключено.
+AI_ATTEMPT_TIMEOUT = env_float("AI_ATTEMPT_TIMEOUT", 40.0)
+AI_BUDGET = env_float("AI_BUDGET", 80.0)
+AI_RETRIES = env_int("AI_RETRIES", 1)
+AI_HEDGE_AFTER = env_float("AI_HEDGE_AFTER", 0.0)
+AI_BREAKER_THRESHOLD = env_int("AI_BREAKER_THRESHOLD", 5)
+AI_BREAKER_RESET = env_float("AI_BREAKER_RESET", 60.0)
 
+AI_STREAMING = env_bool("AI_STREAMING", True)
+STREAM_EDIT_INTERVAL = env_float("STREAM_EDIT_INTERVAL", 1.0)
 
-async def generate_prompt(
-    weather_forecast: str,
-) -> list[ChatCompletionSystemMessageParam | ChatCompletionUserMessageParam]:
-    """Формирует системный и пользовательский промпты для ИИ-модели.
+_client: Any = None
 
-    Создаёт список сообщений, включающий системное сообщение с ролью консультанта
-    и пользовательское сообщение с прогнозом погоды. Промпт нацелен на получение
-    практических, дружелюбных рекомендаций для сап-сёрфинга в заданном формате.
-    """
-    prompt = """Ты дружелюбный метео-консультант для сап-серфера. 
+SYSTEM_PROMPT = """Ты дружелюбный метео-консультант для сап-серфера. 
     Проанализируй прогноз погоды и дай практические рекомендации в разговорном стиле.
 
     Мои предпочтения:
@@ -85,9 +90,285 @@ async def generate_prompt(
     Используй естественный язык, не перечисляй все данные подряд.
     Сосредоточься на временном окне 11:00-14:00."""
 
+
+def get_ai_client() -> Any:
+    """Возвращает клиента AsyncOpenAI, создавая его при первом обращении.
+
+    Пакет openai импортируется здесь же, чтобы не замедлять запуск бота.
+    Собственные повторы клиента отключены: ими управляет llm_policy.
+    """
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(
+            api_key=AI_TOKEN_POLZA, base_url=polza, timeout=AI_ATTEMPT_TIMEOUT, max_retries=0
+        )
+    return _client
+
+
+def set_ai_client(client: Any) -> None:
+    """Подменяет клиента модели ИИ, например заглушкой в бенчмарках."""
+    global _client
+    _client = client
+
+
+advice_flight = SingleFlight()
+advice_streams = StreamFlight()
+advice_cache = TTLCache(ttl=ADVICE_CACHE_TTL, maxsize=ADVICE_CACHE_SIZE)
+llm_limiter = RateLimiter(
+    "llm",
+    rate=AI_RATE_LIMIT,
+    burst=AI_RATE_BURST,
+    max_in_flight=AI_MAX_IN_FLIGHT,
+    max_waiting=AI_MAX_WAITING,
+    wait_timeout=AI_WAIT_TIMEOUT,
+)
+
+
+def is_retryable_llm_error(error: BaseException) -> bool:
+    """Возвращает True для сбоев модели, которые имеет смысл повторить: сеть, таймаут, 5xx."""
+    if isinstance(error, TimeoutError):
+        return True
+    from openai import APIConnectionError, InternalServerError
+
+    return isinstance(error, APIConnectionError | InternalServerError)
+
+
+llm_policy = ResiliencePolicy(
+    CircuitBreaker("llm", failure_threshold=AI_BREAKER_THRESHOLD, reset_timeout=AI_BREAKER_RESET),
+    attempt_timeout=AI_ATTEMPT_TIMEOUT,
+    budget=AI_BUDGET,
+    retries=AI_RETRIES,
+    backoff=1.0,
+    hedge_after=AI_HEDGE_AFTER,
+    is_retryable=is_retryable_llm_error,
+)
+register_cache("advice", advice_cache)
+register_gauge("singleflight_in_flight", lambda: len(advice_flight), name="advice")
+register_gauge("singleflight_in_flight", lambda: len(advice_streams), name="advice_stream")
+register_stats("limiter", "llm", llm_limiter)
+register_stats("breaker", "llm", llm_policy.breaker)
+
+
+async def ai_generate(weather_forecast: str) -> str | None:
+    """Генерирует рекомендации по сёрфингу на основе прогноза погоды с использованием ИИ.
+
+    Ответы кэшируются по хешу промпта, модели, температуры и прогноза: сначала
+    в памяти процесса, затем в таблице advice_cache. Одновременные запросы
+    с одинаковым хешем ожидают один общий вызов модели. Ошибки не кэшируются.
+    Если модель недоступна, отдаётся последний ответ на тот же прогноз не старше
+    ADVICE_FALLBACK_TTL, а если его нет — None.
+    """
+    digest = advice_digest(weather_forecast)
+    response = await advice_cache.get_or_load(
+        digest,
+        lambda: advice_flight.do(digest, lambda: load_advice(digest, weather_forecast)),
+        should_cache=lambda response: response is not None,
+    )
+    if response is None:
+        response = await get_cached_advice(digest, ADVICE_FALLBACK_TTL)
+    return response
+
+
+def encode_forecast(slots: list[ForecastSlot], budget: int = FORECAST_TOKEN_BUDGET) -> str:
+    """Кодирует прогноз для промпта с учётом бюджета токенов.
+
+    По умолчанию используется компактная таблица по слотам. Если она не влезает
+    в budget, слоты агрегируются по дням, а при необходимости отбрасываются
+    самые дальние дни. FORECAST_COMPACT=false возвращает прежний подробный формат.
+    """
+    if not FORECAST_COMPACT:
+        return render_forecast(slots)
+
+    text = render_forecast_compact(slots)
+    if estimate_tokens(text) <= budget:
+        return text
+
+    days = sorted({slot.date for slot in slots})
+    for count in range(len(days), 0, -1):
+        kept = set(days[:count])
+        text = render_days_compact([slot for slot in slots if slot.date in kept])
+        if estimate_tokens(text) <= budget:
+            break
+    return text
+
+
+def advice_digest(weather_forecast: str) -> str:
+    """Вычисляет SHA-256 от системного промпта, модели, температуры и прогноза."""
+    payload = json.dumps(
+        [SYSTEM_PROMPT, AI_MODEL, AI_TEMPERATURE, weather_forecast], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def load_advice(digest: str, weather_forecast: str) -> str | None:
+    """Берёт ответ из постоянного кэша в БД или запрашивает его у модели и сохраняет."""
+    cached = await get_cached_advice(digest, ADVICE_CACHE_TTL)
+    if cached is not None:
+        return cached
+
+    response = await request_advice(weather_forecast)
+    if response is not None:
+        await save_cached_advice(digest, response, ADVICE_FALLBACK_TTL)
+    return response
+
+
+async def request_advice(weather_forecast: str) -> str | None:
+    """Запрашивает у модели ИИ рекомендации по прогнозу погоды.
+
+    Формирует промпт с пользовательскими предпочтениями, отправляет запрос в модель ИИ
+    по правилам llm_policy и возвращает очищенный текст с рекомендациями. В случае
+    ошибок — выводит сообщение в консоль и возвращает None.
+    """
+    message = await generate_prompt(weather_forecast)
+
+    async def complete() -> Any:
+        async with llm_limiter.slot():
+            with timed("llm_completion", mode="blocking"):
+                return await get_ai_client().chat.completions.create(
+                    model=AI_MODEL,
+                    messages=message,
+                    temperature=AI_TEMPERATURE,
+                )
+
+    try:
+        completion = await llm_policy.call(complete)
+        if completion.usage is not None:
+            increment("llm_tokens_total", completion.usage.prompt_tokens, kind="prompt")
+            increment("llm_tokens_total", completion.usage.completion_tokens, kind="completion")
+
+        response_text = completion.choices[0].message.content
+        response = clean_text(response_text)
+        return response
+
+    except Exception as e:
+        report_api_error(e)
+
+
+async def ai_generate_stream(weather_forecast: str) -> AsyncIterator[str]:
+    """Генерирует рекомендации по прогнозу потоково, по мере ответа модели.
+
+    Если ответ уже есть в кэше (в памяти или в БД), он отдаётся одним фрагментом.
+    Иначе одновременные запросы с одинаковым хешем читают один общий поток
+    модели (stream_advice): каждый получает все его фрагменты с начала.
+    """
+    digest = advice_digest(weather_forecast)
+    cached = advice_cache.get(digest)
+    if cached is None:
+        cached = await get_cached_advice(digest, ADVICE_CACHE_TTL)
+    if cached is not None:
+        advice_cache.set(digest, cached)
+        yield cached
+        return
+
+    shared = advice_streams.stream(digest, lambda: stream_advice(digest, weather_forecast))
+    async with aclosing(shared):
+        async for chunk in shared:
+            yield chunk
+
+
+async def stream_advice(digest: str, weather_forecast: str) -> AsyncGenerator[str]:
+    """Запрашивает у модели потоковый ответ и отдаёт его фрагменты по мере генерации.
+
+    Фрагменты очищаются от разметки по одному; полный ответ после завершения
+    сохраняется в оба уровня кэша. Поток не повторяется и не хеджируется, но
+    проходит через автомат llm_policy, а ожидание первого фрагмента ограничено
+    AI_ATTEMPT_TIMEOUT. Если модель недоступна и ничего не успела отдать,
+    отдаётся последний ответ на тот же прогноз не старше ADVICE_FALLBACK_TTL;
+    частичный или прерванный ответ не кэшируется.
+    """
+    message = await generate_prompt(weather_forecast)
+    parts = []
+    try:
+        llm_policy.breaker.allow()
+        # Место в лимитере занято, пока модель не закончит ответ
+        async with llm_limiter.slot():
+            with timed("llm_completion", mode="stream"):
+                # Ограничено только ожидание первого фрагмента: дальше модель пишет ответ
+                async with asyncio.timeout(AI_ATTEMPT_TIMEOUT) as deadline:
+                    stream = await get_ai_client().chat.completions.create(
+                        model=AI_MODEL,
+                        messages=message,
+                        temperature=AI_TEMPERATURE,
+                        stream=True,
+                    )
+                    async for chunk in stream:
+                        deadline.reschedule(None)
+                        if not chunk.choices or not chunk.choices[0].delta.content:
+                            continue
+                        # clean_text удаляет отдельные символы разметки, поэтому его можно
+                        # применять к каждому фрагменту независимо
+                        cleaned = clean_text(chunk.choices[0].delta.content)
+                        parts.append(cleaned)
+                        yield cleaned
+    except (asyncio.CancelledError, GeneratorExit):
+        # Поток прерван вызывающим (например, по таймауту /get): о здоровье модели
+        # это ничего не говорит, но пробный вызов автомата нужно освободить
+        llm_policy.breaker.record_ignored()
+        raise
+    except Exception as e:
+        if not isinstance(e, CircuitOpenError):
+            llm_policy.record(e)
+        report_api_error(e)
+        if not parts:
+            fallback = await get_cached_advice(digest, ADVICE_FALLBACK_TTL)
+            if fallback is not None:
+                yield fallback
+        return
+
+    llm_policy.record(None)
+    response = "".join(parts)
+    if METRICS_ENABLED:
+        # Поток не возвращает usage, поэтому токены оцениваются по длине текста
+        prompt_tokens = estimate_tokens(json.dumps(message, ensure_ascii=False))
+        increment("llm_tokens_estimated_total", prompt_tokens, kind="prompt")
+        increment("llm_tokens_estimated_total", estimate_tokens(response), kind="completion")
+    if response:
+        advice_cache.set(digest, response)
+        await save_cached_advice(digest, response, ADVICE_FALLBACK_TTL)
+
+
+def report_api_error(error: Exception) -> None:
+    """Выводит в консоль сообщение об ошибке обращения к модели ИИ.
+
+    При ответе 429 приостанавливает llm_limiter на время из Retry-After.
+    """
+    from openai import APIConnectionError, APIError, BadRequestError, RateLimitError
+
+    if isinstance(error, CircuitOpenError):
+        print(f"Запрос к модели не отправлен: {error}")
+    elif isinstance(error, RateLimitExceeded):
+        print(f"Запрос к модели отклонён лимитером: {error}")
+    elif isinstance(error, TimeoutError):
+        print("Модель не ответила за отведённое время")
+    elif isinstance(error, RateLimitError):
+        llm_limiter.pause(retry_after(error.response.headers, 20))
+        print(f"Превышен лимит запросов к API: {error}")
+    elif isinstance(error, BadRequestError):
+        print(f"Ошибка запроса к API: {error}")
+    elif isinstance(error, APIConnectionError):
+        print(f"Ошибка подключения к API: {error}")
+    elif isinstance(error, APIError):
+        print(f"Ошибка API: {error}")
+    else:
+        print(f"Неожиданная ошибка: {error}")
+
+
+async def generate_prompt(
+    weather_forecast: str,
+) -> list["ChatCompletionMessageParam"]:
+    """Формирует системный и пользовательский промпты для ИИ-модели.
+
+    Создаёт список сообщений, включающий системное сообщение с ролью консультанта
+    и пользовательское сообщение с прогнозом погоды. Промпт нацелен на получение
+    практических, дружелюбных рекомендаций для сап-сёрфинга в заданном формате.
+    Системный промпт неизменен и идёт первым, а всё переменное находится в конце,
+    поэтому общий префикс может кэшироваться на стороне провайдера.
+    """
     message = [
-        ChatCompletionSystemMessageParam(role="system", content=prompt),
-        ChatCompletionUserMessageParam(role="user", content=f"{weather_forecast}"),
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"{weather_forecast}"},
     ]
 
     return message
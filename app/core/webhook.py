@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import signal
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from app.config import env_float, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+# "polling" или "webhook"
+BOT_MODE = env_str("BOT_MODE", "polling").lower()
+
+# Публичный адрес, по которому Telegram присылает апдейты, например https://bot.example.com.
+# Если не задан, вебхук в Telegram не регистрируется (удобно для локальной проверки).
+WEBHOOK_BASE_URL = env_str("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = env_str("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = env_str("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = env_int("WEBHOOK_PORT", 8080)
+WEBHOOK_SECRET = env_str("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONCURRENCY = env_int("WEBHOOK_MAX_CONCURRENCY", 50)
+WEBHOOK_SHUTDOWN_TIMEOUT = env_float("WEBHOOK_SHUTDOWN_TIMEOUT", 30.0)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука, ограничивающий число одновременно обрабатываемых апдейтов.
+
+    Апдейт подтверждается Telegram сразу и обрабатывается в фоне. Когда в работе
+    уже max_concurrency апдейтов, ответ на новый запрос задерживается до
+    освобождения места, и Telegram сам притормаживает отправку. При остановке
+    новые апдейты отклоняются с кодом 503 (Telegram повторит их позже), а уже
+    принятые дорабатываются не дольше shutdown_timeout секунд.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+        shutdown_timeout: float = WEBHOOK_SHUTDOWN_TIMEOUT,
+        **kwargs: Any,
+    ) -> None:
+        """Создаёт обработчик с ограничением параллельной обработки."""
+        super().__init__(dispatcher, bot, **kwargs)
+        self.shutdown_timeout = shutdown_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._closing = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Проверяет секрет, ждёт свободного места и запускает обработку апдейта в фоне.
+
+        Использует только публичный API aiogram, как и роутер шардов в sharding.py.
+        """
+        if self._closing:
+            return web.Response(status=503, text="Shutting down")
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(status=401, text="Unauthorized")
+        update = await request.json(loads=bot.session.json_loads)
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._feed(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _feed(self, bot: Bot, update: dict[str, Any]) -> None:
+        """Обрабатывает апдейт и освобождает место."""
+        try:
+            result = await self.dispatcher.feed_raw_update(bot, update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot, result)
+        except Exception as e:
+            logger.error(f"Ошибка обработки апдейта: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def close(self) -> None:
+        """Дожидается принятых апдейтов и закрывает сессию бота."""
+        self._closing = True
+        tasks = set(self._tasks)
+        if tasks:
+            logger.info(f"Ожидание обработки {len(tasks)} апдейтов перед остановкой")
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+        await super().close()
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    """Отвечает балансировщику, что реплика работает."""
+    return web.Response(text="ok")
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot) -> web.Application:
+    """Собирает aiohttp-приложение с маршрутом вебхука и проверкой секрета."""
+    app = web.Application()
+    BoundedRequestHandler(dispatcher, bot, secret_token=WEBHOOK_SECRET).register(
+        app, path=WEBHOOK_PATH
+    )
+    app.router.add_get("/health", health_handler)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def register_webhook(bot: Bot, allowed_updates: list[str]) -> None:
+    """Регистрирует вебхук в Telegram с секретом и лимитом соединений.
+
+    Ничего не делает, если WEBHOOK_BASE_URL не задан.
+    """
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан: запросы к вебхуку не проверяются")
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONCURRENCY,
+            allowed_updates=allowed_updates,
+        )
+
+
+async def serve_until_stopped(app: web.Application) -> None:
+    """Обслуживает aiohttp-приложение до сигнала SIGINT или SIGTERM."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        logger.info(f"Вебхук слушает http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        logger.info("Остановка вебхука")
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    """Запускает HTTP-сервер вебхука и работает до сигнала остановки.
+
+    Вебхук при остановке не удаляется: его продолжают обслуживать остальные реплики.
+    """
+    await register_webhook(bot, dispatcher.resolve_used_update_types())
+    await serve_until_stopped(create_webhook_app(dispatcher, bot))
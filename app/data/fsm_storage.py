@@ -0,0 +1,168 @@
+import logging
+from collections.abc import Mapping
+from datetime import timedelta
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import env_float, env_int, env_str
+from app.data.models import FsmStates, async_session
+from app.tools.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# "memory" — состояние в памяти процесса, "db" — в таблице fsm_states, "auto" — "db",
+# только если вебхук обслуживают несколько процессов или реплик
+FSM_STORAGE = env_str("FSM_STORAGE", "auto").lower()
+# Читаются здесь же, а не из app.core, чтобы слой данных не зависел от ядра
+BOT_MODE = env_str("BOT_MODE", "polling").lower()
+WEBHOOK_WORKERS = env_int("WEBHOOK_WORKERS", 1)
+BOT_REPLICAS = env_int("BOT_REPLICAS", 1)
+FSM_STATE_TTL = env_float("FSM_STATE_TTL", 86400.0)
+# Кэш чтения согласован, только если все апдейты чата приходят в этот процесс: при
+# одной реплике (с WEBHOOK_WORKERS > 1 чат закреплён за шардом). Реплики за
+# балансировщиком не шардированы, поэтому для них кэш по умолчанию выключен.
+FSM_CACHE_TTL = env_float("FSM_CACHE_TTL", 10.0 if BOT_REPLICAS <= 1 else 0.0)
+FSM_CACHE_SIZE = env_int("FSM_CACHE_SIZE", 10000)
+
+
+def compact_key(key: StorageKey) -> str:
+    """Собирает короткий строковый ключ записи: bot:chat:user[:thread][:business][:destiny]."""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id is not None or key.business_connection_id or key.destiny != DEFAULT_DESTINY:
+        parts.append(str(key.thread_id or ""))
+    if key.business_connection_id or key.destiny != DEFAULT_DESTINY:
+        parts.append(key.business_connection_id or "")
+    if key.destiny != DEFAULT_DESTINY:
+        parts.append(key.destiny)
+    return ":".join(parts)
+
+
+class DbStorage(BaseStorage):
+    """Хранилище FSM aiogram в базе данных поверх общего движка SQLAlchemy.
+
+    Состояние и данные хранятся одной строкой под компактным ключом и живут
+    ttl секунд с последней записи по часам PostgreSQL. Если cache_ttl больше нуля,
+    прочитанные записи кэшируются в памяти на cache_ttl секунд, а записи обновляют
+    кэш сразу. Такой кэш согласован, только пока апдейты одного чата обрабатывает
+    один процесс (см. app/core/sharding.py); иначе его нужно выключать (cache_ttl=0).
+    """
+
+    def __init__(
+        self,
+        ttl: float = FSM_STATE_TTL,
+        cache_ttl: float = FSM_CACHE_TTL,
+        cache_size: int = FSM_CACHE_SIZE,
+    ) -> None:
+        """Создаёт хранилище с заданными временем жизни записей и кэша."""
+        self.ttl = ttl
+        self._cache = TTLCache(ttl=cache_ttl, maxsize=cache_size) if cache_ttl > 0 else None
+
+    async def _load(self, key: str) -> tuple[str | None, dict[str, Any]]:
+        """Возвращает состояние и данные по ключу из кэша или базы."""
+        cached = self._cache.get(key) if self._cache is not None else None
+        if cached is not None:
+            return cached
+        try:
+            record = await self._read(key)
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния FSM: {e}")
+            return None, {}
+        if self._cache is not None:
+            self._cache.set(key, record)
+        return record
+
+    async def _save(self, key: str, state: str | None, data: dict[str, Any]) -> None:
+        """Сохраняет запись в базу и кэш; при ошибке сбрасывает запись кэша."""
+        if self._cache is not None:
+            self._cache.set(key, (state, data))
+        try:
+            await self._write(key, state, data)
+        except Exception as e:
+            if self._cache is not None:
+                self._cache.invalidate(key)
+            logger.error(f"Ошибка сохранения состояния FSM: {e}")
+
+    async def _read(self, key: str) -> tuple[str | None, dict[str, Any]]:
+        """Читает неистёкшую запись из базы; пустая запись — (None, {})."""
+        async with async_session() as session:
+            query = select(FsmStates.state, FsmStates.data).where(
+                FsmStates.key == key, FsmStates.expires_at > func.now()
+            )
+            row = (await session.execute(query)).one_or_none()
+            if row is None:
+                return None, {}
+            return row.state, dict(row.data or {})
+
+    async def _write(self, key: str, state: str | None, data: dict[str, Any]) -> None:
+        """Записывает запись в базу (или удаляет пустую) и попутно чистит истёкшие."""
+        async with async_session() as session:
+            await session.execute(delete(FsmStates).where(FsmStates.expires_at <= func.now()))
+            if state is None and not data:
+                await session.execute(delete(FsmStates).where(FsmStates.key == key))
+            else:
+                expires_at = func.now() + timedelta(seconds=self.ttl)
+                stmt = insert(FsmStates).values(
+                    key=key, state=state, data=data, expires_at=expires_at
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[FsmStates.key],
+                    set_={"state": state, "data": data, "expires_at": expires_at},
+                )
+                await session.execute(stmt)
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Устанавливает состояние, сохраняя данные диалога."""
+        storage_key = compact_key(key)
+        _, data = await self._load(storage_key)
+        await self._save(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        """Возвращает текущее состояние или None."""
+        state, _ = await self._load(compact_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        """Заменяет данные диалога, сохраняя состояние."""
+        storage_key = compact_key(key)
+        state, _ = await self._load(storage_key)
+        await self._save(storage_key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        """Возвращает копию данных диалога."""
+        _, data = await self._load(compact_key(key))
+        return dict(data)
+
+    async def close(self) -> None:
+        """Очищает кэш; соединения принадлежат общему движку и закрываются вместе с ним."""
+        if self._cache is not None:
+            self._cache.invalidate()
+
+
+def resolve_fsm_storage(
+    storage: str = FSM_STORAGE,
+    mode: str = BOT_MODE,
+    workers: int = WEBHOOK_WORKERS,
+    replicas: int = BOT_REPLICAS,
+) -> str:
+    """Определяет тип хранилища FSM: "memory" или "db".
+
+    Для "auto" состояние хранится в БД, только если вебхук обслуживают
+    несколько процессов или реплик: тогда следующий апдейт диалога может
+    попасть в другой процесс. Иначе хватает памяти процесса.
+    """
+    if storage != "auto":
+        return storage
+    return "db" if mode == "webhook" and max(workers, replicas) > 1 else "memory"
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создаёт хранилище FSM, выбранное переменной FSM_STORAGE."""
+    if resolve_fsm_storage() == "memory":
+        return MemoryStorage()
+    return DbStorage()
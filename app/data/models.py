@@ -1,48 +1,112 @@
-import os
-from datetime import datetime
+import asyncio
 
-from dotenv import load_dotenv
 from sqlalchemy import (
+    JSON,
     Boolean,
     Column,
     Date,
     DateTime,
+    Float,
     ForeignKey,
     Integer,
     String,
     Text,
     UniqueConstraint,
+    func,
+    select,
+    text,
 )
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
     AsyncEngine,
+    AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase, relationship
 
-load_dotenv()
+from app.config import env_bool, env_float, env_int, env_str
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL = env_str("DATABASE_URL")
 SCHEMA = "public"
 
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = env_float("DB_POOL_TIMEOUT", 10.0)
+DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+DB_POOL_WARM = env_int("DB_POOL_WARM", 2)
+DB_STATEMENT_CACHE_SIZE = env_int("DB_STATEMENT_CACHE_SIZE", 256)
+# Пропустить проверку схемы при запуске (таблицы уже созданы миграцией или другой репликой)
+DB_SKIP_SCHEMA_CHECK = env_bool("DB_SKIP_SCHEMA_CHECK", False)
+
+# Увеличивать при каждом изменении моделей, чтобы при запуске выполнился create_all
+SCHEMA_VERSION = 6
+# Ключ advisory-блокировки, чтобы реплики не создавали таблицы одновременно
+SCHEMA_LOCK_KEY = 0x50414444
+
+_engine: AsyncEngine | None = None
+_session_factory: async_sessionmaker[AsyncSession] | None = None
+
 
 def get_engine(schema: str) -> AsyncEngine:
     """Создаёт и возвращает асинхронный движок SQLAlchemy с указанным схемой.
 
     Устанавливает параметр search_path в соединении, чтобы все запросы выполнялись
-    в заданной схеме PostgreSQL.
+    в заданной схеме PostgreSQL. Размер пула, переполнение, pre-ping, время жизни
+    соединений и размеры кэшей подготовленных выражений asyncpg задаются
+    переменными окружения DB_*.
     """
     return create_async_engine(
-        DATABASE_URL, connect_args={"server_settings": {"search_path": schema}}
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            "server_settings": {"search_path": schema},
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
     )
 
 
-if SCHEMA is None or SCHEMA == "":
-    engine = get_engine("public")
-else:
-    engine = get_engine(SCHEMA)
-async_session = async_sessionmaker(engine)
+def get_async_engine() -> AsyncEngine:
+    """Возвращает общий движок приложения, создавая его при первом обращении."""
+    global _engine
+    if _engine is None:
+        _engine = get_engine(SCHEMA or "public")
+    return _engine
+
+
+def async_session() -> AsyncSession:
+    """Создаёт новую асинхронную сессию, привязанную к общему движку."""
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = async_sessionmaker(get_async_engine())
+    return _session_factory()
+
+
+async def dispose_engine() -> None:
+    """Закрывает все соединения пула и сбрасывает общий движок."""
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
+
+
+async def warm_up_pool(connections: int = DB_POOL_WARM) -> None:
+    """Заранее открывает несколько соединений пула, чтобы первые апдейты не ждали их."""
+    engine = get_async_engine()
+
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(min(connections, DB_POOL_SIZE))))
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -55,6 +119,20 @@ class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
+class SchemaVersion(Base):
+    """Модель версии схемы базы данных.
+
+    Представляет таблицу 'schema_version' с единственной строкой: версией моделей,
+    для которой таблицы уже созданы, и временем её применения.
+    """
+
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Users(Base):
     """Модель пользователя в базе данных.
 
@@ -79,7 +157,68 @@ class WeatherRequests(Base):
     user_id = Column(Integer)
     forecast_text = Column(Text)
     ai_response = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AdviceCache(Base):
+    """Модель кэша ответов ИИ в базе данных.
+
+    Представляет таблицу 'advice_cache', где ответ модели хранится под хешем
+    системного промпта, модели, температуры и текста прогноза.
+    """
+
+    __tablename__ = "advice_cache"
+    digest = Column(String(64), primary_key=True)
+    ai_response = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class Spots(Base):
+    """Модель пользовательских мест для катания.
+
+    Представляет таблицу 'spots': название спота, его владельца (Telegram user_id)
+    и координаты; без координат прогноз ищется по названию.
+    """
+
+    __tablename__ = "spots"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    name = Column(String(100), nullable=False)
+    lat = Column(Float)
+    lon = Column(Float)
+
+    __table_args__ = (UniqueConstraint("user_id", "name", name="uq_user_spot"),)
+
+
+class FsmStates(Base):
+    """Модель состояний конечного автомата (FSM) aiogram.
+
+    Представляет таблицу 'fsm_states': состояние и данные диалога под компактным
+    ключом бота, чата и пользователя. Записи с истёкшим expires_at не читаются.
+    """
+
+    __tablename__ = "fsm_states"
+
+    key = Column(String(128), primary_key=True)
+    state = Column(String(100))
+    data = Column(JSON, nullable=False, default=dict)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class JobLeases(Base):
+    """Модель аренды фоновых задач между репликами.
+
+    Представляет таблицу 'job_leases': какая реплика (owner) выполняет задачу
+    name до момента expires_at. Пока аренда действует, остальные реплики
+    пропускают запуск задачи.
+    """
+
+    __tablename__ = "job_leases"
+
+    name = Column(String(128), primary_key=True)
+    owner = Column(String(128), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
 
 
 class Friends(Base):
@@ -112,11 +251,62 @@ class WorkDay(Base):
     )
 
 
-async def init_models() -> None:
+async def get_schema_version() -> int | None:
+    """Возвращает применённую версию схемы или None, если таблицы версии ещё нет."""
+    async with get_async_engine().connect() as conn:
+        if await conn.scalar(text("SELECT to_regclass('schema_version')")) is None:
+            return None
+        return await conn.scalar(select(SchemaVersion.version).where(SchemaVersion.id == 1))
+
+
+def to_timestamptz(table: str, column: str) -> str:
+    """Возвращает идемпотентный SQL перевода столбца timestamp с временем UTC в timestamptz."""
+    return f"""
+        DO $$ BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                    AND table_name = '{table}' AND column_name = '{column}'
+            ) = 'timestamp without time zone' THEN
+                ALTER TABLE {table} ALTER COLUMN {column} TYPE timestamptz
+                    USING {column} AT TIME ZONE 'UTC';
+            END IF;
+        END $$
+    """
+
+
+# Изменения существующих таблиц, которые create_all не выполняет. Должны быть
+# идемпотентными: выполняются целиком при каждой смене SCHEMA_VERSION.
+SCHEMA_UPGRADES = [
+    to_timestamptz("fsm_states", "expires_at"),
+    to_timestamptz("advice_cache", "created_at"),
+    to_timestamptz("weather_requests", "created_at"),
+    to_timestamptz("schema_version", "applied_at"),
+]
+
+
+async def init_models(force: bool = False) -> bool:
     """Инициализирует модели базы данных.
 
-    Создаёт таблицы в базе данных, если они ещё не существуют.
-    Использует метаданные Base для синхронизации схемы.
+    Если версия схемы в БД совпадает с SCHEMA_VERSION, ограничивается одним
+    запросом. Иначе под advisory-блокировкой создаёт недостающие таблицы через
+    метаданные Base, применяет SCHEMA_UPGRADES и записывает новую версию.
+    Возвращает True, если create_all выполнялся. При DB_SKIP_SCHEMA_CHECK ничего
+    не делает (если не передан force).
     """
-    async with engine.begin() as conn:
+    if DB_SKIP_SCHEMA_CHECK and not force:
+        return False
+    if not force and await get_schema_version() == SCHEMA_VERSION:
+        return False
+
+    async with get_async_engine().begin() as conn:
+        await conn.execute(select(func.pg_advisory_xact_lock(SCHEMA_LOCK_KEY)))
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+        stmt = insert(SchemaVersion).values(id=1, version=SCHEMA_VERSION)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SchemaVersion.id],
+            set_={"version": SCHEMA_VERSION, "applied_at": func.now()},
+        )
+        await conn.execute(stmt)
+    return True
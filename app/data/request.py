@@ -1,11 +1,59 @@
-from datetime import date
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
 
-from sqlalchemy import select
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.data.models import Friends, Users, WeatherRequests, WorkDay, async_session
+from app.data.models import (
+    AdviceCache,
+    Friends,
+    JobLeases,
+    Spots,
+    Users,
+    WeatherRequests,
+    WorkDay,
+    async_session,
+)
+from app.tools.metrics import timed
 
 
-async def get_user_by_id(user_id: int) -> Users | None:
+@asynccontextmanager
+async def session_scope(session: AsyncSession | None = None) -> AsyncIterator[AsyncSession]:
+    """Возвращает переданную сессию или открывает собственную.
+
+    Переданной сессией (например, сессией Telegram-апдейта из DbSessionMiddleware)
+    управляет вызывающий код. Собственная сессия фиксируется при выходе из блока.
+    """
+    if session is not None:
+        yield session
+        return
+    async with async_session() as own_session:
+        yield own_session
+        await own_session.commit()
+
+
+async def release_session(session: AsyncSession | None) -> None:
+    """Фиксирует транзакцию сессии апдейта и возвращает её соединение в пул.
+
+    Вызывается, когда работа с БД в апдейте закончена, но впереди долгие сетевые
+    этапы (OpenWeatherMap, модель ИИ): иначе соединение остаётся занятым до конца
+    апдейта. Сессией можно пользоваться и дальше — следующий запрос снова возьмёт
+    соединение из пула. Загруженные объекты после вызова устаревают, поэтому нужные
+    значения следует прочитать заранее. В случае ошибки выводит сообщение.
+    """
+    if session is None or not session.in_transaction():
+        return
+    try:
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        print(f"Ошибка фиксации транзакции апдейта: {e}")
+
+
+@timed("db", query="get_user_by_id")
+async def get_user_by_id(user_id: int, session: AsyncSession | None = None) -> Users | None:
     """Получает пользователя из базы данных по его идентификатору.
 
     Выполняет асинхронный запрос к базе данных для поиска записи в таблице 'users'
@@ -13,7 +61,7 @@ async def get_user_by_id(user_id: int) -> Users | None:
     не найден. В случае ошибки выводит сообщение об ошибке и возвращает None.
     """
     try:
-        async with async_session() as session:
+        async with session_scope(session) as session:
             query = select(Users).where(Users.user_id == user_id)
             result = await session.execute(query)
             return result.scalar_one_or_none()
@@ -22,42 +70,105 @@ async def get_user_by_id(user_id: int) -> Users | None:
         return None
 
 
-async def add_user(user_id: int, username: str) -> None:
+@timed("db", query="user_exists")
+async def user_exists(user_id: int, session: AsyncSession | None = None) -> bool | None:
+    """Проверяет, зарегистрирован ли пользователь с указанным user_id.
+
+    Возвращает True или False. В случае ошибки выводит сообщение и возвращает None,
+    чтобы сбой БД не выглядел как отсутствие пользователя.
+    """
+    try:
+        async with session_scope(session) as session:
+            query = select(Users.user_id).where(Users.user_id == user_id)
+            result = await session.execute(query)
+            return result.scalar_one_or_none() is not None
+    except Exception as e:
+        print(f"Ошибка проверки пользователя: {e}")
+        return None
+
+
+@timed("db", query="add_user")
+async def add_user(user_id: int, username: str, session: AsyncSession | None = None) -> None:
     """Добавляет нового пользователя в базу данных.
 
     Создаёт и сохраняет новую запись в таблице 'users' с указанными user_id и username.
     В случае ошибки выводит сообщение об ошибке.
     """
     try:
-        async with async_session() as session:
+        async with session_scope(session) as session:
             user = Users(user_id=user_id, username=username)
             session.add(user)
-            await session.commit()
+            await session.flush()
     except Exception as e:
         print(f"Ошибка добавления пользователя: {e}")
 
 
-async def save_weather_request(user_id: int, forecast_text: str, ai_response: str) -> None:
+@timed("db", query="save_weather_request")
+async def save_weather_request(
+    user_id: int, forecast_text: str, ai_response: str, session: AsyncSession | None = None
+) -> None:
     """Сохраняет запрос прогноза погоды и ответ ИИ в базу данных.
 
     Создаёт новую запись в таблице 'weather_requests', содержащую идентификатор пользователя,
     текст прогноза погоды и ответ ИИ-советника. В случае ошибки выводит сообщение об ошибке.
     """
     try:
-        async with async_session() as session:
+        async with session_scope(session) as session:
             request = WeatherRequests(
                 user_id=user_id, forecast_text=forecast_text, ai_response=ai_response
             )
             session.add(request)
-            await session.commit()
+            await session.flush()
     except Exception as e:
         print(f"Ошибка сохранения запроса погоды: {e}")
 
 
-async def get_friend_by_name(name: str) -> Friends | None:
-    """Получает друга по имени из базы данных."""
+@timed("db", query="get_cached_advice")
+async def get_cached_advice(digest: str, max_age: float) -> str | None:
+    """Получает сохранённый ответ ИИ по хешу запроса.
+
+    Возвращает текст ответа, если запись существует и не старше max_age секунд,
+    иначе None. В случае ошибки выводит сообщение об ошибке и возвращает None.
+    """
     try:
         async with async_session() as session:
+            cutoff = func.now() - timedelta(seconds=max_age)
+            query = select(AdviceCache.ai_response).where(
+                AdviceCache.digest == digest, AdviceCache.created_at >= cutoff
+            )
+            result = await session.execute(query)
+            return result.scalar_one_or_none()
+    except Exception as e:
+        print(f"Ошибка получения кэша ответа ИИ: {e}")
+        return None
+
+
+@timed("db", query="save_cached_advice")
+async def save_cached_advice(digest: str, ai_response: str, max_age: float) -> None:
+    """Сохраняет ответ ИИ под хешем запроса и удаляет записи старше max_age секунд.
+
+    В случае ошибки выводит сообщение об ошибке.
+    """
+    stmt = insert(AdviceCache).values(digest=digest, ai_response=ai_response)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AdviceCache.digest],
+        set_={"ai_response": ai_response, "created_at": func.now()},
+    )
+    try:
+        async with async_session() as session:
+            cutoff = func.now() - timedelta(seconds=max_age)
+            await session.execute(delete(AdviceCache).where(AdviceCache.created_at < cutoff))
+            await session.execute(stmt)
+            await session.commit()
+    except Exception as e:
+        print(f"Ошибка сохранения кэша ответа ИИ: {e}")
+
+
+@timed("db", query="get_friend_by_name")
+async def get_friend_by_name(name: str, session: AsyncSession | None = None) -> Friends | None:
+    """Получает друга по имени из базы данных."""
+    try:
+        async with session_scope(session) as session:
             # Используем ilike для регистронезависимого поиска
             query = select(Friends).where(Friends.name.ilike(name))
             result = await session.execute(query)
@@ -67,13 +178,16 @@ async def get_friend_by_name(name: str) -> Friends | None:
         return None
 
 
-async def get_friend_working_days(friend_id: int, start_date: date, end_date: date) -> list[date]:
+@timed("db", query="get_friend_working_days")
+async def get_friend_working_days(
+    friend_id: int, start_date: date, end_date: date, session: AsyncSession | None = None
+) -> list[date]:
     """Получает список рабочих дней друга в заданном диапазоне.
 
     Возвращает список дат (date), когда друг работает (is_working=True).
     """
     try:
-        async with async_session() as session:
+        async with session_scope(session) as session:
             query = (
                 select(WorkDay.date)
                 .where(
@@ -91,13 +205,131 @@ async def get_friend_working_days(friend_id: int, start_date: date, end_date: da
         return []
 
 
-async def get_all_friends() -> list[Friends]:
-    """Получает список всех друзей из базы данных."""
+@timed("db", query="get_working_days_union")
+async def get_working_days_union(
+    start_date: date,
+    end_date: date,
+    friend_ids: list[int] | None = None,
+    session: AsyncSession | None = None,
+) -> list[date]:
+    """Получает объединение рабочих дней друзей в заданном диапазоне одним запросом.
+
+    Возвращает отсортированный список дат, в которые работает хотя бы один из друзей
+    friend_ids (или любой друг, если список не передан).
+    """
+    try:
+        async with session_scope(session) as session:
+            query = (
+                select(WorkDay.date)
+                .where(
+                    WorkDay.is_working.is_(True),
+                    WorkDay.date >= start_date,
+                    WorkDay.date <= end_date,
+                )
+                .group_by(WorkDay.date)
+                .order_by(WorkDay.date)
+            )
+            if friend_ids is not None:
+                query = query.where(WorkDay.user_id.in_(friend_ids))
+            result = await session.execute(query)
+            return list(result.scalars().all())
+    except Exception as e:
+        print(f"Ошибка получения рабочих дней друзей: {e}")
+        return []
+
+
+@timed("db", query="get_all_work_days")
+async def get_all_work_days() -> list[tuple[int, date, bool]] | None:
+    """Получает все записи графика работы в виде (user_id, date, is_working).
+
+    Используется для построения индекса расписаний. В случае ошибки выводит
+    сообщение и возвращает None, чтобы сбой не выглядел как пустой график.
+    """
     try:
         async with async_session() as session:
+            query = select(WorkDay.user_id, WorkDay.date, WorkDay.is_working)
+            result = await session.execute(query)
+            return [tuple(row) for row in result.all()]
+    except Exception as e:
+        print(f"Ошибка получения графиков работы: {e}")
+        return None
+
+
+@timed("db", query="get_all_friends")
+async def get_all_friends(session: AsyncSession | None = None) -> list[Friends]:
+    """Получает список всех друзей из базы данных."""
+    try:
+        async with session_scope(session) as session:
             query = select(Friends).order_by(Friends.name)
             result = await session.execute(query)
             return list(result.scalars().all())
     except Exception as e:
         print(f"Ошибка получения списка друзей: {e}")
         return []
+
+
+@timed("db", query="get_user_spots")
+async def get_user_spots(user_id: int, session: AsyncSession | None = None) -> list[Spots]:
+    """Получает список спотов пользователя, отсортированный по названию."""
+    try:
+        async with session_scope(session) as session:
+            query = select(Spots).where(Spots.user_id == user_id).order_by(Spots.name)
+            result = await session.execute(query)
+            return list(result.scalars().all())
+    except Exception as e:
+        print(f"Ошибка получения спотов пользователя: {e}")
+        return []
+
+
+@timed("db", query="add_spot")
+async def add_spot(
+    user_id: int,
+    name: str,
+    lat: float | None = None,
+    lon: float | None = None,
+    session: AsyncSession | None = None,
+) -> bool:
+    """Добавляет спот пользователю или обновляет координаты спота с тем же названием.
+
+    Возвращает True при успехе. В случае ошибки выводит сообщение об ошибке
+    и возвращает False.
+    """
+    try:
+        async with session_scope(session) as session:
+            query = select(Spots).where(Spots.user_id == user_id, Spots.name == name)
+            spot = (await session.execute(query)).scalar_one_or_none()
+            if spot is None:
+                session.add(Spots(user_id=user_id, name=name, lat=lat, lon=lon))
+            else:
+                spot.lat, spot.lon = lat, lon
+            await session.flush()
+            return True
+    except Exception as e:
+        print(f"Ошибка добавления спота: {e}")
+        return False
+
+
+@timed("db", query="acquire_job_lease")
+async def acquire_job_lease(name: str, owner: str, ttl: float) -> bool:
+    """Берёт или продлевает аренду фоновой задачи name на ttl секунд.
+
+    Аренда достаётся owner, если её нет, она истекла или уже принадлежит owner.
+    Время берётся из часов PostgreSQL, поэтому расхождение часов реплик не мешает.
+    Возвращает True, если задачу выполняет owner. В случае ошибки выводит
+    сообщение об ошибке и возвращает False.
+    """
+    expires_at = func.now() + timedelta(seconds=ttl)
+    stmt = insert(JobLeases).values(name=name, owner=owner, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[JobLeases.name],
+        set_={"owner": owner, "expires_at": expires_at},
+        where=or_(JobLeases.expires_at < func.now(), JobLeases.owner == owner),
+    ).returning(JobLeases.name)
+    try:
+        async with async_session() as session:
+            acquired = (await session.execute(stmt)).scalar_one_or_none() is not None
+            await session.commit()
+            return acquired
+    except Exception as e:
+        print(f"Ошибка получения аренды задачи {name}: {e}")
+        return False
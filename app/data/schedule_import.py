@@ -0,0 +1,138 @@
+import csv
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.data.models import Friends, WorkDay, get_async_engine
+
+IMPORT_CHUNK_SIZE = 5000
+
+
+@dataclass(frozen=True, slots=True)
+class Rotation:
+    """Сменный график работы вида «N через M».
+
+    День anchor — первый рабочий день цикла: on_days рабочих дней,
+    затем off_days выходных, и так далее в обе стороны от anchor.
+    """
+
+    friend_id: int
+    on_days: int
+    off_days: int
+    anchor: date
+
+    def is_working(self, day: date) -> bool:
+        """Возвращает True, если день приходится на рабочую часть цикла."""
+        return (day - self.anchor).days % (self.on_days + self.off_days) < self.on_days
+
+
+def rotation_rows(rotation: Rotation, start_date: date, end_date: date) -> Iterator[dict[str, Any]]:
+    """Генерирует строки графика по ротации для дней из [start_date, end_date)."""
+    day = start_date
+    while day < end_date:
+        yield {"user_id": rotation.friend_id, "date": day, "is_working": rotation.is_working(day)}
+        day += timedelta(days=1)
+
+
+def read_csv_rows(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Читает строки графика из CSV с колонками friend_id, date и необязательной is_working.
+
+    Дата задаётся в формате YYYY-MM-DD, is_working — 1/0, true/false или yes/no
+    (по умолчанию день считается рабочим).
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        for record in csv.DictReader(file):
+            flag = (record.get("is_working") or "1").strip().lower()
+            yield {
+                "user_id": int(record["friend_id"]),
+                "date": date.fromisoformat(record["date"].strip()),
+                "is_working": flag in ("1", "true", "yes", "да"),
+            }
+
+
+def read_ical_rows(path: str | Path, friend_id: int) -> Iterator[dict[str, Any]]:
+    """Читает рабочие дни друга из iCal-файла.
+
+    Каждое событие VEVENT отмечает рабочими дни от DTSTART до DTEND. Для дат
+    (VALUE=DATE) DTEND не включается, как требует RFC 5545. Для событий со временем
+    включается и день DTEND, если событие не заканчивается ровно в полночь, поэтому
+    смена 09:00–18:00 занимает свой день, а ночная смена — оба дня. Событие без DTEND
+    или с DTEND не позже DTSTART занимает один день.
+    """
+    start: date | None = None
+    end: date | None = None
+    with open(path, encoding="utf-8") as file:
+        for raw_line in file:
+            line = raw_line.strip()
+            name, _, value = line.partition(":")
+            field = name.split(";", 1)[0].upper()
+            if line == "BEGIN:VEVENT":
+                start = end = None
+            elif field == "DTSTART":
+                start = _parse_ical_date(value)
+            elif field == "DTEND":
+                end = _parse_ical_date(value)
+                if _has_daytime(value):
+                    end += timedelta(days=1)
+            elif line == "END:VEVENT" and start is not None:
+                day = start
+                while day < max(end or start, start + timedelta(days=1)):
+                    yield {"user_id": friend_id, "date": day, "is_working": True}
+                    day += timedelta(days=1)
+
+
+def _parse_ical_date(value: str) -> date:
+    """Разбирает значение DATE или DATE-TIME из iCal и возвращает дату."""
+    return datetime.strptime(value.strip()[:8], "%Y%m%d").date()
+
+
+def _has_daytime(value: str) -> bool:
+    """Возвращает True для DATE-TIME со временем, отличным от полуночи."""
+    _, _, clock = value.strip().partition("T")
+    return bool(clock) and clock.rstrip("Z")[:6] != "000000"
+
+
+def chunked(rows: Iterable[dict[str, Any]], size: int) -> Iterator[list[dict[str, Any]]]:
+    """Разбивает поток строк на списки не длиннее size."""
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+async def upsert_friends(friends: dict[int, str]) -> None:
+    """Добавляет друзей или обновляет их имена одним запросом."""
+    if not friends:
+        return
+    stmt = insert(Friends).values([{"id": key, "name": name} for key, name in friends.items()])
+    stmt = stmt.on_conflict_do_update(index_elements=[Friends.id], set_={"name": stmt.excluded.name})
+    async with get_async_engine().begin() as conn:
+        await conn.execute(stmt)
+
+
+async def upsert_work_days(
+    rows: Iterable[dict[str, Any]], chunk_size: int = IMPORT_CHUNK_SIZE
+) -> int:
+    """Записывает строки графика пакетами с upsert по (user_id, date).
+
+    Строки читаются потоком и отправляются пачками по chunk_size через executemany
+    в одной транзакции, поэтому повторный импорт идемпотентен и не требует
+    предварительного удаления. Внутри пачки побеждает последняя строка для дня.
+    Возвращает количество записанных строк.
+    """
+    stmt = insert(WorkDay)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_user_date", set_={"is_working": stmt.excluded.is_working}
+    )
+    total = 0
+    async with get_async_engine().begin() as conn:
+        for chunk in chunked(rows, chunk_size):
+            # Повтор (user_id, date) внутри одного INSERT ... ON CONFLICT недопустим
+            chunk = list({(row["user_id"], row["date"]): row for row in chunk}.values())
+            await conn.execute(stmt, chunk)
+            total += len(chunk)
+    return total
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import env_float, env_int
+from app.data.models import Users, WeatherRequests, get_async_engine
+from app.data.request import add_user, save_weather_request
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MAX_SIZE = env_int("WRITE_BEHIND_MAX_SIZE", 1000)
+WRITE_BEHIND_BATCH_SIZE = env_int("WRITE_BEHIND_BATCH_SIZE", 100)
+WRITE_BEHIND_FLUSH_INTERVAL = env_float("WRITE_BEHIND_FLUSH_INTERVAL", 1.0)
+
+
+class WriteBehindQueue:
+    """Очередь отложенной записи истории запросов и новых пользователей.
+
+    Записи буферизуются в памяти и сбрасываются в базу многострочными вставками,
+    когда набирается batch_size записей или проходит flush_interval секунд.
+    При заполнении очереди добавление ждёт освобождения места. При остановке
+    очередь дописывается до конца.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = WRITE_BEHIND_MAX_SIZE,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+    ) -> None:
+        """Создаёт остановленную очередь с заданными порогами сброса."""
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue[tuple[str, dict[str, Any]]] = asyncio.Queue(maxsize)
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        """Возвращает True, если фоновая задача записи запущена."""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Запускает фоновую задачу записи."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дожидается записи всех буферизованных строк и останавливает задачу."""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def put_weather_request(
+        self, user_id: int, forecast_text: str, ai_response: str | None
+    ) -> None:
+        """Ставит запись истории запроса в очередь.
+
+        Если очередь не запущена (например, в скриптах), запись выполняется сразу.
+        """
+        if not self.running:
+            await save_weather_request(user_id, forecast_text, ai_response)
+            return
+        row = {
+            "user_id": user_id,
+            "forecast_text": forecast_text,
+            "ai_response": ai_response,
+            "created_at": datetime.now(UTC),
+        }
+        await self._queue.put(("weather_request", row))
+
+    async def put_user(self, user_id: int, username: str) -> None:
+        """Ставит добавление пользователя в очередь; повторная вставка игнорируется."""
+        if not self.running:
+            await add_user(user_id, username)
+            return
+        await self._queue.put(("user", {"user_id": user_id, "username": username}))
+
+    async def _run(self) -> None:
+        """Собирает пакеты из очереди и сбрасывает их в базу данных."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list[tuple[str, dict[str, Any]]]) -> None:
+        """Записывает пакет; при ошибке делит его пополам, чтобы сохранить исправные строки.
+
+        Одна некорректная строка (например, user_id вне диапазона столбца) не должна
+        терять историю других пользователей: пакет дробится, пока ошибка не
+        останется в отдельных строках, и в лог пишутся только они.
+        """
+        try:
+            await self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                kind, row = batch[0]
+                logger.error(f"Не удалось записать строку {kind} (user_id={row['user_id']}): {e}")
+                return
+            logger.warning(f"Ошибка пакетной записи ({len(batch)} строк), запись частями: {e}")
+            middle = len(batch) // 2
+            await self._flush(batch[:middle])
+            await self._flush(batch[middle:])
+
+    async def _write(self, batch: list[tuple[str, dict[str, Any]]]) -> None:
+        """Записывает пакет одной транзакцией: пользователей, затем историю запросов."""
+        users = [row for kind, row in batch if kind == "user"]
+        requests = [row for kind, row in batch if kind == "weather_request"]
+        async with get_async_engine().begin() as conn:
+            if users:
+                await conn.execute(pg_insert(Users).on_conflict_do_nothing(), users)
+            if requests:
+                await conn.execute(insert(WeatherRequests), requests)
+
+
+write_behind = WriteBehindQueue()
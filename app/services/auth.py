@@ -0,0 +1,39 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import env_float, env_int
+from app.data.request import user_exists
+from app.tools.cache import TTLCache
+
+AUTH_CACHE_TTL = env_float("AUTH_CACHE_TTL", 3600.0)
+AUTH_NEGATIVE_TTL = env_float("AUTH_NEGATIVE_TTL", 60.0)
+AUTH_CACHE_SIZE = env_int("AUTH_CACHE_SIZE", 10000)
+
+authorized_cache = TTLCache(ttl=AUTH_CACHE_TTL, maxsize=AUTH_CACHE_SIZE)
+unauthorized_cache = TTLCache(ttl=AUTH_NEGATIVE_TTL, maxsize=AUTH_CACHE_SIZE)
+
+
+async def is_authorized(user_id: int, session: AsyncSession | None = None) -> bool | None:
+    """Проверяет, зарегистрирован ли пользователь, обращаясь к БД только при промахе кэша.
+
+    Положительные ответы кэшируются на AUTH_CACHE_TTL секунд, отрицательные —
+    на более короткий AUTH_NEGATIVE_TTL, чтобы не опрашивать БД на каждое
+    сообщение незарегистрированного пользователя. Если БД недоступна,
+    возвращает None и ничего не кэширует.
+    """
+    if authorized_cache.get(user_id):
+        return True
+    if unauthorized_cache.get(user_id):
+        return False
+
+    exists = await user_exists(user_id, session)
+    if exists:
+        remember_user(user_id)
+    elif exists is False:
+        unauthorized_cache.set(user_id, True)
+    return exists
+
+
+def remember_user(user_id: int) -> None:
+    """Отмечает пользователя как авторизованного сразу после регистрации."""
+    unauthorized_cache.invalidate(user_id)
+    authorized_cache.set(user_id, True)
@@ -0,0 +1,117 @@
+import logging
+from collections.abc import Iterable
+from datetime import date, timedelta
+
+from app.config import env_float
+from app.data.request import get_all_work_days
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_EPOCH = date(2020, 1, 1)
+
+# Графики пишет импортёр в отдельном процессе (schedule_import), поэтому индекс
+# не узнаёт об изменениях сам и перечитывается из БД с этим интервалом
+SCHEDULE_RELOAD_INTERVAL = env_float("SCHEDULE_RELOAD_INTERVAL", 300.0)
+
+
+class ScheduleIndex:
+    """Индекс рабочих графиков друзей в виде битовых масок по дням.
+
+    Бит с номером n в маске друга означает, что он работает в день
+    SCHEDULE_EPOCH + n. Объединение и пересечение графиков сводятся
+    к побитовым операциям над целыми числами.
+    """
+
+    def __init__(self, epoch: date = SCHEDULE_EPOCH) -> None:
+        """Создаёт пустой индекс с началом отсчёта epoch."""
+        self.epoch = epoch
+        self.loaded = False
+        self._masks: dict[int, int] = {}
+
+    def _offset(self, day: date) -> int:
+        """Возвращает номер бита для даты."""
+        return (day - self.epoch).days
+
+    def clear(self) -> None:
+        """Удаляет все графики из индекса."""
+        self._masks.clear()
+        self.loaded = False
+
+    def set_day(self, friend_id: int, day: date, is_working: bool) -> None:
+        """Отмечает день друга как рабочий или выходной."""
+        offset = self._offset(day)
+        if offset < 0:
+            return
+        mask = self._masks.get(friend_id, 0)
+        if is_working:
+            mask |= 1 << offset
+        else:
+            mask &= ~(1 << offset)
+        self._masks[friend_id] = mask
+
+    def load(self, rows: Iterable[tuple[int, date, bool]]) -> None:
+        """Заполняет индекс записями (user_id, date, is_working)."""
+        self._masks.clear()
+        for friend_id, day, is_working in rows:
+            self.set_day(friend_id, day, bool(is_working))
+        self.loaded = True
+
+    def working_mask(
+        self, start_date: date, days: int, friend_ids: Iterable[int] | None = None
+    ) -> int:
+        """Возвращает маску дней, в которые работает хотя бы один из друзей.
+
+        Бит 0 результата соответствует start_date. Если friend_ids не передан,
+        учитываются все друзья в индексе.
+        """
+        ids = self._masks.keys() if friend_ids is None else friend_ids
+        union = 0
+        for friend_id in ids:
+            union |= self._masks.get(friend_id, 0)
+        offset = self._offset(start_date)
+        window = (1 << days) - 1
+        if offset >= 0:
+            return (union >> offset) & window
+        return (union << -offset) & window
+
+    def working_days(self, friend_id: int, start_date: date, end_date: date) -> list[date]:
+        """Возвращает рабочие дни друга в диапазоне включительно."""
+        days = (end_date - start_date).days + 1
+        return self._expand(start_date, self.working_mask(start_date, days, [friend_id]))
+
+    def common_free_days(
+        self, start_date: date, days: int, friend_ids: Iterable[int] | None = None
+    ) -> list[date]:
+        """Возвращает дни, в которые не работает ни один из указанных друзей."""
+        window = (1 << days) - 1
+        free = ~self.working_mask(start_date, days, friend_ids) & window
+        return self._expand(start_date, free)
+
+    @staticmethod
+    def _expand(start_date: date, mask: int) -> list[date]:
+        """Преобразует маску дней в список дат."""
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(start_date + timedelta(days=low.bit_length() - 1))
+            mask ^= low
+        return result
+
+
+schedule_index = ScheduleIndex()
+
+
+async def load_schedule_index() -> bool:
+    """Загружает все графики работы из базы данных в индекс.
+
+    Если прочитать графики не удалось, индекс остаётся прежним: до первой
+    удачной загрузки loaded равен False и обработчики читают графики из БД.
+    Возвращает True при успешной загрузке.
+    """
+    rows = await get_all_work_days()
+    if rows is None:
+        logger.warning("Индекс графиков не обновлён: ошибка чтения из БД")
+        return False
+    schedule_index.load(rows)
+    logger.info(f"Индекс графиков загружен: {len(rows)} записей")
+    return True
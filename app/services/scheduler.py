@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import random
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class PeriodicJob:
+    """Периодическая фоновая задача планировщика.
+
+    Интервал между запусками случайно смещается на ±jitter от interval,
+    чтобы несколько экземпляров бота не обращались к внешним API одновременно.
+    Если задан guard, задача выполняется, только когда он возвращает True —
+    например, когда реплика получила аренду задачи и остальные её пропускают.
+    """
+
+    name: str
+    func: Callable[[], Awaitable[object]]
+    interval: float
+    jitter: float = 0.1
+    run_immediately: bool = True
+    guard: Callable[[], Awaitable[bool]] | None = None
+
+    def next_delay(self) -> float:
+        """Возвращает паузу до следующего запуска с учётом джиттера."""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def run_once(self) -> bool:
+        """Выполняет задачу, если guard не запрещает запуск.
+
+        Возвращает False, если запуск пропущен. Ошибки задачи логируются
+        и не останавливают планировщик.
+        """
+        if self.guard is not None and not await self.guard():
+            logger.info(f"Задача {self.name} выполняется другим экземпляром, запуск пропущен")
+            return False
+        try:
+            await self.func()
+        except Exception as e:
+            logger.error(f"Ошибка задачи {self.name}: {e}")
+        return True
+
+
+class Scheduler:
+    """Простой планировщик периодических задач поверх asyncio."""
+
+    def __init__(self) -> None:
+        """Создаёт планировщик без задач."""
+        self.jobs: list[PeriodicJob] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def add_job(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[object]],
+        interval: float,
+        jitter: float = 0.1,
+        run_immediately: bool = True,
+        guard: Callable[[], Awaitable[bool]] | None = None,
+    ) -> PeriodicJob:
+        """Регистрирует периодическую задачу."""
+        job = PeriodicJob(name, func, interval, jitter, run_immediately, guard)
+        self.jobs.append(job)
+        return job
+
+    def start(self) -> None:
+        """Запускает циклы всех зарегистрированных задач."""
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job:{job.name}"))
+
+    async def stop(self) -> None:
+        """Останавливает все задачи и дожидается их отмены."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    @staticmethod
+    async def _loop(job: PeriodicJob) -> None:
+        """Запускает задачу с заданным интервалом до отмены."""
+        if not job.run_immediately:
+            await asyncio.sleep(job.next_delay())
+        while True:
+            await job.run_once()
+            await asyncio.sleep(job.next_delay())
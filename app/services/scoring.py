@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any
+
+import numpy as np
+
+from app.config import env_bool, env_float
+from app.services.weather import ForecastSlot
+
+RIDE_MIN_TEMP = env_float("RIDE_MIN_TEMP", 12.0)
+RIDE_MAX_WIND = env_float("RIDE_MAX_WIND", 5.0)
+RIDE_WINDOW_START = 11.0
+RIDE_WINDOW_END = 14.0
+RIDE_DURATION = 1.0
+RIDE_START_STEP = 0.5
+SCORING_ENABLED = env_bool("SCORING_ENABLED", True)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(slots=True, frozen=True)
+class DayScore:
+    """Оценка пригодности дня для катания по правилам из промпта.
+
+    starts — подходящие времена старта, от лучшего к худшему; temp и wind —
+    средняя температура и максимальный ветер для лучшего из рассмотренных стартов.
+    """
+
+    day: date
+    starts: tuple[time, ...]
+    temp: float
+    wind: float
+
+    @property
+    def qualifies(self) -> bool:
+        """Возвращает True, если в дне есть хотя бы одно подходящее время старта."""
+        return bool(self.starts)
+
+
+def comfort(temp: Any, wind: Any) -> Any:
+    """Оценка комфорта старта: выше при большей температуре и меньшем ветре.
+
+    Работает как с числами, так и с массивами NumPy.
+    """
+    return (temp - RIDE_MIN_TEMP) / 10 + (RIDE_MAX_WIND - wind) / RIDE_MAX_WIND
+
+
+def score_forecast(slots: list[ForecastSlot]) -> list[DayScore]:
+    """Оценивает все дни прогноза одной векторной операцией.
+
+    Для каждого дня перебираются старты с шагом RIDE_START_STEP внутри окна
+    RIDE_WINDOW_START–RIDE_WINDOW_END; температура и ветер на протяжении
+    катания линейно интерполируются между трёхчасовыми слотами того же дня.
+    Старт подходит, если температура не ниже RIDE_MIN_TEMP, а ветер не выше
+    RIDE_MAX_WIND всё время катания. Дни, для которых окно не покрыто слотами,
+    не оцениваются.
+    """
+    if not slots:
+        return []
+
+    hours = np.array([(slot.timestamp - _EPOCH).total_seconds() / 3600 for slot in slots])
+    order = np.argsort(hours)
+    hours = hours[order]
+    temps = np.array([slot.temp for slot in slots])[order]
+    winds = np.array([slot.wind for slot in slots])[order]
+    slot_days = np.floor(hours / 24).astype(np.int64)
+
+    days = np.unique(slot_days)
+    offsets = np.arange(RIDE_WINDOW_START, RIDE_WINDOW_END - RIDE_DURATION + 1e-9, RIDE_START_STEP)
+    ride = np.arange(0.0, RIDE_DURATION + 1e-9, RIDE_START_STEP)
+    # Точки (день, старт, момент катания)
+    samples = days[:, None, None] * 24.0 + offsets[None, :, None] + ride[None, None, :]
+
+    left = np.searchsorted(hours, samples, side="right") - 1
+    right = np.searchsorted(hours, samples, side="left")
+    inside = (left >= 0) & (right < len(hours))
+    left = np.clip(left, 0, len(hours) - 1)
+    right = np.clip(right, 0, len(hours) - 1)
+    day_grid = days[:, None, None]
+    covered = inside & (slot_days[left] == day_grid) & (slot_days[right] == day_grid)
+    valid = covered.all(axis=2)
+
+    temp_samples = np.interp(samples, hours, temps)
+    temp_mean = temp_samples.mean(axis=2)
+    wind_max = np.interp(samples, hours, winds).max(axis=2)
+    ok = valid & (temp_samples.min(axis=2) >= RIDE_MIN_TEMP) & (wind_max <= RIDE_MAX_WIND)
+
+    score = np.where(valid, comfort(temp_mean, wind_max), -np.inf)
+    ranking = np.argsort(-score, axis=1, kind="stable")
+
+    result = []
+    for i, day_index in enumerate(days):
+        if not valid[i].any():
+            continue
+        best = ranking[i, 0]
+        starts = tuple(_to_time(offsets[j]) for j in ranking[i] if ok[i, j])
+        result.append(
+            DayScore(
+                day=(_EPOCH + timedelta(days=int(day_index))).date(),
+                starts=starts,
+                temp=round(float(temp_mean[i, best]), 1),
+                wind=round(float(wind_max[i, best]), 1),
+            )
+        )
+    return result
+
+
+def select_rideable(slots: list[ForecastSlot]) -> list[ForecastSlot]:
+    """Оставляет только слоты дней, в которые условия подходят для катания."""
+    if not SCORING_ENABLED:
+        return slots
+    days = {score.day for score in score_forecast(slots) if score.qualifies}
+    return [slot for slot in slots if slot.date in days]
+
+
+def render_no_go(slots: list[ForecastSlot]) -> str:
+    """Формирует ответ без ИИ для случая, когда ни один день не подходит."""
+    lines = [
+        f"- {score.day:%d.%m}: около {score.temp:g}°C, ветер до {score.wind:g} м/с"
+        for score in score_forecast(slots)
+    ]
+    header = (
+        f"В ближайшие дни кататься не получится: в окне 11:00-14:00 нужно "
+        f"от {RIDE_MIN_TEMP:g}°C и ветер до {RIDE_MAX_WIND:g} м/с."
+    )
+    return "\n".join([header, *lines])
+
+
+def render_rideable(slots: list[ForecastSlot]) -> str:
+    """Формирует ответ без ИИ по подходящим дням, когда советник недоступен."""
+    lines = [
+        f"- {score.day:%d.%m}: старт в {score.starts[0]:%H:%M}, около {score.temp:g}°C, "
+        f"ветер до {score.wind:g} м/с"
+        for score in score_forecast(slots)
+        if score.qualifies
+    ]
+    header = "ИИ-советник сейчас недоступен. Подходящие дни по прогнозу:"
+    return "\n".join([header, *lines])
+
+
+def _to_time(offset: float) -> time:
+    """Преобразует смещение в часах от начала суток во время."""
+    minutes = round(offset * 60)
+    return time(minutes // 60, minutes % 60)
+
+
+def describe_best_day(slots: list[ForecastSlot]) -> str:
+    """Кратко описывает лучший день и время старта для сравнения спотов."""
+    best = max(
+        (score for score in score_forecast(slots) if score.qualifies),
+        key=lambda score: comfort(score.temp, score.wind),
+        default=None,
+    )
+    if best is None:
+        return "подходящих дней нет"
+    return (
+        f"{best.day:%d.%m} с {best.starts[0]:%H:%M} "
+        f"(около {best.temp:g}°C, ветер до {best.wind:g} м/с)"
+    )
@@ -1,23 +1,303 @@
+import asyncio
 import logging
-import os
+import sys
+from collections.abc import AsyncIterator, Hashable
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
 from typing import Any
 
 import httpx
-from dotenv import load_dotenv
 
-load_dotenv()
+from app.config import env_float, env_int, env_str
+from app.tools.cache import SingleFlight, TTLCache
+from app.tools.limiter import RateLimiter, RateLimitExceeded, retry_after
+from app.tools.metrics import register_cache, register_gauge, register_stats, timed
+from app.tools.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
-WEATHER_API = os.getenv("WEATHER_API")
+WEATHER_API = env_str("WEATHER_API")
 OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
 
+WEATHER_MAX_CONNECTIONS = env_int("WEATHER_MAX_CONNECTIONS", 20)
+WEATHER_MAX_KEEPALIVE = env_int("WEATHER_MAX_KEEPALIVE", 10)
+WEATHER_KEEPALIVE_EXPIRY = env_float("WEATHER_KEEPALIVE_EXPIRY", 60.0)
+WEATHER_CONNECT_TIMEOUT = env_float("WEATHER_CONNECT_TIMEOUT", 5.0)
+WEATHER_READ_TIMEOUT = env_float("WEATHER_READ_TIMEOUT", 20.0)
+WEATHER_WRITE_TIMEOUT = env_float("WEATHER_WRITE_TIMEOUT", 5.0)
+WEATHER_POOL_TIMEOUT = env_float("WEATHER_POOL_TIMEOUT", 5.0)
+
+# Бесплатный тариф OpenWeatherMap — 60 запросов в минуту
+WEATHER_RATE_LIMIT = env_float("WEATHER_RATE_LIMIT", 1.0)
+WEATHER_RATE_BURST = env_int("WEATHER_RATE_BURST", 5)
+WEATHER_MAX_IN_FLIGHT = env_int("WEATHER_MAX_IN_FLIGHT", 10)
+WEATHER_MAX_WAITING = env_int("WEATHER_MAX_WAITING", 100)
+WEATHER_WAIT_TIMEOUT = env_float("WEATHER_WAIT_TIMEOUT", 10.0)
+
+# Попытка ограничена WEATHER_ATTEMPT_TIMEOUT, все повторы — WEATHER_BUDGET (меньше
+# FORECAST_STAGE_TIMEOUT обработчика /get). Если ответа нет за WEATHER_HEDGE_AFTER
+# секунд, параллельно уходит второй запрос (0 — без хеджирования).
+WEATHER_ATTEMPT_TIMEOUT = env_float("WEATHER_ATTEMPT_TIMEOUT", 6.0)
+WEATHER_BUDGET = env_float("WEATHER_BUDGET", 12.0)
+WEATHER_RETRIES = env_int("WEATHER_RETRIES", 2)
+WEATHER_HEDGE_AFTER = env_float("WEATHER_HEDGE_AFTER", 2.0)
+WEATHER_BREAKER_THRESHOLD = env_int("WEATHER_BREAKER_THRESHOLD", 5)
+WEATHER_BREAKER_RESET = env_float("WEATHER_BREAKER_RESET", 30.0)
+
+DEFAULT_CITY = "Червлённая"
+FORECAST_DAYS = 5
+
+# Споты через ";": "Название" (поиск по городу) или "Название=широта,долгота"
+PADDLE_SPOTS = env_str("PADDLE_SPOTS", DEFAULT_CITY)
+SPOT_CONCURRENCY = env_int("SPOT_CONCURRENCY", 5)
+
+# OpenWeatherMap обновляет 5-дневный прогноз раз в 3 часа
+FORECAST_CACHE_TTL = env_float("FORECAST_CACHE_TTL", 10800.0)
+FORECAST_CACHE_STALE_TTL = env_float("FORECAST_CACHE_STALE_TTL", 10800.0)
+FORECAST_CACHE_SIZE = env_int("FORECAST_CACHE_SIZE", 128)
+# Сколько хранится последний удачный прогноз на случай недоступности API
+FORECAST_FALLBACK_TTL = env_float("FORECAST_FALLBACK_TTL", 86400.0)
+
+# Дневные часы по местному времени места. При шаге прогноза в 3 часа в них всегда
+# есть слоты по обе стороны окна катания 11:00–14:00 (для UTC+3 это 09, 12 и 15)
+FORECAST_HOURS = range(8, 18)
+COMPACT_HEADER = "дата|время|темп,°C|ветер,м/с|влажн,%|условия"
+
+_client: httpx.AsyncClient | None = None
+
+forecast_cache = TTLCache(
+    ttl=FORECAST_CACHE_TTL, maxsize=FORECAST_CACHE_SIZE, stale_ttl=FORECAST_CACHE_STALE_TTL
+)
+forecast_flight = SingleFlight()
+last_good_forecasts = TTLCache(ttl=FORECAST_FALLBACK_TTL, maxsize=FORECAST_CACHE_SIZE)
+weather_limiter = RateLimiter(
+    "openweather",
+    rate=WEATHER_RATE_LIMIT,
+    burst=WEATHER_RATE_BURST,
+    max_in_flight=WEATHER_MAX_IN_FLIGHT,
+    max_waiting=WEATHER_MAX_WAITING,
+    wait_timeout=WEATHER_WAIT_TIMEOUT,
+)
+
+
+def is_retryable_weather_error(error: BaseException) -> bool:
+    """Возвращает True для сбоев, которые имеет смысл повторить: сеть, таймаут, 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError | TimeoutError)
+
+
+weather_policy = ResiliencePolicy(
+    CircuitBreaker(
+        "openweather",
+        failure_threshold=WEATHER_BREAKER_THRESHOLD,
+        reset_timeout=WEATHER_BREAKER_RESET,
+    ),
+    attempt_timeout=WEATHER_ATTEMPT_TIMEOUT,
+    budget=WEATHER_BUDGET,
+    retries=WEATHER_RETRIES,
+    hedge_after=WEATHER_HEDGE_AFTER,
+    is_retryable=is_retryable_weather_error,
+)
+register_cache("forecast", forecast_cache)
+register_gauge("singleflight_in_flight", lambda: len(forecast_flight), name="forecast")
+register_stats("limiter", "openweather", weather_limiter)
+register_stats("breaker", "openweather", weather_policy.breaker)
+
+
+@dataclass(slots=True, frozen=True)
+class ForecastSlot:
+    """Один трёхчасовой слот прогноза погоды.
+
+    Хранит уже разобранные значения, чтобы фильтрация и оценка условий
+    не требовали повторного парсинга строк. timestamp — местное время места прогноза.
+    """
+
+    timestamp: datetime
+    temp: float
+    wind: float
+    humidity: int
+    conditions: str
+
+    @property
+    def date(self) -> date:
+        """Возвращает календарную дату слота."""
+        return self.timestamp.date()
+
+
+Location = str | tuple[float, float]
+
+
+@dataclass(slots=True, frozen=True)
+class Spot:
+    """Именованное место для катания: город для поиска или координаты (lat, lon)."""
+
+    name: str
+    location: Location
+
+
+def parse_spots(value: str) -> list[Spot]:
+    """Разбирает список спотов из строки формата PADDLE_SPOTS.
+
+    Записи с некорректными координатами пропускаются с предупреждением в логе,
+    чтобы опечатка в настройке не мешала запуску бота.
+    """
+    spots = []
+    for item in value.split(";"):
+        name, _, coords = item.partition("=")
+        name = name.strip()
+        if not name:
+            continue
+        if coords:
+            try:
+                lat, lon = (float(part) for part in coords.split(","))
+            except ValueError:
+                logger.warning(f"Пропущен спот с некорректными координатами: {item.strip()}")
+                continue
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                logger.warning(f"Пропущен спот с координатами вне диапазона: {item.strip()}")
+                continue
+            spots.append(Spot(name, (lat, lon)))
+        else:
+            spots.append(Spot(name, name))
+    return spots
+
+
+def location_key(location: Location) -> Hashable:
+    """Возвращает ключ места для кэша и дедупликации.
+
+    Координаты округляются до сотых градуса (около километра), поэтому
+    близкие споты используют один прогноз.
+    """
+    if isinstance(location, tuple):
+        return round(location[0], 2), round(location[1], 2)
+    return location.strip().lower()
+
+
+def render_slot(slot: ForecastSlot) -> str:
+    """Форматирует слот прогноза в текстовый блок для ИИ-советника."""
+    return (
+        f"Дата время: {slot.timestamp:%Y-%m-%d %H:%M:%S}\n"
+        f"Температура: {slot.temp:g}\n"
+        f"Скорость ветра: {slot.wind:g}\n"
+        f"Влажность: {slot.humidity}\n"
+        f"Условия: {slot.conditions}\n"
+    )
+
+
+def render_forecast(slots: list[ForecastSlot]) -> str:
+    """Форматирует список слотов прогноза в единый текст."""
+    return "\n".join(render_slot(slot) for slot in slots)
+
+
+def render_forecast_compact(slots: list[ForecastSlot]) -> str:
+    """Форматирует прогноз таблицей: один заголовок и одна строка на слот."""
+    rows = [
+        f"{slot.timestamp:%Y-%m-%d|%H:%M}|{round(slot.temp, 1):g}|{round(slot.wind, 1):g}"
+        f"|{slot.humidity}|{slot.conditions}"
+        for slot in slots
+    ]
+    return "\n".join([COMPACT_HEADER, *rows])
+
+
+def render_days_compact(slots: list[ForecastSlot]) -> str:
+    """Форматирует прогноз таблицей с одной агрегированной строкой на день.
+
+    Для дня указываются диапазон часов и температур, максимальный ветер,
+    средняя влажность и самые частые условия.
+    """
+    by_day: dict[date, list[ForecastSlot]] = {}
+    for slot in slots:
+        by_day.setdefault(slot.date, []).append(slot)
+
+    rows = []
+    for day, day_slots in by_day.items():
+        temps = [slot.temp for slot in day_slots]
+        conditions = [slot.conditions for slot in day_slots]
+        humidity = round(sum(slot.humidity for slot in day_slots) / len(day_slots))
+        rows.append(
+            f"{day:%Y-%m-%d}|{day_slots[0].timestamp:%H}-{day_slots[-1].timestamp:%H}"
+            f"|{round(min(temps), 1):g}..{round(max(temps), 1):g}"
+            f"|{round(max(slot.wind for slot in day_slots), 1):g}"
+            f"|{humidity}|{max(conditions, key=conditions.count)}"
+        )
+    return "\n".join([COMPACT_HEADER, *rows])
+
+
+def exclude_days(slots: list[ForecastSlot], days: set[date]) -> list[ForecastSlot]:
+    """Возвращает слоты прогноза, не попадающие на указанные даты."""
+    return [slot for slot in slots if slot.date not in days]
+
+
+def create_weather_client(
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> httpx.AsyncClient:
+    """Создаёт HTTP-клиент для OpenWeatherMap с пулом keep-alive соединений.
+
+    Лимиты пула и таймауты по фазам (connect/read/write/pool) берутся из переменных
+    окружения. Параметр transport позволяет подменить сетевой слой, например
+    на httpx.MockTransport в тестах.
+    """
+    return httpx.AsyncClient(
+        base_url=OPENWEATHER_BASE_URL,
+        limits=httpx.Limits(
+            max_connections=WEATHER_MAX_CONNECTIONS,
+            max_keepalive_connections=WEATHER_MAX_KEEPALIVE,
+            keepalive_expiry=WEATHER_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=WEATHER_CONNECT_TIMEOUT,
+            read=WEATHER_READ_TIMEOUT,
+            write=WEATHER_WRITE_TIMEOUT,
+            pool=WEATHER_POOL_TIMEOUT,
+        ),
+        transport=transport,
+    )
+
+
+async def open_weather_client(
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> httpx.AsyncClient:
+    """Открывает общий для приложения HTTP-клиент OpenWeatherMap.
+
+    Если клиент уже открыт, он закрывается и заменяется новым.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = create_weather_client(transport)
+    return _client
+
+
+async def close_weather_client() -> None:
+    """Закрывает общий HTTP-клиент и освобождает соединения пула."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_weather_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент, создавая его при первом обращении.
+
+    Ленивое создание нужно для скриптов, которые не вызывают open_weather_client.
+    """
+    global _client
+    if _client is None:
+        _client = create_weather_client()
+    return _client
+
 
 async def make_weather_request(endpoint: str, params: dict[str, Any]) -> dict[str, Any] | None:
     """Вспомогательная функция для выполнения запросов к OpenWeatherMap API.
 
+    Запрос выполняется по правилам weather_policy: дедлайн на попытку, повторы
+    сетевых сбоев и ответов 5xx в пределах общего бюджета, хеджирование медленной
+    попытки и автомат, который при серии сбоев сразу отклоняет запросы.
+
     Args:
         endpoint: Конечная точка API (например, "weather" или "forecast")
         params: Параметры запроса
@@ -33,43 +313,130 @@ async def make_weather_request(endpoint: str, params: dict[str, Any]) -> dict[st
     params["appid"] = WEATHER_API
     params["lang"] = "ru"
 
-    url = f"{OPENWEATHER_BASE_URL}/{endpoint}"
-
     try:
-        async with httpx.AsyncClient() as client:
-            logger.info(f"Запрос к API: {url}")
-            response = await client.get(url, params=params, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
+        return await weather_policy.call(lambda: send_weather_request(endpoint, params))
+    except CircuitOpenError as e:
+        logger.warning(f"Запрос к API не отправлен: {e}")
+    except RateLimitExceeded as e:
+        logger.warning(f"Запрос к API отклонён лимитером: {e}")
+    except TimeoutError:
+        logger.error("API не ответил за отведённое время")
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP ошибка: {e.response.status_code} - {e.response.text}")
-        return None
     except Exception as e:
         logger.error(f"Ошибка при запросе к API: {str(e)}")
-        return None
+    return None
+
+
+@timed("openweather_request")
+async def send_weather_request(endpoint: str, params: dict[str, Any]) -> dict[str, Any]:
+    """Выполняет одну попытку запроса к OpenWeatherMap и выбрасывает исключение при ошибке.
+
+    Запрос проходит через weather_limiter; если разрешение не получено вовремя,
+    запрос не отправляется. Ответ 429 приостанавливает лимитер на Retry-After.
+    """
+    async with weather_limiter.slot():
+        logger.info(f"Запрос к API: {OPENWEATHER_BASE_URL}/{endpoint}")
+        response = await get_weather_client().get(endpoint, params=params)
+    if response.status_code == 429:
+        weather_limiter.pause(retry_after(response.headers, 60))
+    response.raise_for_status()
+    return response.json()
 
 
-async def get_forecast(city: str, days: int = 3, units: str = "metric") -> str | list[str]:
+async def get_forecast(
+    city: Location, days: int = 3, units: str = "metric"
+) -> str | list[ForecastSlot]:
     """Получить прогноз погоды на несколько дней.
 
+    Результат кэшируется по (city, units, days): свежий прогноз отдаётся из памяти,
+    устаревший — тоже сразу, с фоновым обновлением. Ошибки не кэшируются.
+    Одновременные промахи по одному ключу объединяются в один запрос к API.
+    Если API недоступен, отдаётся последний удачный прогноз не старше
+    FORECAST_FALLBACK_TTL.
+
     Args:
-        city: Название города на русском или английском
+        city: Название города на русском или английском либо координаты (lat, lon)
         days: Количество дней для прогноза (1-5)
         units: Система измерения - "metric" (Цельсий) или "imperial" (Фаренгейт)
 
     Returns:
-        Строка с прогнозом погоды от API
+        Список слотов прогноза или строка с описанием ошибки
 
     """
-    logger.info(f"Запрос прогноза для города: {city} на {days} дней")
+    days = min(max(days, 1), 5)
+    key = (location_key(city), units, days)
+    result = await forecast_cache.get_or_load(
+        key,
+        lambda: forecast_flight.do(key, lambda: fetch_forecast(city, days, units)),
+        should_cache=lambda result: isinstance(result, list),
+    )
+    if not isinstance(result, list):
+        fallback = last_good_forecasts.get(key)
+        if fallback is not None:
+            logger.warning(f"API недоступен, отдаём последний удачный прогноз для {city}")
+            return fallback
+    return result
+
+
+async def refresh_forecast(
+    city: Location, days: int = 3, units: str = "metric"
+) -> str | list[ForecastSlot]:
+    """Принудительно обновляет прогноз в кэше, минуя проверку TTL.
 
+    Используется фоновым планировщиком; ошибка API не вытесняет старую запись.
+    """
     days = min(max(days, 1), 5)
+    key = (location_key(city), units, days)
+    result = await forecast_flight.do(key, lambda: fetch_forecast(city, days, units))
+    if isinstance(result, list):
+        forecast_cache.set(key, result)
+    return result
+
+
+async def iter_spot_forecasts(
+    spots: list[Spot],
+    days: int = FORECAST_DAYS,
+    units: str = "metric",
+    concurrency: int = SPOT_CONCURRENCY,
+) -> AsyncIterator[tuple[Spot, str | list[ForecastSlot]]]:
+    """Получает прогнозы для нескольких спотов и отдаёт их по мере готовности.
+
+    Споты с одинаковым местом (см. location_key) делят один запрос. Одновременно
+    выполняется не больше concurrency запросов через общий HTTP-клиент.
+    """
+    groups: dict[Hashable, list[Spot]] = {}
+    for spot in spots:
+        groups.setdefault(location_key(spot.location), []).append(spot)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(group: list[Spot]) -> tuple[list[Spot], str | list[ForecastSlot]]:
+        async with semaphore:
+            return group, await get_forecast(group[0].location, days, units)
+
+    for next_done in asyncio.as_completed([load(group) for group in groups.values()]):
+        group, result = await next_done
+        for spot in group:
+            yield spot, result
+
+
+async def fetch_forecast(city: Location, days: int, units: str) -> str | list[ForecastSlot]:
+    """Запрашивает прогноз у OpenWeatherMap в обход кэша.
+
+    Оставляет только дневные слоты по местному времени места и возвращает их
+    списком ForecastSlot или строку с ошибкой.
+    """
+    logger.info(f"Запрос прогноза для города: {city} на {days} дней")
 
     params = {
-        "q": city,
         "units": units,
         "cnt": days * 8,
     }
+    if isinstance(city, tuple):
+        params["lat"], params["lon"] = city
+    else:
+        params["q"] = city
 
     data = await make_weather_request("forecast", params)
 
@@ -81,17 +448,32 @@ async def get_forecast(city: str, days: int = 3, units: str = "metric") -> str |
 
     logger.info(f"Успешно получены сырые данные прогноза для {city}")
 
-    times = ["15:00:00", "12:00:00", "09:00:00"]
-    afternoon = [lst for lst in data["list"] if lst["dt_txt"].split()[1] in times]
+    slots = parse_forecast(data["list"], data.get("city", {}).get("timezone", 0))
+    last_good_forecasts.set((location_key(city), units, days), slots)
+    return slots
+
 
+def parse_forecast(items: list[dict[str, Any]], utc_offset: int = 0) -> list[ForecastSlot]:
+    """Преобразует элементы ответа OpenWeatherMap в слоты прогноза.
+
+    dt_txt в ответе указан в UTC, поэтому время сдвигается на utc_offset секунд
+    (city.timezone из ответа) к местному. Оставляет только дневные слоты из
+    FORECAST_HOURS. Описания условий интернируются, так как в кэшированных
+    прогнозах они многократно повторяются.
+    """
+    shift = timedelta(seconds=utc_offset)
     result = []
-    for lst in afternoon:
+    for item in items:
+        timestamp = datetime.strptime(item["dt_txt"], "%Y-%m-%d %H:%M:%S") + shift
+        if timestamp.hour not in FORECAST_HOURS:
+            continue
         result.append(
-            f"Дата время: {lst['dt_txt']}\n"
-            f"Температура: {lst['main']['temp']}\n"
-            f"Скорость ветра: {lst['wind']['speed']}\n"
-            f"Влажность: {lst['main']['humidity']}\n"
-            f"Условия: {lst['weather'][0]['description']}\n"
+            ForecastSlot(
+                timestamp=timestamp,
+                temp=float(item["main"]["temp"]),
+                wind=float(item["wind"]["speed"]),
+                humidity=int(item["main"]["humidity"]),
+                conditions=sys.intern(item["weather"][0]["description"]),
+            )
         )
-
     return result
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Awaitable, Callable, Hashable
+from contextlib import aclosing
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Ограниченный по размеру кэш с временем жизни записей и stale-while-revalidate.
+
+    Запись считается свежей в течение ttl секунд. После этого ещё stale_ttl секунд
+    она отдаётся немедленно, а обновление запускается в фоне. При превышении maxsize
+    вытесняется запись, к которой дольше всего не обращались.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 128,
+        stale_ttl: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Создаёт пустой кэш с заданными временем жизни и размером."""
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._refreshing: dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Возвращает количество записей в кэше."""
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> tuple[Any, float] | None:
+        """Возвращает значение и возраст записи или None, если запись устарела окончательно."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        age = self._clock() - stored_at
+        if age >= self.ttl + self.stale_ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value, age
+
+    def get(self, key: Hashable) -> Any | None:
+        """Возвращает свежее значение по ключу или None, не изменяя счётчики."""
+        found = self._lookup(key)
+        if found is None or found[1] >= self.ttl:
+            return None
+        return found[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохраняет значение и при необходимости вытесняет самые старые записи."""
+        self._data[key] = (value, self._clock())
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Удаляет запись по ключу или очищает весь кэш, если ключ не передан."""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        should_cache: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """Возвращает значение из кэша или загружает его через loader.
+
+        Свежая запись отдаётся сразу. Устаревшая, но ещё допустимая запись тоже
+        отдаётся сразу, а loader запускается в фоне (не более одного обновления
+        на ключ). Результат сохраняется, только если should_cache вернул True.
+        """
+        found = self._lookup(key)
+        if found is not None:
+            value, age = found
+            if age < self.ttl:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._schedule_refresh(key, loader, should_cache)
+            return value
+
+        self.misses += 1
+        value = await loader()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def _schedule_refresh(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        should_cache: Callable[[Any], bool],
+    ) -> None:
+        """Запускает фоновое обновление записи, если оно ещё не выполняется."""
+        if key in self._refreshing:
+            return
+
+        async def refresh() -> None:
+            try:
+                value = await loader()
+                if should_cache(value):
+                    self.set(key, value)
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления кэша для {key}: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def stats(self) -> dict[str, int]:
+        """Возвращает счётчики попаданий, устаревших попаданий и промахов."""
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "size": len(self._data),
+        }
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в одну задачу.
+
+    Пока задача для ключа выполняется, все новые вызовы ожидают её результат,
+    а не запускают собственную. Исключение получают все ожидающие; после
+    завершения ключ освобождается, поэтому ни результат, ни ошибка не кэшируются.
+    """
+
+    def __init__(self) -> None:
+        """Создаёт объект без выполняющихся задач."""
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        """Возвращает количество выполняющихся задач."""
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет func для ключа или присоединяется к уже выполняющемуся вызову.
+
+        Отмена одного из ожидающих не отменяет общую задачу для остальных.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """Удаляет завершённую задачу, если она всё ещё связана с ключом."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+
+class StreamFlight:
+    """Объединяет одновременные потоки с одинаковым ключом в один.
+
+    Первый вызов запускает поток в отдельной задаче и копит его фрагменты;
+    каждый подписчик получает все фрагменты с начала и затем новые по мере
+    появления. Ошибку потока получают все подписчики. Когда уходит последний
+    подписчик, поток отменяется; после завершения ключ освобождается.
+    """
+
+    def __init__(self) -> None:
+        """Создаёт объект без выполняющихся потоков."""
+        self._inflight: dict[Hashable, _SharedStream] = {}
+
+    def __len__(self) -> int:
+        """Возвращает количество выполняющихся потоков."""
+        return len(self._inflight)
+
+    async def stream(
+        self, key: Hashable, func: Callable[[], AsyncGenerator[Any]]
+    ) -> AsyncGenerator[Any]:
+        """Отдаёт фрагменты потока func для ключа, запуская его или присоединяясь к нему."""
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = _SharedStream(func())
+            self._inflight[key] = shared
+            shared.task.add_done_callback(lambda done: self._forget(key, shared))
+
+        shared.subscribers += 1
+        try:
+            index = 0
+            while True:
+                if index < len(shared.chunks):
+                    yield shared.chunks[index]
+                    index += 1
+                elif shared.task.done():
+                    self._forget(key, shared)
+                    shared.task.result()
+                    return
+                else:
+                    await shared.updated.wait()
+        finally:
+            shared.subscribers -= 1
+            if not shared.subscribers and not shared.task.done():
+                self._forget(key, shared)
+                shared.task.cancel()
+
+    def _forget(self, key: Hashable, shared: "_SharedStream") -> None:
+        """Удаляет поток, если он всё ещё связан с ключом."""
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+
+
+class _SharedStream:
+    """Поток, фрагменты которого читают несколько подписчиков StreamFlight."""
+
+    def __init__(self, source: AsyncGenerator[Any]) -> None:
+        """Запускает чтение source в отдельной задаче."""
+        self.chunks: list[Any] = []
+        self.subscribers = 0
+        self.updated = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncGenerator[Any]) -> None:
+        """Читает source до конца и будит подписчиков после каждого фрагмента."""
+        try:
+            async with aclosing(source):
+                async for chunk in source:
+                    self.chunks.append(chunk)
+                    self._notify()
+        finally:
+            self._notify()
+
+    def _notify(self) -> None:
+        """Будит ожидающих подписчиков и готовит событие для следующего фрагмента."""
+        self.updated.set()
+        self.updated = asyncio.Event()
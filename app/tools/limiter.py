@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable, Mapping
+from contextlib import asynccontextmanager
+
+
+class RateLimitExceeded(Exception):
+    """Запрос не получил разрешение лимитера: очередь заполнена или истёк срок ожидания."""
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше burst про запас.
+
+    Каждый запрос забирает один токен. Если токенов нет, запрос ждёт пополнения,
+    поэтому поток запросов выравнивается до rate в секунду, а короткие всплески
+    до burst запросов проходят сразу.
+    """
+
+    def __init__(
+        self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Создаёт полную корзину."""
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self) -> float:
+        """Пополняет корзину по прошедшему времени и возвращает текущее время."""
+        now = self._clock()
+        if now > self._paused_until:
+            start = max(self._updated, self._paused_until)
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = now
+        return now
+
+    def delay(self) -> float:
+        """Возвращает, через сколько секунд появится токен (0 — уже есть)."""
+        now = self._refill()
+        if now < self._paused_until:
+            return self._paused_until - now + max(0.0, 1 - self._tokens) / self.rate
+        return max(0.0, 1 - self._tokens) / self.rate
+
+    def try_take(self) -> bool:
+        """Забирает токен без ожидания; возвращает False, если токена нет."""
+        if self.delay() > 0:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def take(self) -> None:
+        """Ждёт появления токена и забирает его."""
+        while (wait := self.delay()) > 0:
+            await asyncio.sleep(wait)
+        self._tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Опустошает корзину и не пополняет её seconds секунд (например, после 429)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class RateLimiter:
+    """Ограничитель исходящих запросов к одному внешнему сервису.
+
+    Сочетает корзину токенов (частота запросов), семафор (число одновременных
+    запросов) и очередь ожидания. Ожидающие обслуживаются по порядку; если
+    в очереди уже max_waiting запросов или разрешение не получено за
+    wait_timeout секунд, выбрасывается RateLimitExceeded — лишняя нагрузка
+    отсекается сразу, а не копится в виде ошибок 429 и повторов.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int = 1,
+        max_in_flight: int = 10,
+        max_waiting: int = 100,
+        wait_timeout: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Создаёт ограничитель с заданными лимитами."""
+        self.name = name
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.bucket = TokenBucket(rate, burst, clock)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, timeout: float | None = None) -> AsyncIterator[None]:
+        """Ждёт разрешения на запрос и удерживает место среди выполняющихся.
+
+        Токен забирается только после того, как освободилось место, поэтому
+        простаивающие в очереди запросы не расходуют лимит частоты.
+        """
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise RateLimitExceeded(f"{self.name}: очередь ожидания заполнена")
+
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(self.wait_timeout if timeout is None else timeout):
+                await self._semaphore.acquire()
+                try:
+                    async with self._lock:
+                        await self.bucket.take()
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+        except TimeoutError:
+            self.rejected += 1
+            raise RateLimitExceeded(f"{self.name}: истёк срок ожидания разрешения") from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает выдачу разрешений, например по заголовку Retry-After."""
+        self.bucket.pause(seconds)
+
+    def stats(self) -> dict[str, int]:
+        """Возвращает число ожидающих, выполняющихся и отклонённых запросов."""
+        return {"waiting": self.waiting, "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+def retry_after(headers: Mapping[str, str] | None, default: float) -> float:
+    """Читает задержку из заголовка Retry-After (в секундах) или возвращает default."""
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
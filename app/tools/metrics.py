@@ -0,0 +1,281 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from aiohttp import web
+
+from app.config import env_bool, env_int, env_str
+
+METRICS_ENABLED = env_bool("METRICS_ENABLED", False)
+METRICS_HOST = env_str("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = env_int("METRICS_PORT", 9100)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+_runner: web.AppRunner | None = None
+
+
+class Histogram:
+    """Гистограмма наблюдений с фиксированными границами корзин, как в Prometheus."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Создаёт пустую гистограмму."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Добавляет наблюдение."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Хранилище метрик процесса: счётчики, датчики и гистограммы с метками.
+
+    Кроме записанных значений, при выгрузке опрашиваются колбэки коллекторов —
+    так снимаются показатели, которые уже считают другие объекты (кэши, лимитеры).
+    """
+
+    def __init__(self) -> None:
+        """Создаёт пустое хранилище."""
+        self.help: dict[str, tuple[str, str]] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.collectors: list[Callable[[], Iterator[tuple[str, dict[str, str], float]]]] = []
+
+    def describe(self, name: str, kind: str, text: str) -> None:
+        """Задаёт тип и описание метрики для выгрузки."""
+        self.help[name] = (kind, text)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """Увеличивает счётчик."""
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def add_gauge(self, name: str, value: float, **labels: str) -> None:
+        """Изменяет датчик на value (может быть отрицательным)."""
+        key = (name, tuple(sorted(labels.items())))
+        self.gauges[key] = self.gauges.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Добавляет наблюдение в гистограмму."""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def render(self) -> str:
+        """Выгружает все метрики в текстовом формате Prometheus."""
+        lines: list[str] = []
+        described: set[str] = set()
+
+        def header(name: str, kind: str) -> None:
+            if name not in described:
+                described.add(name)
+                text = self.help.get(name, (kind, name))[1]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        gauges = dict(self.gauges)
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                gauges[(name, tuple(sorted(labels.items())))] = value
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, "histogram")
+            bounds = [f"{bound:g}" for bound in histogram.buckets] + ["+Inf"]
+            cumulative = 0
+            for bound, count in zip(bounds, histogram.counts, strict=True):
+                cumulative += count
+                bucket_labels = (*labels, ("le", bound))
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    """Форматирует метки в виде {key="value",...}."""
+    if not labels:
+        return ""
+    escaped = (
+        key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = Registry()
+registry.describe("stage_duration_seconds", "histogram", "Длительность этапов обработки")
+registry.describe("stage_errors_total", "counter", "Число этапов, завершившихся исключением")
+registry.describe("stage_in_flight", "gauge", "Число выполняющихся этапов")
+registry.describe("cache_hit_ratio", "gauge", "Доля попаданий в кэш (включая устаревшие)")
+
+
+@contextmanager
+def _measure(stage: str, labels: dict[str, str]) -> Iterator[None]:
+    """Замеряет длительность блока и учитывает его среди выполняющихся."""
+    registry.add_gauge("stage_in_flight", 1, stage=stage, **labels)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.inc("stage_errors_total", stage=stage, **labels)
+        raise
+    finally:
+        registry.observe(
+            "stage_duration_seconds", time.perf_counter() - start, stage=stage, **labels
+        )
+        registry.add_gauge("stage_in_flight", -1, stage=stage, **labels)
+
+
+def timed(stage: str, **labels: str) -> Any:
+    """Замеряет этап; используется как контекстный менеджер или как декоратор.
+
+    Пишет гистограмму stage_duration_seconds, счётчик ошибок и датчик stage_in_flight
+    с метками stage и labels. Если METRICS_ENABLED выключен, декоратор возвращает
+    функцию без изменений, а контекстный менеджер ничего не делает.
+    """
+    if not METRICS_ENABLED:
+        return _DISABLED
+    return _Timer(stage, labels)
+
+
+class _Timer:
+    """Контекстный менеджер и декоратор для timed при включённых метриках."""
+
+    __slots__ = ("stage", "labels", "_context")
+
+    def __init__(self, stage: str, labels: dict[str, str]) -> None:
+        """Запоминает этап и метки."""
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        """Начинает замер."""
+        self._context = _measure(self.stage, self.labels)
+        self._context.__enter__()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Завершает замер."""
+        self._context.__exit__(*exc_info)
+
+    def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Оборачивает функцию (обычную или асинхронную) замером."""
+        stage, labels = self.stage, self.labels
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with _measure(stage, labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _measure(stage, labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+class _Disabled:
+    """Пустая замена _Timer при выключенных метриках."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        """Ничего не делает."""
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Ничего не делает."""
+
+    def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Возвращает функцию без изменений."""
+        return func
+
+
+_DISABLED = _Disabled()
+
+
+def increment(name: str, value: float = 1.0, **labels: str) -> None:
+    """Увеличивает счётчик, если метрики включены."""
+    if METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def register_cache(name: str, cache: Any) -> None:
+    """Выгружает счётчики кэша с методом stats() и долю попаданий в него."""
+
+    def collect() -> Iterator[tuple[str, dict[str, str], float]]:
+        stats = cache.stats()
+        for key, value in stats.items():
+            yield f"cache_{key}", {"cache": name}, value
+        hits = stats.get("hits", 0) + stats.get("stale_hits", 0)
+        total = hits + stats.get("misses", 0)
+        yield "cache_hit_ratio", {"cache": name}, hits / total if total else 0.0
+
+    registry.collectors.append(collect)
+
+
+def register_gauge(metric: str, func: Callable[[], float], **labels: str) -> None:
+    """Выгружает значение func() как датчик metric на момент запроса метрик."""
+
+    def collect() -> Iterator[tuple[str, dict[str, str], float]]:
+        yield metric, labels, func()
+
+    registry.collectors.append(collect)
+
+
+def register_stats(prefix: str, name: str, source: Any) -> None:
+    """Выгружает значения stats() произвольного объекта (например, лимитера) как датчики."""
+
+    def collect() -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, value in source.stats().items():
+            yield f"{prefix}_{key}", {"name": name}, value
+
+    registry.collectors.append(collect)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Отдаёт метрики в текстовом формате Prometheus."""
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(port: int = METRICS_PORT) -> None:
+    """Запускает локальный HTTP-эндпоинт /metrics, если метрики включены."""
+    global _runner
+    if not METRICS_ENABLED or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, METRICS_HOST, port).start()
+
+
+async def stop_metrics_server() -> None:
+    """Останавливает эндпоинт /metrics."""
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
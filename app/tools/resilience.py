@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Вызов не выполнен: автомат разомкнут после серии сбоев внешнего сервиса."""
+
+
+class CircuitBreaker:
+    """Автомат защиты внешнего сервиса.
+
+    После failure_threshold сбоев подряд размыкается и reset_timeout секунд
+    сразу отклоняет вызовы. Затем пропускает один пробный вызов: успех
+    замыкает автомат, сбой снова размыкает его.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Создаёт замкнутый автомат."""
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_started: float | None = None
+
+    @property
+    def state(self) -> str:
+        """Возвращает состояние: closed, open или half_open."""
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> None:
+        """Пропускает вызов или выбрасывает CircuitOpenError.
+
+        Пробный вызов, не завершившийся за reset_timeout (например, отменённый),
+        не блокирует автомат: после этого пропускается следующий.
+        """
+        state = self.state
+        now = self._clock()
+        probing = self._probe_started is not None and now - self._probe_started < self.reset_timeout
+        if state == "open" or (state == "half_open" and probing):
+            raise CircuitOpenError(f"{self.name}: сервис временно недоступен")
+        if state == "half_open":
+            self._probe_started = now
+
+    def record_success(self) -> None:
+        """Отмечает успешный вызов и замыкает автомат."""
+        if self.opened_at is not None:
+            logger.info(f"Автомат {self.name} замкнут")
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        """Отмечает сбой; при достижении порога размыкает автомат."""
+        self.failures += 1
+        self._probe_started = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Автомат {self.name} разомкнут после {self.failures} сбоев")
+            self.opened_at = self._clock()
+
+    def record_ignored(self) -> None:
+        """Отмечает вызов, ничего не говорящий о здоровье сервиса, и снимает пробу."""
+        self._probe_started = None
+
+    def stats(self) -> dict[str, int]:
+        """Возвращает число сбоев подряд и признак разомкнутого автомата."""
+        return {"failures": self.failures, "open": int(self.state == "open")}
+
+
+class ResiliencePolicy:
+    """Политика вызова внешнего сервиса: дедлайны, повторы, хеджирование и автомат.
+
+    Каждая попытка ограничена attempt_timeout секундами, все попытки вместе —
+    бюджетом budget. Между попытками выдерживается пауза со случайным разбросом
+    (full jitter) от 0 до backoff * 2**номер, но не дольше остатка бюджета.
+    Если попытка не завершилась за hedge_after секунд, параллельно отправляется
+    второй запрос и берётся первый успешный ответ (0 — без хеджирования).
+    Ошибки, для которых is_retryable возвращает False, не повторяются и не
+    считаются сбоем сервиса.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        attempt_timeout: float,
+        budget: float,
+        retries: int = 2,
+        backoff: float = 0.2,
+        hedge_after: float = 0.0,
+        is_retryable: Callable[[BaseException], bool] = lambda error: True,
+    ) -> None:
+        """Создаёт политику с заданными лимитами."""
+        self.breaker = breaker
+        self.attempt_timeout = attempt_timeout
+        self.budget = budget
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self.is_retryable = is_retryable
+
+    def record(self, error: BaseException | None) -> None:
+        """Учитывает исход вызова в автомате: успех, сбой сервиса или ошибку запроса.
+
+        Нужен и для вызовов в обход call, например потоковых ответов.
+        """
+        if error is None:
+            self.breaker.record_success()
+        elif self.is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_ignored()
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Вызывает func по правилам политики и возвращает результат первой удачной попытки.
+
+        Выбрасывает CircuitOpenError, если автомат разомкнут, TimeoutError, если
+        исчерпан бюджет, или последнюю ошибку попытки.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        for attempt in range(self.retries + 1):
+            self.breaker.allow()
+            try:
+                result = await self._hedged(func, deadline)
+            except Exception as e:
+                self.record(e)
+                if not self.is_retryable(e):
+                    raise
+                delay = random.uniform(0, self.backoff * 2**attempt)
+                if attempt == self.retries or loop.time() + delay >= deadline:
+                    raise
+                logger.warning(
+                    f"{self.breaker.name}: попытка {attempt + 1} не удалась ({e!r}), "
+                    f"повтор через {delay:.2f} с"
+                )
+                await asyncio.sleep(delay)
+            else:
+                self.record(None)
+                return result
+
+    async def _hedged(self, func: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        """Выполняет попытку, при задержке дублируя запрос, и отдаёт первый успешный ответ.
+
+        Каждый запрос ограничен attempt_timeout, но не дольше общего дедлайна.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def attempt() -> Any:
+            async with asyncio.timeout_at(min(loop.time() + self.attempt_timeout, deadline)):
+                return await func()
+
+        tasks = {asyncio.create_task(attempt())}
+        try:
+            if self.hedge_after > 0 and loop.time() + self.hedge_after < deadline:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+                if not done:
+                    tasks.add(asyncio.create_task(attempt()))
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                failed = [task for task in done if task.exception() is not None]
+                if len(failed) < len(done):
+                    return next(task for task in done if task not in failed).result()
+                if not tasks:
+                    raise failed[0].exception()
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -1,6 +1,10 @@
 import hashlib
+import math
 import re
 
+# Консервативная оценка для смешанного русского текста и таблиц
+CHARS_PER_TOKEN = 3.0
+
 
 def hash_password(password: str) -> str:
     """Хэширует пароль с использованием алгоритма SHA-256.
@@ -19,3 +23,12 @@ def clean_text(text: str) -> str:
     """
     cleaned_text = re.sub(r"(\*\*|\*|###|##|#)", "", text)
     return cleaned_text
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубо оценивает число токенов в тексте для модели ИИ.
+
+    Использует среднее число символов на токен без загрузки токенизатора;
+    для кириллицы оценка получается с запасом.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
@@ -0,0 +1 @@
+"""Сквозные бенчмарки бота с локальными подменами внешних сервисов."""
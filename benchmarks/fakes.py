@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import random
+from collections.abc import AsyncGenerator, AsyncIterator
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Chat, Message
+
+ADVICE_TEXT = (
+    "В понедельник - отличный день! Начинай в 11:30, будет около 18°C и почти нет ветра. "
+    "Во вторник тоже неплохо, но лучше начать в 12:00, когда станет теплее. "
+    "В среду с утра прохладно, рекомендую начать в 12:30."
+)
+
+
+def weather_transport(latency: float, vary: bool = False) -> httpx.MockTransport:
+    """Подменяет OpenWeatherMap: отвечает 5-дневным прогнозом через latency секунд.
+
+    Прогноз начинается с текущих суток и подходит под правила катания. С vary
+    температура слегка меняется от запроса к запросу, чтобы промпты различались.
+    """
+    rng = random.Random(0)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        shift = rng.uniform(-1, 1) if vary else 0.0
+        items = []
+        for step in range(int(request.url.params.get("cnt", "40"))):
+            moment = start + timedelta(hours=3 * step)
+            items.append(
+                {
+                    "dt_txt": moment.strftime("%Y-%m-%d %H:%M:%S"),
+                    "main": {"temp": round(14 + moment.hour / 3 + shift, 1), "humidity": 55},
+                    "wind": {"speed": 2.5 + (step % 3) * 0.5},
+                    "weather": [{"description": "ясно"}],
+                }
+            )
+        return httpx.Response(200, json={"cod": "200", "list": items})
+
+    return httpx.MockTransport(handler)
+
+
+class FakeCompletions:
+    """Подмена chat.completions клиента AsyncOpenAI с настраиваемой задержкой.
+
+    Обычный вызов отвечает через latency секунд. Потоковый отдаёт первый фрагмент
+    через latency секунд, а остальные — через chunk_delay секунд друг за другом.
+    """
+
+    def __init__(self, latency: float, chunk_delay: float) -> None:
+        """Создаёт подмену с заданными задержками."""
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    async def create(self, messages: list[Any], stream: bool = False, **kwargs: Any) -> Any:
+        """Возвращает ответ в форме объектов openai: целиком или потоком фрагментов."""
+        self.calls += 1
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=ADVICE_TEXT))],
+            usage=SimpleNamespace(prompt_tokens=400, completion_tokens=120),
+        )
+
+    async def _stream(self) -> AsyncIterator[Any]:
+        """Отдаёт ответ по словам, как потоковый ответ модели."""
+        await asyncio.sleep(self.latency)
+        for index, word in enumerate(ADVICE_TEXT.split(" ")):
+            if index:
+                await asyncio.sleep(self.chunk_delay)
+            delta = SimpleNamespace(content=word + " ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class FakeAsyncOpenAI:
+    """Минимальная подмена AsyncOpenAI: только client.chat.completions.create."""
+
+    def __init__(self, latency: float, chunk_delay: float = 0.02) -> None:
+        """Создаёт клиента с заданными задержками ответа."""
+        self.completions = FakeCompletions(latency, chunk_delay)
+        self.chat = SimpleNamespace(completions=self.completions)
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия Bot API без сети: каждый вызов занимает latency секунд и возвращает сообщение."""
+
+    def __init__(self, latency: float) -> None:
+        """Создаёт сессию с задержкой ответа Telegram."""
+        super().__init__()
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None = None
+    ) -> TelegramType:
+        """Имитирует вызов метода Bot API."""
+        await asyncio.sleep(self.latency)
+        name = method.__api_method__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        chat_id = getattr(method, "chat_id", None) or 0
+        message = Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            text=getattr(method, "text", None),
+        )
+        return message.as_(bot)
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes]:
+        """Скачивание файлов в бенчмарке не используется."""
+        yield b""
+
+    async def close(self) -> None:
+        """Закрывать нечего."""
@@ -0,0 +1,268 @@
+"""Сквозной бенчмарк обработки апдейтов без внешних сервисов.
+
+Прогоняет синтетические апдейты /get, /get <друг> и /meet через настоящий
+диспетчер (middleware, обработчики, кэши, БД) с заданной параллельностью.
+OpenWeatherMap, модель ИИ и Telegram Bot API заменены локальными подменами
+с настраиваемыми задержками (benchmarks/fakes.py). Нужна локальная PostgreSQL
+в DATABASE_URL — используйте отдельную базу: бенчмарк создаёт таблицы
+и добавляет в них пользователей, друзей и историю запросов.
+
+Пример:
+    python -m benchmarks.run --scenario mix --updates 500 --concurrency 50 --save-baseline main
+    python -m benchmarks.run --scenario mix --updates 500 --concurrency 50 --compare main
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+
+SCENARIOS = {
+    "get": ["/get"],
+    "get-friend": ["/get Arbi", "/get Zelim"],
+    "meet": ["/meet"],
+    "mix": ["/get", "/get Arbi", "/meet", "/get Zelim"],
+}
+
+FRIENDS = {1: "Arbi", 2: "Zelim"}
+
+
+def parse_args() -> argparse.Namespace:
+    """Разбирает аргументы командной строки бенчмарка."""
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк обработки апдейтов.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mix")
+    parser.add_argument("--updates", type=int, default=200, help="сколько апдейтов отправить")
+    parser.add_argument("--concurrency", type=int, default=20, help="апдейтов одновременно")
+    parser.add_argument("--users", type=int, default=100, help="разных пользователей")
+    parser.add_argument("--weather-latency", type=float, default=0.15, help="секунды")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="секунды до ответа")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.02, help="между фрагментами")
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="секунды")
+    parser.add_argument("--streaming", action="store_true", help="потоковые ответы ИИ")
+    parser.add_argument(
+        "--cold", action="store_true", help="без кэшей прогноза и советов: каждый запрос идёт в API"
+    )
+    parser.add_argument(
+        "--respect-limits", action="store_true", help="не снимать лимиты частоты и троттлинг"
+    )
+    parser.add_argument("--no-index", action="store_true", help="графики только из БД")
+    parser.add_argument("--save-baseline", metavar="NAME", help="сохранить результат как базу")
+    parser.add_argument("--compare", metavar="NAME", help="сравнить с сохранённой базой")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="допустимое ухудшение, доля (0.10 = 10%%)"
+    )
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Задаёт настройки приложения до импорта его модулей."""
+    os.environ["AI_STREAMING"] = "true" if args.streaming else "false"
+    os.environ.setdefault("FSM_STORAGE", "memory")
+    os.environ.setdefault("WEATHER_API", "benchmark")
+    os.environ.setdefault("AI_TOKEN_POLZA", "benchmark")
+    os.environ["STREAM_EDIT_INTERVAL"] = os.environ.get("STREAM_EDIT_INTERVAL", "0.2")
+    if not args.respect_limits:
+        unlimited = {
+            "THROTTLE_RATE": "1000000",
+            "THROTTLE_BURST": "1000000",
+            "WEATHER_RATE_LIMIT": "1000000",
+            "WEATHER_RATE_BURST": "1000000",
+            "WEATHER_MAX_IN_FLIGHT": "1000000",
+            "WEATHER_MAX_WAITING": "1000000",
+            "AI_RATE_LIMIT": "1000000",
+            "AI_RATE_BURST": "1000000",
+            "AI_MAX_IN_FLIGHT": "1000000",
+            "AI_MAX_WAITING": "1000000",
+        }
+        os.environ.update(unlimited)
+    if args.cold:
+        os.environ["FORECAST_CACHE_TTL"] = "0"
+        os.environ["FORECAST_CACHE_STALE_TTL"] = "0"
+        os.environ["ADVICE_CACHE_TTL"] = "0"
+
+
+def percentile(values: list[float], q: int) -> float:
+    """Возвращает q-й процентиль (1..99) выборки."""
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int) -> dict[str, float]:
+    """Сводит задержки апдейтов в процентили (мс) и пропускную способность."""
+    ordered = sorted(latencies)
+    return {
+        "updates": len(latencies),
+        "errors": errors,
+        "updates_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any], threshold: float) -> bool:
+    """Печатает изменения относительно базы; возвращает True, если есть регрессия."""
+    regressed = False
+    print(f"\nСравнение с базой от {baseline['created_at']} ({baseline['config']}):")
+    for metric, higher_is_better in (
+        ("updates_per_second", True),
+        ("p50_ms", False),
+        ("p95_ms", False),
+        ("p99_ms", False),
+    ):
+        old, new = baseline["results"][metric], result["results"][metric]
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        mark = "РЕГРЕССИЯ" if worse > threshold else "ок"
+        regressed |= worse > threshold
+        print(f"  {metric:>20}: {old:>10} -> {new:>10} ({change:+.1%}) {mark}")
+    return regressed
+
+
+async def seed_database(users: int) -> None:
+    """Создаёт таблицы, пользователей бенчмарка и графики друзей на ближайшие дни."""
+    from sqlalchemy.dialects.postgresql import insert
+
+    from app.data.models import Users, get_async_engine, init_models
+    from app.data.schedule_import import (
+        Rotation,
+        rotation_rows,
+        upsert_friends,
+        upsert_work_days,
+    )
+
+    await init_models()
+    async with get_async_engine().begin() as conn:
+        rows = [{"user_id": user_id, "username": "bench"} for user_id in range(1, users + 1)]
+        await conn.execute(insert(Users).on_conflict_do_nothing(), rows)
+    await upsert_friends(FRIENDS)
+    today = date.today()
+    rotations = [
+        Rotation(friend_id=1, on_days=2, off_days=2, anchor=today),
+        Rotation(friend_id=2, on_days=2, off_days=2, anchor=today + timedelta(days=1)),
+    ]
+    for rotation in rotations:
+        await upsert_work_days(
+            rotation_rows(rotation, today - timedelta(days=7), today + timedelta(days=30))
+        )
+
+
+def build_update(update_id: int, user_id: int, text: str) -> Any:
+    """Собирает синтетический апдейт с командой от пользователя."""
+    from aiogram.types import Chat, Message, Update, User
+
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=user_id, is_bot=False, first_name="bench"),
+            text=text,
+        ),
+    )
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    """Готовит подмены и базу, прогоняет апдейты и возвращает результат."""
+    from aiogram import Bot
+
+    import app.core.weather_advisor as weather_advisor
+    from app.core.runtime import create_dispatcher
+    from app.data.models import dispose_engine
+    from app.data.writer import write_behind
+    from app.services.schedule import load_schedule_index
+    from app.services.weather import close_weather_client, open_weather_client
+    from benchmarks.fakes import FakeAsyncOpenAI, FakeTelegramSession, weather_transport
+
+    await seed_database(args.users)
+    if not args.no_index:
+        await load_schedule_index()
+    await open_weather_client(weather_transport(args.weather_latency, vary=args.cold))
+    llm = FakeAsyncOpenAI(args.llm_latency, args.llm_chunk_delay)
+    weather_advisor.set_ai_client(llm)
+    session = FakeTelegramSession(args.telegram_latency)
+    bot = Bot(token="42:benchmark", session=session)
+    dp = create_dispatcher()
+    write_behind.start()
+
+    commands = SCENARIOS[args.scenario]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def feed(index: int) -> None:
+        nonlocal errors
+        update = build_update(index + 1, index % args.users + 1, commands[index % len(commands)])
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors += 1
+                print(f"Ошибка обработки апдейта {index + 1}: {e}", file=sys.stderr)
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(feed(index) for index in range(args.updates)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await write_behind.stop()
+        await close_weather_client()
+        await dispose_engine()
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "scenario": args.scenario,
+            "updates": args.updates,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "weather_latency": args.weather_latency,
+            "llm_latency": args.llm_latency,
+            "telegram_latency": args.telegram_latency,
+            "streaming": args.streaming,
+            "cold": args.cold,
+            "respect_limits": args.respect_limits,
+            "schedule_index": not args.no_index,
+        },
+        "results": summarize(latencies, elapsed, errors),
+        "upstream_calls": {"llm": llm.completions.calls, "telegram": session.calls},
+    }
+
+
+def main() -> None:
+    """Запускает бенчмарк, печатает результат, сохраняет и сравнивает базы."""
+    args = parse_args()
+    configure_environment(args)
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        path = BASELINES_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"База сохранена в {path}")
+
+    if args.compare:
+        path = BASELINES_DIR / f"{args.compare}.json"
+        baseline = json.loads(path.read_text(encoding="utf-8"))
+        if baseline["config"] != result["config"]:
+            print("Внимание: параметры запуска отличаются от базы, сравнение условное.")
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,80 @@
+import argparse
 import asyncio
-from datetime import date, timedelta
+from datetime import date
+from itertools import chain
+
+from app.data.models import init_models
+from app.data.schedule_import import (
+    IMPORT_CHUNK_SIZE,
+    Rotation,
+    read_csv_rows,
+    read_ical_rows,
+    rotation_rows,
+    upsert_friends,
+    upsert_work_days,
+)
+
+FRIENDS = {1: "Arbi", 2: "Zelim"}
+
+# Графики «2 через 2»: первый рабочий день цикла для каждого друга
+ROTATIONS = [
+    Rotation(friend_id=1, on_days=2, off_days=2, anchor=date(2026, 2, 24)),  # Arbi
+    Rotation(friend_id=2, on_days=2, off_days=2, anchor=date(2026, 2, 23)),  # Zelim
+]
+
+
+def parse_args() -> argparse.Namespace:
+    """Разбирает аргументы командной строки для импорта графиков."""
+    parser = argparse.ArgumentParser(description="Импорт графиков работы друзей в базу данных.")
+    parser.add_argument(
+        "--until",
+        type=date.fromisoformat,
+        default=date(2026, 5, 1),
+        help="дата (не включительно), до которой генерируются ротации, YYYY-MM-DD",
+    )
+    parser.add_argument("--csv", help="CSV-файл с колонками friend_id,date[,is_working]")
+    parser.add_argument("--ical", help="iCal-файл с рабочими днями друга")
+    parser.add_argument("--friend-id", type=int, help="id друга для --ical")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument(
+        "--no-rotations", action="store_true", help="не генерировать встроенные ротации"
+    )
+    args = parser.parse_args()
+    if args.ical and args.friend_id is None:
+        parser.error("--ical требует --friend-id")
+    return args
 
-from sqlalchemy import delete
 
-from app.data.models import Friends, WorkDay, async_session, init_models
+async def main() -> None:
+    """Заполняет базу данных друзьями и их графиками работы.
 
+    Ротации, CSV и iCal читаются потоком и записываются пакетным upsert,
+    поэтому повторный запуск обновляет график без предварительной очистки.
+    """
+    args = parse_args()
 
-async def main() -> None:
-    """Заполняет базу данных начальными значениями для друзей и графиком работы."""
     print("Инициализация таблиц...")
     await init_models()
 
-    async with async_session() as session:
-        print("Добавление пользователей...")
-        # 1. Добавляем друзей
-        arbi = Friends(id=1, name="Arbi")
-        zelim = Friends(id=2, name="Zelim")
-
-        # Используем merge, чтобы избежать ошибки уникальности, если скрипт запустить дважды
-        await session.merge(arbi)
-        await session.merge(zelim)
-
-        print("Очистка старых графиков...")
-        await session.execute(delete(WorkDay).where(WorkDay.user_id.in_([1, 2])))
-
-        print("Генерация рабочего графика для Arbi...")
-        # 2. Генерируем график работы для Арби (2 через 2)
-        start_date = date(2026, 2, 24)
-        end_date = date(2026, 5, 1)  # Заполняем до мая
-
-        current_date = start_date
-        working = True
-        days_in_state = 0
-
-        while current_date < end_date:
-            work_day = WorkDay(
-                user_id=1,  # Arbi
-                date=current_date,
-                is_working=working,
-            )
-            session.add(work_day)
-
-            days_in_state += 1
-            if days_in_state == 2:
-                working = not working
-                days_in_state = 0
-
-            current_date += timedelta(days=1)
-
-        print("Генерация рабочего графика для Zelim...")
-        # 3. Генерируем график работы для Zelim (2 через 2)
-        start_date_zelim = date(2026, 2, 23)
-
-        current_date = start_date_zelim
-        working = True
-        days_in_state = 0
-
-        while current_date < end_date:
-            work_day = WorkDay(
-                user_id=2,  # Zelim
-                date=current_date,
-                is_working=working,
-            )
-            session.add(work_day)
-
-            days_in_state += 1
-            if days_in_state == 2:
-                working = not working
-                days_in_state = 0
-
-            current_date += timedelta(days=1)
-
-        try:
-            await session.commit()
-            print("Данные успешно добавлены в базу данных!")
-        except Exception as e:
-            await session.rollback()
-            print(f"Ошибка при добавлении данных (возможно, график уже заполнен): {e}")
+    print("Добавление пользователей...")
+    await upsert_friends(FRIENDS)
+
+    sources = []
+    if not args.no_rotations:
+        sources.extend(
+            rotation_rows(rotation, rotation.anchor, args.until) for rotation in ROTATIONS
+        )
+    if args.csv:
+        sources.append(read_csv_rows(args.csv))
+    if args.ical:
+        sources.append(read_ical_rows(args.ical, args.friend_id))
+
+    print("Загрузка графиков работы...")
+    try:
+        total = await upsert_work_days(chain.from_iterable(sources), args.chunk_size)
+        print(f"Данные успешно добавлены в базу данных! Записано строк: {total}")
+    except Exception as e:
+        print(f"Ошибка при добавлении данных: {e}")
 
 
 if __name__ == "__main__":
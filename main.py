@@ -1,27 +1,45 @@
 import asyncio
-import os
-
-from aiogram import Bot, Dispatcher
-from dotenv import load_dotenv
-
-from app.core.handlers import router
-from app.data.models import init_models
-
-load_dotenv()
-
-TG_TOKEN = os.getenv("TG_TOKEN")
+import time
 
 
 async def main() -> None:
     """Основная асинхронная функция запуска бота и планировщика.
 
-    Также запускает функцию init_models.
+    Готовит общие ресурсы (БД, индекс графиков, HTTP-клиент погоды, очередь
+    отложенной записи, планировщик предрасчёта) и получает апдейты long polling
+    или вебхуком, в зависимости от BOT_MODE. В режиме вебхука с WEBHOOK_WORKERS > 1
+    апдейты распределяются по рабочим процессам по chat_id. При остановке
+    освобождает ресурсы. Модули приложения импортируются здесь, чтобы время
+    импорта попало в отчёт о запуске.
     """
-    bot = Bot(token=TG_TOKEN)
-    dp = Dispatcher()
-    dp.include_router(router)
-    await init_models()
-    await dp.start_polling(bot)
+    started = time.perf_counter()
+    from app.core.runtime import (
+        StartupReport,
+        create_bot,
+        create_dispatcher,
+        start_services,
+        stop_services,
+    )
+    from app.core.sharding import WEBHOOK_WORKERS, run_sharded_webhook
+    from app.core.webhook import BOT_MODE, run_webhook
+
+    report = StartupReport(started)
+    report.record("imports", time.perf_counter() - started)
+
+    if BOT_MODE == "webhook" and WEBHOOK_WORKERS > 1:
+        await run_sharded_webhook()
+        return
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    scheduler = await start_services(report=report)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await stop_services(scheduler)
 
 
 if __name__ == "__main__":
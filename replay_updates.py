@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from app.core.webhook import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET
+
+
+def load_updates(path: Path) -> list[dict[str, Any]]:
+    """Читает записанные апдейты: JSON-массив или по одному JSON-объекту в строке."""
+    text = path.read_text(encoding="utf-8").strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+async def replay(
+    url: str, updates: list[dict[str, Any]], secret: str | None, concurrency: int
+) -> None:
+    """Отправляет апдейты на вебхук с заданной параллельностью и печатает итоги."""
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: dict[int, int] = {}
+
+    async with httpx.AsyncClient(headers=headers, timeout=30) as client:
+
+        async def send(update: dict[str, Any]) -> None:
+            async with semaphore:
+                try:
+                    response = await client.post(url, json=update)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                except httpx.HTTPError as e:
+                    print(f"Ошибка отправки апдейта {update.get('update_id')}: {e}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        elapsed = time.perf_counter() - start
+
+    print(f"Отправлено {len(updates)} апдейтов за {elapsed:.2f} с, коды ответов: {statuses}")
+
+
+def main() -> None:
+    """Разбирает аргументы командной строки и воспроизводит апдейты на локальном вебхуке."""
+    parser = argparse.ArgumentParser(
+        description="Отправка записанных Telegram-апдейтов на вебхук (BOT_MODE=webhook)."
+    )
+    parser.add_argument("updates", type=Path, help="JSON-массив или JSON Lines с апдейтами")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET, help="по умолчанию WEBHOOK_SECRET")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(replay(args.url, load_updates(args.updates), args.secret, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
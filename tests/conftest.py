@@ -0,0 +1,19 @@
+import pytest
+
+
+class FakeClock:
+    """Управляемые часы для проверки сроков жизни, пополнения и переходов по времени."""
+
+    def __init__(self) -> None:
+        """Начинает отсчёт с нуля."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Возвращает текущее время."""
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    """Возвращает часы, которые идут только при изменении clock.now."""
+    return FakeClock()
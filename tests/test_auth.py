@@ -0,0 +1,92 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.types import Message
+
+from app.core import middlewares
+from app.core.middlewares import AuthMiddleware
+from app.services import auth
+from app.tools.cache import TTLCache
+
+
+@pytest.fixture
+def lookup(monkeypatch: pytest.MonkeyPatch) -> AsyncMock:
+    """Подменяет проверку пользователя в БД и очищает кэши авторизации."""
+    monkeypatch.setattr(auth, "authorized_cache", TTLCache(ttl=60))
+    monkeypatch.setattr(auth, "unauthorized_cache", TTLCache(ttl=60))
+    user_exists = AsyncMock()
+    monkeypatch.setattr(auth, "user_exists", user_exists)
+    return user_exists
+
+
+async def test_registered_user_is_cached(lookup: AsyncMock) -> None:
+    """Зарегистрированный пользователь проверяется по БД один раз."""
+    lookup.return_value = True
+    assert await auth.is_authorized(1) is True
+    assert await auth.is_authorized(1) is True
+    assert lookup.await_count == 1
+
+
+async def test_unknown_user_is_negatively_cached(lookup: AsyncMock) -> None:
+    """Отрицательный ответ кэшируется до регистрации пользователя."""
+    lookup.return_value = False
+    assert await auth.is_authorized(1) is False
+    assert await auth.is_authorized(1) is False
+    assert lookup.await_count == 1
+
+    auth.remember_user(1)
+    assert await auth.is_authorized(1) is True
+
+
+async def test_db_error_is_not_cached(lookup: AsyncMock) -> None:
+    """Сбой БД не выдаётся за отсутствие пользователя и не кэшируется."""
+    lookup.side_effect = [None, True]
+    assert await auth.is_authorized(1) is None
+    assert await auth.is_authorized(1) is True
+    assert lookup.await_count == 2
+
+
+def make_event(user_id: int | None, auth_flag: bool) -> tuple[MagicMock, dict]:
+    """Создаёт сообщение и данные апдейта для вызова middleware."""
+    event = MagicMock(spec=Message)
+    event.answer = AsyncMock()
+    handler_object = MagicMock()
+    handler_object.flags = {"auth": True} if auth_flag else {}
+    user = MagicMock(id=user_id) if user_id is not None else None
+    return event, {"event_from_user": user, "session": None, "handler": handler_object}
+
+
+@pytest.mark.parametrize(
+    ("authorized", "auth_flag", "called"),
+    [(True, True, True), (False, False, True), (False, True, False), (None, False, False)],
+)
+async def test_auth_middleware(
+    monkeypatch: pytest.MonkeyPatch, authorized: bool | None, auth_flag: bool, called: bool
+) -> None:
+    """Обработчик вызывается, только если доступ проверен и разрешён флагом auth."""
+    monkeypatch.setattr(middlewares, "is_authorized", AsyncMock(return_value=authorized))
+    monkeypatch.setattr(middlewares, "release_session", AsyncMock())
+    handler = AsyncMock(return_value="done")
+    event, data = make_event(1, auth_flag)
+
+    result = await AuthMiddleware()(handler, event, data)
+
+    assert (result == "done") is called
+    assert handler.await_count == int(called)
+    assert event.answer.await_count == int(not called)
+    if called:
+        assert data["authorized"] is authorized
+
+
+async def test_auth_middleware_without_user(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Апдейт без пользователя не проверяется по БД и считается неавторизованным."""
+    is_authorized = AsyncMock()
+    monkeypatch.setattr(middlewares, "is_authorized", is_authorized)
+    monkeypatch.setattr(middlewares, "release_session", AsyncMock())
+    handler = AsyncMock()
+    event, data = make_event(None, auth_flag=False)
+
+    await AuthMiddleware()(handler, event, data)
+
+    is_authorized.assert_not_awaited()
+    assert data["authorized"] is False
@@ -0,0 +1,249 @@
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+import pytest
+from conftest import FakeClock
+
+from app.tools.cache import SingleFlight, StreamFlight, TTLCache
+
+
+def make_loader(*values: object) -> tuple[list[int], Callable[[], Awaitable[object]]]:
+    """Возвращает счётчик вызовов и загрузчик, отдающий values по очереди."""
+    calls = [0]
+
+    async def loader() -> object:
+        calls[0] += 1
+        return values[min(calls[0], len(values)) - 1]
+
+    return calls, loader
+
+
+async def test_fresh_entry_is_served_from_cache(clock: FakeClock) -> None:
+    """Свежая запись отдаётся без повторной загрузки."""
+    cache = TTLCache(ttl=10, clock=clock)
+    calls, loader = make_loader("a", "b")
+
+    assert await cache.get_or_load("k", loader) == "a"
+    clock.now = 9.9
+    assert await cache.get_or_load("k", loader) == "a"
+    assert calls[0] == 1
+    assert cache.stats() == {"hits": 1, "stale_hits": 0, "misses": 1, "size": 1}
+
+
+async def test_expired_entry_is_reloaded(clock: FakeClock) -> None:
+    """После ttl без stale_ttl запись загружается заново."""
+    cache = TTLCache(ttl=10, clock=clock)
+    calls, loader = make_loader("a", "b")
+
+    await cache.get_or_load("k", loader)
+    clock.now = 10
+    assert await cache.get_or_load("k", loader) == "b"
+    assert calls[0] == 2
+
+
+async def test_stale_entry_is_served_and_refreshed_in_background(clock: FakeClock) -> None:
+    """Устаревшая запись отдаётся сразу, а обновление идёт в фоне один раз."""
+    cache = TTLCache(ttl=10, stale_ttl=10, clock=clock)
+    calls, loader = make_loader("a", "b")
+
+    await cache.get_or_load("k", loader)
+    clock.now = 15
+    assert await cache.get_or_load("k", loader) == "a"
+    assert await cache.get_or_load("k", loader) == "a"
+    await asyncio.sleep(0)
+
+    assert calls[0] == 2
+    assert cache.get("k") == "b"
+    assert cache.stats()["stale_hits"] == 2
+
+
+async def test_stale_refresh_error_keeps_old_entry(clock: FakeClock) -> None:
+    """Ошибка фонового обновления не вытесняет устаревшую запись."""
+    cache = TTLCache(ttl=10, stale_ttl=10, clock=clock)
+    cache.set("k", "a")
+
+    async def failing() -> str:
+        raise RuntimeError("boom")
+
+    clock.now = 15
+    assert await cache.get_or_load("k", failing) == "a"
+    await asyncio.sleep(0)
+    assert await cache.get_or_load("k", failing) == "a"
+
+
+async def test_entry_is_dropped_after_stale_ttl(clock: FakeClock) -> None:
+    """После ttl + stale_ttl запись больше не отдаётся."""
+    cache = TTLCache(ttl=10, stale_ttl=10, clock=clock)
+    cache.set("k", "a")
+
+    clock.now = 20
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+async def test_should_cache_skips_errors() -> None:
+    """Результат, отклонённый should_cache, не сохраняется."""
+    cache = TTLCache(ttl=10)
+    calls, loader = make_loader(None, "ok")
+
+    assert await cache.get_or_load("k", loader, should_cache=lambda v: v is not None) is None
+    assert await cache.get_or_load("k", loader, should_cache=lambda v: v is not None) == "ok"
+    assert calls[0] == 2
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    """При превышении maxsize вытесняется запись, к которой дольше не обращались."""
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+@pytest.mark.parametrize("key", ["a", None])
+def test_invalidate(key: str | None) -> None:
+    """Метод invalidate удаляет одну запись или очищает кэш целиком."""
+    cache = TTLCache(ttl=10)
+    cache.set("a", 1)
+    cache.invalidate(key)
+    assert cache.get("a") is None
+
+
+async def test_single_flight_coalesces_concurrent_calls() -> None:
+    """Одновременные вызовы с одним ключом выполняют функцию один раз."""
+    flight = SingleFlight()
+    calls = 0
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "done"
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+    assert results == ["done"] * 5
+    assert calls == 1
+    assert len(flight) == 0
+
+
+async def test_single_flight_fans_out_error_and_forgets_key() -> None:
+    """Ошибку получают все ожидающие, а следующий вызов запускается заново."""
+    flight = SingleFlight()
+    calls = 0
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        if calls == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await flight.do("k", work) == "ok"
+    assert calls == 2
+
+
+async def test_single_flight_survives_cancelled_waiter() -> None:
+    """Отмена одного ожидающего не отменяет общую задачу для остальных."""
+    flight = SingleFlight()
+
+    async def work() -> str:
+        await asyncio.sleep(0.01)
+        return "done"
+
+    first = asyncio.create_task(flight.do("k", work))
+    second = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_single_flight_keys_are_independent() -> None:
+    """Разные ключи выполняются отдельно."""
+    flight = SingleFlight()
+
+    async def work() -> int:
+        await asyncio.sleep(0)
+        return len(flight)
+
+    assert await asyncio.gather(flight.do("a", work), flight.do("b", work)) == [2, 2]
+
+
+async def collect(chunks: AsyncIterator[str]) -> list[str]:
+    """Собирает все фрагменты потока."""
+    return [chunk async for chunk in chunks]
+
+
+def make_source(*chunks: str, error: Exception | None = None) -> tuple[list[int], Callable]:
+    """Возвращает счётчик запусков и фабрику потока, отдающего chunks с паузами."""
+    starts = [0]
+
+    async def source() -> AsyncIterator[str]:
+        starts[0] += 1
+        for chunk in chunks:
+            await asyncio.sleep(0.01)
+            yield chunk
+        if error is not None:
+            raise error
+
+    return starts, source
+
+
+async def test_stream_flight_shares_one_stream() -> None:
+    """Одновременные подписчики читают один поток и получают все фрагменты."""
+    flight = StreamFlight()
+    starts, source = make_source("a", "b", "c")
+
+    first = asyncio.create_task(collect(flight.stream("k", source)))
+    await asyncio.sleep(0.015)
+    second = await collect(flight.stream("k", source))
+
+    assert await first == second == ["a", "b", "c"]
+    assert starts[0] == 1
+    assert len(flight) == 0
+
+
+async def test_stream_flight_fans_out_error() -> None:
+    """Ошибку потока получает каждый подписчик после уже отданных фрагментов."""
+    flight = StreamFlight()
+    _, source = make_source("a", error=RuntimeError("boom"))
+
+    async def read() -> list[str]:
+        received = []
+        with pytest.raises(RuntimeError):
+            async for chunk in flight.stream("k", source):
+                received.append(chunk)
+        return received
+
+    assert await asyncio.gather(read(), read()) == [["a"], ["a"]]
+
+
+async def test_stream_flight_cancels_stream_without_subscribers() -> None:
+    """Когда уходит последний подписчик, поток закрывается, а ключ освобождается."""
+    flight = StreamFlight()
+    closed = asyncio.Event()
+
+    async def source() -> AsyncIterator[str]:
+        try:
+            yield "a"
+            await asyncio.sleep(10)
+            yield "b"
+        finally:
+            closed.set()
+
+    chunks = flight.stream("k", source)
+    assert await anext(chunks) == "a"
+    await chunks.aclose()
+    await asyncio.sleep(0)
+
+    assert closed.is_set()
+    assert len(flight) == 0
@@ -0,0 +1,64 @@
+from typing import Any
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.data.fsm_storage import DbStorage, resolve_fsm_storage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+@pytest.mark.parametrize(
+    ("storage", "mode", "workers", "replicas", "expected"),
+    [
+        ("auto", "polling", 1, 1, "memory"),
+        ("auto", "polling", 4, 1, "memory"),
+        ("auto", "webhook", 1, 1, "memory"),
+        ("auto", "webhook", 4, 1, "db"),
+        ("auto", "webhook", 1, 2, "db"),
+        ("db", "polling", 1, 1, "db"),
+        ("memory", "webhook", 4, 2, "memory"),
+    ],
+)
+def test_resolve_fsm_storage(
+    storage: str, mode: str, workers: int, replicas: int, expected: str
+) -> None:
+    """Режим auto выбирает БД только для вебхука с несколькими процессами или репликами."""
+    assert resolve_fsm_storage(storage, mode, workers, replicas) == expected
+
+
+@pytest.fixture
+def table(monkeypatch: pytest.MonkeyPatch) -> dict[str, tuple[str | None, dict[str, Any]]]:
+    """Подменяет таблицу fsm_states словарём, общим для всех экземпляров хранилища."""
+    rows: dict[str, tuple[str | None, dict[str, Any]]] = {}
+
+    async def read(self: DbStorage, key: str) -> tuple[str | None, dict[str, Any]]:
+        return rows.get(key, (None, {}))
+
+    async def write(self: DbStorage, key: str, state: str | None, data: dict[str, Any]) -> None:
+        rows[key] = (state, data)
+
+    monkeypatch.setattr(DbStorage, "_read", read)
+    monkeypatch.setattr(DbStorage, "_write", write)
+    return rows
+
+
+async def test_replicas_without_cache_see_each_other(table: dict) -> None:
+    """Без кэша реплика сразу видит состояние, выставленное другой репликой."""
+    first, second = DbStorage(cache_ttl=0), DbStorage(cache_ttl=0)
+
+    assert await first.get_state(KEY) is None
+    await second.set_state(KEY, "waiting_for_password")
+
+    assert await first.get_state(KEY) == "waiting_for_password"
+
+
+async def test_read_cache_hides_other_process_writes(table: dict) -> None:
+    """Кэш чтения скрывает записи другого процесса, поэтому без шардирования он опасен."""
+    first, second = DbStorage(cache_ttl=60), DbStorage(cache_ttl=60)
+
+    assert await first.get_state(KEY) is None
+    await second.set_state(KEY, "waiting_for_password")
+
+    assert await first.get_state(KEY) is None
+    assert await second.get_state(KEY) == "waiting_for_password"
@@ -0,0 +1,80 @@
+import asyncio
+from collections.abc import AsyncIterator
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core import handlers
+
+
+def make_message() -> tuple[MagicMock, AsyncMock]:
+    """Создаёт подмену сообщения Telegram и возвращает её вместе с edit_text заглушки."""
+    placeholder = MagicMock()
+    placeholder.edit_text = AsyncMock()
+    message = MagicMock()
+    message.answer = AsyncMock(return_value=placeholder)
+    return message, placeholder.edit_text
+
+
+async def test_first_chunk_is_shown_immediately(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Первый непустой фрагмент показывается сразу, следующие — по интервалу."""
+    monkeypatch.setattr(handlers, "STREAM_EDIT_INTERVAL", 60.0)
+    message, edit_text = make_message()
+    shown_before_second = []
+
+    async def chunks() -> AsyncIterator[str]:
+        yield " "
+        yield "Привет"
+        await asyncio.sleep(0)
+        shown_before_second.append(edit_text.await_count)
+        yield ", мир"
+
+    assert await handlers.answer_streaming(message, chunks()) == " Привет, мир"
+    assert shown_before_second == [1]
+    assert [call.args[0] for call in edit_text.await_args_list] == [" Привет", " Привет, мир"]
+
+
+async def test_empty_stream_shows_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Если модель ничего не вернула, показывается запасной текст."""
+    message, edit_text = make_message()
+
+    async def chunks() -> AsyncIterator[str]:
+        return
+        yield
+
+    assert await handlers.answer_streaming(message, chunks(), "нет ответа") == "нет ответа"
+    edit_text.assert_awaited_once_with("нет ответа")
+
+
+async def test_stream_timeout_replaces_placeholder_with_fallback() -> None:
+    """По таймауту поток закрывается, а заглушка заменяется на запасной текст."""
+    message, edit_text = make_message()
+    closed = asyncio.Event()
+
+    async def chunks() -> AsyncIterator[str]:
+        try:
+            yield "Начало ответа"
+            await asyncio.sleep(10)
+            yield "конец"
+        finally:
+            closed.set()
+
+    result = await handlers.answer_streaming(message, chunks(), "запасной ответ", timeout=0.05)
+
+    assert result == "запасной ответ"
+    assert closed.is_set()
+    message.answer.assert_awaited_once()
+    assert edit_text.await_args_list[-1].args[0] == "запасной ответ"
+
+
+async def test_spots_without_any_spot_suggests_addspot(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Без общих и личных спотов /spots подсказывает команду /addspot."""
+    monkeypatch.setattr(handlers, "GLOBAL_SPOTS", [])
+    monkeypatch.setattr(handlers, "get_user_spots", AsyncMock(return_value=[]))
+    monkeypatch.setattr(handlers, "release_session", AsyncMock())
+    message, edit_text = make_message()
+
+    await handlers.spots_command(message, session=MagicMock())
+
+    assert "/addspot" in message.answer.await_args.args[0]
+    edit_text.assert_not_awaited()
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from conftest import FakeClock
+
+from app.tools.limiter import RateLimiter, RateLimitExceeded, TokenBucket, retry_after
+
+
+def test_bucket_allows_burst_then_refills_at_rate(clock: FakeClock) -> None:
+    """Полная корзина пропускает burst запросов, затем токены копятся со скоростью rate."""
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.delay() == pytest.approx(0.5)
+
+    clock.now = 0.5
+    assert bucket.try_take() is True
+    assert bucket.try_take() is False
+
+
+def test_bucket_does_not_exceed_burst(clock: FakeClock) -> None:
+    """Долгий простой не накапливает больше burst токенов."""
+    bucket = TokenBucket(rate=1, burst=2, clock=clock)
+    clock.now = 100
+
+    assert [bucket.try_take() for _ in range(3)] == [True, True, False]
+
+
+def test_paused_bucket_does_not_refill(clock: FakeClock) -> None:
+    """Во время паузы токены не выдаются и не копятся."""
+    bucket = TokenBucket(rate=1, burst=5, clock=clock)
+    bucket.pause(10)
+
+    clock.now = 9
+    assert bucket.try_take() is False
+    assert bucket.delay() == pytest.approx(2)
+
+    clock.now = 11
+    assert bucket.try_take() is True
+    assert bucket.try_take() is False
+
+
+async def test_limiter_rejects_when_queue_is_full() -> None:
+    """При заполненной очереди запрос отклоняется сразу, без ожидания."""
+    limiter = RateLimiter("test", rate=1000, burst=10, max_in_flight=1, max_waiting=1)
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with limiter.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+
+    with pytest.raises(RateLimitExceeded):
+        async with limiter.slot():
+            pass
+    assert limiter.stats() == {"waiting": 1, "in_flight": 1, "rejected": 1}
+
+    release.set()
+    await asyncio.gather(holder, waiter)
+    assert limiter.stats() == {"waiting": 0, "in_flight": 0, "rejected": 1}
+
+
+async def test_limiter_rejects_after_wait_timeout() -> None:
+    """Запрос, не получивший места за timeout, отклоняется и не занимает слот."""
+    limiter = RateLimiter("test", rate=1000, burst=10, max_in_flight=1)
+
+    async with limiter.slot():
+        with pytest.raises(RateLimitExceeded):
+            async with limiter.slot(timeout=0.01):
+                pass
+
+    async with limiter.slot(timeout=0.01):
+        assert limiter.stats() == {"waiting": 0, "in_flight": 1, "rejected": 1}
+
+
+async def test_limiter_times_out_waiting_for_token() -> None:
+    """Пустая корзина тоже ограничивает ожидание сроком wait_timeout."""
+    limiter = RateLimiter("test", rate=1, burst=1, wait_timeout=0.01)
+
+    async with limiter.slot():
+        pass
+    with pytest.raises(RateLimitExceeded):
+        async with limiter.slot():
+            pass
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [({"retry-after": "7"}, 7.0), ({"retry-after": "soon"}, 1.5), ({}, 1.5), (None, 1.5)],
+)
+def test_retry_after(headers: dict[str, str] | None, expected: float) -> None:
+    """Задержка берётся из Retry-After, а при его отсутствии — значение по умолчанию."""
+    assert retry_after(headers, 1.5) == expected
@@ -0,0 +1,66 @@
+from collections.abc import Iterator
+
+from app.tools.metrics import Histogram, Registry
+
+
+def test_counter_and_gauge_lines() -> None:
+    """Счётчики и датчики выводятся с HELP/TYPE один раз на метрику и отсортированными метками."""
+    registry = Registry()
+    registry.describe("requests_total", "counter", "Число запросов")
+    registry.inc("requests_total", source="tg", kind="cmd")
+    registry.inc("requests_total", 2, kind="cmd", source="tg")
+    registry.inc("requests_total", kind="text", source="tg")
+    registry.add_gauge("in_flight", 3)
+    registry.add_gauge("in_flight", -1)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Число запросов",
+        "# TYPE requests_total counter",
+        'requests_total{kind="cmd",source="tg"} 3',
+        'requests_total{kind="text",source="tg"} 1',
+        "# HELP in_flight in_flight",
+        "# TYPE in_flight gauge",
+        "in_flight 2",
+    ]
+
+
+def test_label_values_are_escaped() -> None:
+    """Обратная косая черта, кавычки и переводы строк в метках экранируются."""
+    registry = Registry()
+    registry.inc("errors_total", error='bad "quote"\\path\nline')
+
+    assert 'errors_total{error="bad \\"quote\\"\\\\path\\nline"} 1' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    """Корзины гистограммы накопительные, с +Inf, суммой и числом наблюдений."""
+    registry = Registry()
+    registry.histograms[("latency_seconds", (("stage", "db"),))] = histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds latency_seconds",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="db",le="0.1"} 2',
+        'latency_seconds_bucket{stage="db",le="1"} 3',
+        'latency_seconds_bucket{stage="db",le="+Inf"} 4',
+        'latency_seconds_sum{stage="db"} 3.65',
+        'latency_seconds_count{stage="db"} 4',
+    ]
+
+
+def test_collectors_are_rendered_as_gauges() -> None:
+    """Значения коллекторов снимаются при выгрузке и замещают записанные датчики."""
+    registry = Registry()
+    registry.add_gauge("cache_size", 1, cache="advice")
+    size = 5
+
+    def collect() -> Iterator[tuple[str, dict[str, str], float]]:
+        yield "cache_size", {"cache": "advice"}, size
+
+    registry.collectors.append(collect)
+    assert 'cache_size{cache="advice"} 5' in registry.render()
+
+    size = 7
+    assert 'cache_size{cache="advice"} 7' in registry.render()
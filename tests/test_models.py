@@ -0,0 +1,83 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.data import models
+
+
+@pytest.fixture
+def conn(monkeypatch: pytest.MonkeyPatch) -> MagicMock:
+    """Подменяет движок БД соединением-заглушкой и включает проверку версии схемы."""
+    connection = MagicMock()
+    connection.execute = AsyncMock()
+    connection.run_sync = AsyncMock()
+
+    @asynccontextmanager
+    async def begin() -> AsyncIterator[MagicMock]:
+        yield connection
+
+    engine = MagicMock()
+    engine.begin = MagicMock(side_effect=begin)
+    monkeypatch.setattr(models, "get_async_engine", lambda: engine)
+    monkeypatch.setattr(models, "DB_SKIP_SCHEMA_CHECK", False)
+    connection.engine = engine
+    return connection
+
+
+def executed(conn: MagicMock) -> list[str]:
+    """Возвращает тексты запросов, выполненных через соединение."""
+    return [str(call.args[0]) for call in conn.execute.await_args_list]
+
+
+async def test_skip_flag_does_not_touch_db(monkeypatch: pytest.MonkeyPatch, conn: MagicMock) -> None:
+    """При DB_SKIP_SCHEMA_CHECK версия не читается и схема не создаётся."""
+    monkeypatch.setattr(models, "DB_SKIP_SCHEMA_CHECK", True)
+    get_version = AsyncMock()
+    monkeypatch.setattr(models, "get_schema_version", get_version)
+
+    assert await models.init_models() is False
+    get_version.assert_not_awaited()
+    conn.engine.begin.assert_not_called()
+
+
+async def test_current_version_skips_create_all(
+    monkeypatch: pytest.MonkeyPatch, conn: MagicMock
+) -> None:
+    """Совпадающая версия схемы ограничивается одним чтением версии."""
+    monkeypatch.setattr(models, "get_schema_version", AsyncMock(return_value=models.SCHEMA_VERSION))
+
+    assert await models.init_models() is False
+    conn.engine.begin.assert_not_called()
+
+
+@pytest.mark.parametrize("version", [None, models.SCHEMA_VERSION - 1])
+async def test_outdated_schema_is_upgraded_under_lock(
+    monkeypatch: pytest.MonkeyPatch, conn: MagicMock, version: int | None
+) -> None:
+    """Устаревшая схема обновляется под advisory-блокировкой и получает новую версию."""
+    monkeypatch.setattr(models, "get_schema_version", AsyncMock(return_value=version))
+
+    assert await models.init_models() is True
+
+    statements = executed(conn)
+    assert "pg_advisory_xact_lock" in statements[0]
+    conn.run_sync.assert_awaited_once_with(models.Base.metadata.create_all)
+    assert statements[1:-1] == models.SCHEMA_UPGRADES
+    assert "INSERT INTO schema_version" in statements[-1]
+    assert "ON CONFLICT" in statements[-1]
+
+
+@pytest.mark.parametrize("skip", [True, False])
+async def test_force_bypasses_checks(
+    monkeypatch: pytest.MonkeyPatch, conn: MagicMock, skip: bool
+) -> None:
+    """Флаг force обновляет схему независимо от флага и текущей версии."""
+    monkeypatch.setattr(models, "DB_SKIP_SCHEMA_CHECK", skip)
+    get_version = AsyncMock(return_value=models.SCHEMA_VERSION)
+    monkeypatch.setattr(models, "get_schema_version", get_version)
+
+    assert await models.init_models(force=True) is True
+    get_version.assert_not_awaited()
+    conn.run_sync.assert_awaited_once()
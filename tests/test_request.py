@@ -0,0 +1,35 @@
+from unittest.mock import AsyncMock, MagicMock
+
+from app.data.request import release_session
+
+
+def make_session(in_transaction: bool) -> MagicMock:
+    """Создаёт подмену AsyncSession с заданным состоянием транзакции."""
+    session = MagicMock()
+    session.in_transaction.return_value = in_transaction
+    session.commit = AsyncMock()
+    session.rollback = AsyncMock()
+    return session
+
+
+async def test_release_session_commits_open_transaction() -> None:
+    """Открытая транзакция фиксируется, и соединение возвращается в пул."""
+    session = make_session(in_transaction=True)
+    await release_session(session)
+    session.commit.assert_awaited_once()
+
+
+async def test_release_session_without_transaction_is_noop() -> None:
+    """Без открытой транзакции сессия не трогается."""
+    session = make_session(in_transaction=False)
+    await release_session(session)
+    await release_session(None)
+    session.commit.assert_not_awaited()
+
+
+async def test_release_session_rolls_back_on_commit_error() -> None:
+    """Ошибка фиксации откатывает транзакцию и не выходит наружу."""
+    session = make_session(in_transaction=True)
+    session.commit.side_effect = RuntimeError("boom")
+    await release_session(session)
+    session.rollback.assert_awaited_once()
@@ -0,0 +1,195 @@
+import asyncio
+
+import pytest
+from conftest import FakeClock
+
+from app.tools.resilience import CircuitBreaker, CircuitOpenError, ResiliencePolicy
+
+
+def make_policy(**kwargs: object) -> ResiliencePolicy:
+    """Создаёт политику без пауз между попытками и с высоким порогом автомата."""
+    options = {"attempt_timeout": 1.0, "budget": 5.0, "backoff": 0.0}
+    options.update(kwargs)
+    return ResiliencePolicy(CircuitBreaker("test", failure_threshold=100), **options)
+
+
+def test_breaker_opens_after_threshold_and_closes_after_probe(clock: FakeClock) -> None:
+    """Автомат проходит путь closed → open → half_open → closed."""
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.stats() == {"failures": 0, "open": 0}
+
+
+def test_failed_probe_reopens_breaker(clock: FakeClock) -> None:
+    """Сбой пробного вызова снова размыкает автомат на reset_timeout."""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 10
+    breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    clock.now = 19
+    assert breaker.state == "open"
+    clock.now = 20
+    assert breaker.state == "half_open"
+
+
+def test_unfinished_probe_does_not_block_forever(clock: FakeClock) -> None:
+    """Пробный вызов без исхода перестаёт блокировать автомат через reset_timeout."""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 10
+    breaker.allow()
+    clock.now = 20
+    breaker.allow()
+
+    breaker.record_ignored()
+    breaker.allow()
+
+
+async def test_policy_retries_until_success() -> None:
+    """Ошибки повторяются, а успех сбрасывает счётчик сбоев."""
+    policy = make_policy(retries=2)
+    calls = 0
+
+    async def flaky() -> str:
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise ConnectionError("boom")
+        return "ok"
+
+    assert await policy.call(flaky) == "ok"
+    assert calls == 3
+    assert policy.breaker.failures == 0
+
+
+async def test_policy_raises_last_error_after_retries() -> None:
+    """После исчерпания повторов выбрасывается ошибка последней попытки."""
+    policy = make_policy(retries=1)
+    calls = 0
+
+    async def failing() -> None:
+        nonlocal calls
+        calls += 1
+        raise ConnectionError(calls)
+
+    with pytest.raises(ConnectionError, match="2"):
+        await policy.call(failing)
+    assert policy.breaker.failures == 2
+
+
+async def test_non_retryable_error_is_not_repeated() -> None:
+    """Неповторяемая ошибка выбрасывается сразу и не считается сбоем сервиса."""
+    policy = make_policy(retries=3, is_retryable=lambda error: not isinstance(error, ValueError))
+    calls = 0
+
+    async def bad_request() -> None:
+        nonlocal calls
+        calls += 1
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        await policy.call(bad_request)
+    assert calls == 1
+    assert policy.breaker.failures == 0
+
+
+async def test_budget_bounds_all_attempts() -> None:
+    """Зависающие попытки обрываются по attempt_timeout, а все вместе — по бюджету."""
+    policy = make_policy(attempt_timeout=0.05, budget=0.12, retries=10)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def hang() -> None:
+        await asyncio.sleep(10)
+
+    with pytest.raises(TimeoutError):
+        await policy.call(hang)
+    assert loop.time() - started < 0.5
+
+
+async def test_open_breaker_rejects_without_calling() -> None:
+    """Разомкнутый автомат отклоняет вызов, не обращаясь к сервису."""
+    policy = ResiliencePolicy(CircuitBreaker("test", failure_threshold=1), 1.0, 5.0, backoff=0.0)
+    policy.breaker.record_failure()
+    calls = 0
+
+    async def func() -> None:
+        nonlocal calls
+        calls += 1
+
+    with pytest.raises(CircuitOpenError):
+        await policy.call(func)
+    assert calls == 0
+
+
+async def test_hedged_request_wins_over_slow_one() -> None:
+    """Медленный запрос дублируется, берётся первый ответ, а лишний отменяется."""
+    policy = make_policy(retries=0, hedge_after=0.02)
+    cancelled = asyncio.Event()
+    calls = 0
+
+    async def func() -> str:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        return f"call {calls}"
+
+    assert await policy.call(func) == "call 2"
+    await asyncio.sleep(0)
+    assert cancelled.is_set()
+
+
+async def test_hedging_waits_for_success_after_first_failure() -> None:
+    """Сбой одного из запросов не прерывает попытку, пока другой может ответить."""
+    policy = make_policy(retries=0, hedge_after=0.02)
+    calls = 0
+
+    async def func() -> str:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(0.04)
+            raise ConnectionError("first")
+        await asyncio.sleep(0.05)
+        return "second"
+
+    assert await policy.call(func) == "second"
+
+
+async def test_fast_response_is_not_hedged() -> None:
+    """Ответ быстрее hedge_after не порождает второй запрос."""
+    policy = make_policy(hedge_after=0.5)
+    calls = 0
+
+    async def func() -> str:
+        nonlocal calls
+        calls += 1
+        return "ok"
+
+    assert await policy.call(func) == "ok"
+    assert calls == 1
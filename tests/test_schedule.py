@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import schedule
+from app.services.schedule import ScheduleIndex
+
+EPOCH = date(2020, 1, 1)
+
+
+def make_index(*rows: tuple[int, date, bool]) -> ScheduleIndex:
+    """Создаёт индекс, заполненный записями (user_id, date, is_working)."""
+    index = ScheduleIndex(EPOCH)
+    index.load(rows)
+    return index
+
+
+def test_working_mask_starts_at_start_date() -> None:
+    """Бит 0 маски соответствует start_date, дни вне окна отбрасываются."""
+    index = make_index(
+        (1, date(2020, 1, 3), True), (1, date(2020, 1, 5), True), (1, date(2020, 2, 1), True)
+    )
+    assert index.working_mask(date(2020, 1, 2), 5) == 0b01010
+
+
+def test_working_mask_with_start_before_epoch() -> None:
+    """Окно, начинающееся раньше начала отсчёта, сдвигает маску влево."""
+    index = make_index((1, EPOCH, True), (1, EPOCH + timedelta(days=2), True))
+    assert index.working_mask(EPOCH - timedelta(days=3), 6) == 0b101000
+
+
+def test_days_before_epoch_are_ignored() -> None:
+    """Дни раньше начала отсчёта не попадают в индекс."""
+    index = make_index((1, EPOCH - timedelta(days=1), True))
+    assert index.working_mask(EPOCH - timedelta(days=5), 10) == 0
+
+
+def test_set_day_clears_working_day() -> None:
+    """Выходной снимает отметку рабочего дня."""
+    index = make_index((1, date(2020, 1, 3), True))
+    index.set_day(1, date(2020, 1, 3), False)
+    assert index.working_days(1, EPOCH, date(2020, 1, 10)) == []
+
+
+def test_working_days_of_one_friend() -> None:
+    """Рабочие дни возвращаются только для указанного друга и включают end_date."""
+    index = make_index(
+        (1, date(2020, 1, 3), True), (1, date(2020, 1, 10), True), (2, date(2020, 1, 4), True)
+    )
+    assert index.working_days(1, date(2020, 1, 1), date(2020, 1, 10)) == [
+        date(2020, 1, 3),
+        date(2020, 1, 10),
+    ]
+
+
+def test_common_free_days() -> None:
+    """Общие выходные — дни, когда не работает ни один из выбранных друзей."""
+    index = make_index(
+        (1, date(2020, 1, 1), True), (2, date(2020, 1, 2), True), (3, date(2020, 1, 3), True)
+    )
+    assert index.common_free_days(EPOCH, 4, [1, 2]) == [date(2020, 1, 3), date(2020, 1, 4)]
+    assert index.common_free_days(EPOCH, 4) == [date(2020, 1, 4)]
+
+
+def test_unknown_friend_is_free() -> None:
+    """Друг без записей в индексе свободен во все дни."""
+    index = make_index()
+    assert index.common_free_days(EPOCH, 2, [42]) == [EPOCH, EPOCH + timedelta(days=1)]
+
+
+async def test_failed_load_keeps_index_unloaded(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ошибка чтения графиков не помечает индекс загруженным."""
+    index = ScheduleIndex(EPOCH)
+    monkeypatch.setattr(schedule, "schedule_index", index)
+
+    async def failing() -> None:
+        return None
+
+    monkeypatch.setattr(schedule, "get_all_work_days", failing)
+    assert await schedule.load_schedule_index() is False
+    assert index.loaded is False
+
+
+async def test_reload_replaces_previous_schedules(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Повторная загрузка заменяет графики целиком, а сбой сохраняет прежние."""
+    index = make_index((1, date(2020, 1, 3), True))
+    monkeypatch.setattr(schedule, "schedule_index", index)
+    results = [[(1, date(2020, 1, 4), True)], None]
+
+    async def loader() -> list[tuple[int, date, bool]] | None:
+        return results.pop(0)
+
+    monkeypatch.setattr(schedule, "get_all_work_days", loader)
+    assert await schedule.load_schedule_index() is True
+    assert await schedule.load_schedule_index() is False
+    assert index.loaded is True
+    assert index.working_days(1, EPOCH, date(2020, 1, 10)) == [date(2020, 1, 4)]
@@ -0,0 +1,57 @@
+from datetime import date
+from pathlib import Path
+
+from app.data.schedule_import import read_ical_rows
+
+
+def write_ical(path: Path, *events: tuple[str, str | None]) -> Path:
+    """Записывает iCal-файл с событиями (DTSTART, DTEND) в виде готовых строк."""
+    lines = ["BEGIN:VCALENDAR"]
+    for start, end in events:
+        lines += ["BEGIN:VEVENT", start]
+        if end is not None:
+            lines.append(end)
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def read_days(path: Path) -> list[date]:
+    """Возвращает даты, прочитанные из iCal-файла."""
+    return [row["date"] for row in read_ical_rows(path, friend_id=1)]
+
+
+def test_all_day_event_excludes_dtend(tmp_path: Path) -> None:
+    """Для событий на весь день DTEND не включается."""
+    path = write_ical(
+        tmp_path / "a.ics",
+        ("DTSTART;VALUE=DATE:20260301", "DTEND;VALUE=DATE:20260303"),
+    )
+    assert read_days(path) == [date(2026, 3, 1), date(2026, 3, 2)]
+
+
+def test_timed_event_covers_its_day(tmp_path: Path) -> None:
+    """Событие со временем внутри одного дня занимает этот день."""
+    path = write_ical(
+        tmp_path / "a.ics",
+        ("DTSTART:20260301T090000", "DTEND:20260301T180000"),
+        ("DTSTART;VALUE=DATE:20260305", "DTEND;VALUE=DATE:20260306"),
+    )
+    assert read_days(path) == [date(2026, 3, 1), date(2026, 3, 5)]
+
+
+def test_overnight_event_covers_both_days(tmp_path: Path) -> None:
+    """Ночная смена занимает оба дня, а окончание в полночь не добавляет день."""
+    path = write_ical(
+        tmp_path / "a.ics",
+        ("DTSTART:20260301T220000Z", "DTEND:20260302T060000Z"),
+        ("DTSTART:20260310T180000", "DTEND:20260311T000000"),
+    )
+    assert read_days(path) == [date(2026, 3, 1), date(2026, 3, 2), date(2026, 3, 10)]
+
+
+def test_event_without_dtend_takes_one_day(tmp_path: Path) -> None:
+    """Событие без DTEND занимает один день."""
+    path = write_ical(tmp_path / "a.ics", ("DTSTART:20260301T090000", None))
+    assert read_days(path) == [date(2026, 3, 1)]
@@ -0,0 +1,39 @@
+from app.services.scheduler import PeriodicJob
+
+
+async def test_job_runs_without_guard() -> None:
+    """Задача без guard выполняется при каждом запуске."""
+    calls = []
+
+    async def work() -> None:
+        calls.append(1)
+
+    job = PeriodicJob("job", work, interval=1)
+    assert await job.run_once() is True
+    assert calls == [1]
+
+
+async def test_guard_skips_run() -> None:
+    """Если guard не выдал разрешение, задача не выполняется."""
+    calls = []
+    allowed = [False, True]
+
+    async def work() -> None:
+        calls.append(1)
+
+    async def guard() -> bool:
+        return allowed.pop(0)
+
+    job = PeriodicJob("job", work, interval=1, guard=guard)
+    assert await job.run_once() is False
+    assert await job.run_once() is True
+    assert calls == [1]
+
+
+async def test_job_error_does_not_escape() -> None:
+    """Ошибка задачи логируется и не прерывает планировщик."""
+
+    async def work() -> None:
+        raise RuntimeError("boom")
+
+    assert await PeriodicJob("job", work, interval=1).run_once() is True
@@ -0,0 +1,102 @@
+from datetime import date, datetime, time
+
+from app.services.scoring import score_forecast, select_rideable
+from app.services.weather import ForecastSlot, parse_forecast
+
+
+def make_slot(moment: datetime, temp: float = 20.0, wind: float = 2.0) -> ForecastSlot:
+    """Создаёт слот прогноза с заданными температурой и ветром."""
+    return ForecastSlot(moment, temp, wind, 50, "ясно")
+
+
+def make_item(dt_txt: str, temp: float = 20.0) -> dict:
+    """Создаёт элемент ответа OpenWeatherMap."""
+    return {
+        "dt_txt": dt_txt,
+        "main": {"temp": temp, "humidity": 50},
+        "wind": {"speed": 2.0},
+        "weather": [{"description": "ясно"}],
+    }
+
+
+def test_parse_forecast_shifts_utc_to_local_time() -> None:
+    """Время слотов переводится из UTC в местное по city.timezone."""
+    items = [make_item(f"2024-06-01 {hour:02d}:00:00") for hour in range(0, 24, 3)]
+
+    slots = parse_forecast(items, utc_offset=3 * 3600)
+
+    assert [slot.timestamp.hour for slot in slots] == [9, 12, 15]
+    assert slots[0].timestamp == datetime(2024, 6, 1, 9)
+
+
+def test_parse_forecast_keeps_daytime_for_any_offset() -> None:
+    """При любом смещении остаются слоты по обе стороны окна катания."""
+    items = [make_item(f"2024-06-01 {hour:02d}:00:00") for hour in range(0, 24, 3)]
+
+    for offset in range(-12, 15):
+        hours = [slot.timestamp.hour for slot in parse_forecast(items, offset * 3600)]
+        assert min(hours) <= 11 and max(hours) >= 14, offset
+
+
+def test_parse_forecast_moves_late_utc_slot_to_next_day() -> None:
+    """Слот позднего вечера по UTC относится к следующему местному дню."""
+    slots = parse_forecast([make_item("2024-06-01 21:00:00")], utc_offset=12 * 3600)
+    assert slots[0].timestamp == datetime(2024, 6, 2, 9)
+
+
+def test_day_with_good_window_qualifies() -> None:
+    """Тёплый безветренный день подходит, лучший старт идёт первым."""
+    slots = [
+        make_slot(datetime(2024, 6, 1, 9), temp=16),
+        make_slot(datetime(2024, 6, 1, 12), temp=20),
+        make_slot(datetime(2024, 6, 1, 15), temp=22),
+    ]
+
+    (score,) = score_forecast(slots)
+
+    assert score.day == date(2024, 6, 1)
+    assert score.qualifies
+    assert score.starts[0] == time(13, 0)
+    assert len(score.starts) == 5
+
+
+def test_cold_or_windy_starts_are_rejected() -> None:
+    """Старт не подходит, если в окне холодно или ветрено хотя бы в один момент."""
+    cold = [
+        make_slot(datetime(2024, 6, 1, 9), temp=5),
+        make_slot(datetime(2024, 6, 1, 12), temp=10),
+        make_slot(datetime(2024, 6, 1, 15), temp=11),
+    ]
+    windy = [
+        make_slot(datetime(2024, 6, 2, 9)),
+        make_slot(datetime(2024, 6, 2, 12), wind=8),
+        make_slot(datetime(2024, 6, 2, 15)),
+    ]
+
+    scores = score_forecast(cold + windy)
+
+    assert [score.day for score in scores] == [date(2024, 6, 1), date(2024, 6, 2)]
+    assert not any(score.qualifies for score in scores)
+    assert select_rideable(cold + windy) == []
+
+
+def test_window_is_checked_in_slot_time() -> None:
+    """Окно 11:00–14:00 проверяется по времени слотов, а не по UTC.
+
+    Для UTC+3 тёплый полдень в UTC (15:00 местного) не должен спасать холодное утро.
+    """
+    items = [
+        make_item("2024-06-01 06:00:00", temp=8),
+        make_item("2024-06-01 09:00:00", temp=9),
+        make_item("2024-06-01 12:00:00", temp=14),
+    ]
+
+    (score,) = score_forecast(parse_forecast(items, utc_offset=3 * 3600))
+
+    assert not score.qualifies
+
+
+def test_day_without_covered_window_is_skipped() -> None:
+    """День, в котором слоты не охватывают окно катания, не оценивается."""
+    slots = [make_slot(datetime(2024, 6, 1, 15)), make_slot(datetime(2024, 6, 1, 18))]
+    assert score_forecast(slots) == []
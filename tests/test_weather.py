@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.services import weather
+from app.services.weather import Spot, iter_spot_forecasts, location_key, parse_spots
+
+
+def test_parse_spots_by_name_and_coordinates() -> None:
+    """Споты задаются названием или названием с координатами."""
+    assert parse_spots(" Червлённая ; Залив=48.5, 44.1;;") == [
+        Spot("Червлённая", "Червлённая"),
+        Spot("Залив", (48.5, 44.1)),
+    ]
+
+
+@pytest.mark.parametrize("value", ["Залив=48.5", "Залив=abc,44", "Залив=1,2,3", "Залив=95,44"])
+def test_parse_spots_skips_bad_coordinates(value: str, caplog: pytest.LogCaptureFixture) -> None:
+    """Некорректные координаты не роняют разбор, а попадают в лог."""
+    with caplog.at_level(logging.WARNING):
+        assert parse_spots(f"{value};Пляж") == [Spot("Пляж", "Пляж")]
+    assert "Залив" in caplog.text
+
+
+def test_location_key_merges_close_spots() -> None:
+    """Близкие координаты и одинаковые названия дают один ключ."""
+    assert location_key((48.501, 44.104)) == location_key((48.499, 44.096))
+    assert location_key(" Волгоград ") == location_key("волгоград")
+    assert location_key((48.5, 44.1)) != location_key((48.6, 44.1))
+
+
+async def test_iter_spot_forecasts_shares_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Споты с одним местом делят запрос, а ответы отдаются по мере готовности."""
+    requested = []
+
+    async def get_forecast(location: weather.Location, days: int, units: str) -> str:
+        requested.append(location)
+        await asyncio.sleep(0.02 if location == "Далеко" else 0)
+        return f"прогноз {location}"
+
+    monkeypatch.setattr(weather, "get_forecast", get_forecast)
+    spots = [
+        Spot("Далёкий", "Далеко"),
+        Spot("Пляж", (48.501, 44.1)),
+        Spot("Причал", (48.499, 44.1)),
+    ]
+
+    results = [(spot.name, forecast) async for spot, forecast in iter_spot_forecasts(spots)]
+
+    assert len(requested) == 2
+    assert [name for name, _ in results] == ["Пляж", "Причал", "Далёкий"]
+    assert results[0][1] == results[1][1]
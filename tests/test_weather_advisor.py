@@ -0,0 +1,117 @@
+import asyncio
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from conftest import FakeClock
+
+from app.core import weather_advisor
+from app.core.weather_advisor import encode_forecast
+from app.services.weather import ForecastSlot, render_days_compact, render_forecast
+from app.tools.cache import TTLCache
+from app.tools.limiter import RateLimiter
+from app.tools.resilience import CircuitBreaker
+from app.tools.utils import estimate_tokens
+from benchmarks.fakes import FakeAsyncOpenAI
+
+START = datetime(2024, 6, 1)
+
+
+def make_slots(days: int) -> list[ForecastSlot]:
+    """Создаёт прогноз на days дней по три слота в день."""
+    return [
+        ForecastSlot(START + timedelta(days=day, hours=hour), 20.0 + day, 3.0, 50, "ясно")
+        for day in range(days)
+        for hour in (9, 12, 15)
+    ]
+
+
+def test_forecast_within_budget_keeps_every_slot() -> None:
+    """Прогноз, который влезает в бюджет, кодируется строкой на слот."""
+    text = encode_forecast(make_slots(5), budget=10_000)
+    assert len(text.splitlines()) == 1 + 15
+
+
+def test_forecast_over_budget_is_aggregated_by_day() -> None:
+    """Если таблица по слотам не влезает, остаётся строка на день."""
+    slots = make_slots(5)
+    budget = estimate_tokens(encode_forecast(slots, budget=10_000)) - 1
+
+    text = encode_forecast(slots, budget=budget)
+
+    assert estimate_tokens(text) <= budget
+    assert len(text.splitlines()) == 1 + 5
+    assert text.splitlines()[1].startswith("2024-06-01|09-15|20..20|3|50|ясно")
+
+
+def test_farthest_days_are_dropped_to_fit_budget() -> None:
+    """При тесном бюджете отбрасываются самые дальние дни."""
+    slots = make_slots(5)
+    two_days = render_days_compact(slots[:6])
+
+    text = encode_forecast(slots, budget=estimate_tokens(two_days))
+
+    assert text == two_days
+    assert [row[:10] for row in text.splitlines()[1:]] == ["2024-06-01", "2024-06-02"]
+
+
+def test_verbose_format_when_compact_disabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    """С FORECAST_COMPACT=false используется прежний подробный формат."""
+    monkeypatch.setattr(weather_advisor, "FORECAST_COMPACT", False)
+    slots = make_slots(2)
+    assert encode_forecast(slots, budget=1) == render_forecast(slots)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch: pytest.MonkeyPatch) -> FakeAsyncOpenAI:
+    """Подменяет модель ИИ, лимитер и оба уровня кэша ответов."""
+    client = FakeAsyncOpenAI(latency=0.01, chunk_delay=0.001)
+    monkeypatch.setattr(weather_advisor, "_client", client)
+    monkeypatch.setattr(weather_advisor, "advice_cache", TTLCache(ttl=60))
+    monkeypatch.setattr(weather_advisor, "llm_limiter", RateLimiter("test", rate=1000, burst=100))
+    monkeypatch.setattr(weather_advisor, "get_cached_advice", AsyncMock(return_value=None))
+    monkeypatch.setattr(weather_advisor, "save_cached_advice", AsyncMock())
+    return client
+
+
+async def collect(chunks: AsyncIterator[str]) -> str:
+    """Собирает потоковый ответ целиком."""
+    return "".join([chunk async for chunk in chunks])
+
+
+async def test_concurrent_streams_share_one_completion(fake_llm: FakeAsyncOpenAI) -> None:
+    """Одновременные потоки по одному прогнозу получают ответ одного вызова модели."""
+    texts = await asyncio.gather(
+        *(collect(weather_advisor.ai_generate_stream("прогноз")) for _ in range(10))
+    )
+
+    assert fake_llm.completions.calls == 1
+    assert len(set(texts)) == 1 and texts[0].strip()
+
+
+async def test_late_stream_follower_gets_whole_answer(fake_llm: FakeAsyncOpenAI) -> None:
+    """Присоединившийся позже получает ответ с первого фрагмента."""
+    leader = asyncio.create_task(collect(weather_advisor.ai_generate_stream("прогноз")))
+    await asyncio.sleep(0.02)
+    follower = await collect(weather_advisor.ai_generate_stream("прогноз"))
+
+    assert follower == await leader
+    assert fake_llm.completions.calls == 1
+
+
+async def test_interrupted_stream_releases_breaker_probe(
+    fake_llm: FakeAsyncOpenAI, monkeypatch: pytest.MonkeyPatch, clock: FakeClock
+) -> None:
+    """Прерванный поток освобождает пробный вызов автомата и не кэшируется."""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    monkeypatch.setattr(weather_advisor.llm_policy, "breaker", breaker)
+    breaker.record_failure()
+    clock.now = 10
+
+    chunks = weather_advisor.stream_advice("digest", "прогноз")
+    assert await anext(chunks)
+    await chunks.aclose()
+
+    breaker.allow()
+    weather_advisor.save_cached_advice.assert_not_awaited()
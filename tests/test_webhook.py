@@ -0,0 +1,74 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+from app.core.webhook import BoundedRequestHandler
+
+
+def make_handler(feed: AsyncMock, max_concurrency: int = 1) -> BoundedRequestHandler:
+    """Создаёт обработчик вебхука с подменёнными диспетчером и ботом."""
+    dispatcher = MagicMock()
+    dispatcher.feed_raw_update = feed
+    bot = MagicMock()
+    bot.session.json_loads = json.loads
+    bot.session.json_dumps = json.dumps
+    bot.session.close = AsyncMock()
+    return BoundedRequestHandler(
+        dispatcher, bot, max_concurrency=max_concurrency, shutdown_timeout=1, secret_token="s"
+    )
+
+
+def make_request(update_id: int, secret: str = "s") -> MagicMock:
+    """Создаёт запрос Telegram с апдейтом update_id."""
+    request = MagicMock()
+    request.headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    request.json = AsyncMock(return_value={"update_id": update_id})
+    return request
+
+
+async def test_wrong_secret_is_rejected() -> None:
+    """Запрос с чужим секретом не попадает в диспетчер."""
+    feed = AsyncMock()
+    handler = make_handler(feed)
+
+    response = await handler.handle(make_request(1, secret="x"))
+
+    assert response.status == 401
+    feed.assert_not_awaited()
+
+
+async def test_response_waits_for_free_slot() -> None:
+    """Сверх max_concurrency ответ Telegram задерживается до освобождения места."""
+    release = asyncio.Event()
+
+    async def feed(bot: object, update: dict, **kwargs: object) -> None:
+        await release.wait()
+
+    handler = make_handler(AsyncMock(side_effect=feed))
+    assert (await handler.handle(make_request(1))).status == 200
+
+    second = asyncio.create_task(handler.handle(make_request(2)))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+
+    release.set()
+    assert (await second).status == 200
+    await handler.close()
+
+
+async def test_close_drains_accepted_updates_and_rejects_new() -> None:
+    """При остановке принятые апдейты дорабатываются, а новые получают 503."""
+    processed = []
+
+    async def feed(bot: object, update: dict, **kwargs: object) -> None:
+        await asyncio.sleep(0.01)
+        processed.append(update["update_id"])
+
+    handler = make_handler(AsyncMock(side_effect=feed), max_concurrency=5)
+    for update_id in range(3):
+        await handler.handle(make_request(update_id))
+
+    await handler.close()
+
+    assert sorted(processed) == [0, 1, 2]
+    assert (await handler.handle(make_request(3))).status == 503
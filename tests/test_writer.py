@@ -0,0 +1,52 @@
+from typing import Any
+
+import pytest
+
+from app.data.writer import WriteBehindQueue
+
+BAD_USER_ID = 2**31
+
+
+def make_batch(*user_ids: int) -> list[tuple[str, dict[str, Any]]]:
+    """Собирает пакет записей истории для указанных пользователей."""
+    return [("weather_request", {"user_id": user_id}) for user_id in user_ids]
+
+
+@pytest.fixture
+def written(monkeypatch: pytest.MonkeyPatch) -> tuple[WriteBehindQueue, list[int]]:
+    """Очередь, запись которой падает на пакетах с BAD_USER_ID, и список записанных id."""
+    queue = WriteBehindQueue()
+    saved: list[int] = []
+
+    async def write(batch: list[tuple[str, dict[str, Any]]]) -> None:
+        ids = [row["user_id"] for _, row in batch]
+        if BAD_USER_ID in ids:
+            raise OverflowError("value out of int32 range")
+        saved.extend(ids)
+
+    monkeypatch.setattr(queue, "_write", write)
+    return queue, saved
+
+
+async def test_bad_row_does_not_drop_batch(
+    written: tuple[WriteBehindQueue, list[int]], caplog: pytest.LogCaptureFixture
+) -> None:
+    """Строка с ошибкой пропускается, а остальные строки пакета записываются."""
+    queue, saved = written
+    await queue._flush(make_batch(1, 2, BAD_USER_ID, 4, 5))
+
+    assert sorted(saved) == [1, 2, 4, 5]
+    failed = [record for record in caplog.records if record.levelname == "ERROR"]
+    assert len(failed) == 1
+    assert str(BAD_USER_ID) in failed[0].getMessage()
+
+
+async def test_healthy_batch_is_written_once(
+    written: tuple[WriteBehindQueue, list[int]], caplog: pytest.LogCaptureFixture
+) -> None:
+    """Исправный пакет записывается целиком без дробления."""
+    queue, saved = written
+    await queue._flush(make_batch(1, 2, 3))
+
+    assert saved == [1, 2, 3]
+    assert not caplog.records